@@ -0,0 +1,149 @@
+"""
+Тесты HTTP-поиска (_VKHttpSearchClient) на локальном стенде http.server,
+который отдаёт записанные ответы al_audio.php (section / load_section).
+"""
+import json
+import os
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import vk_engine  # noqa: E402
+from vk_engine import _VKChallenge, _VKHttpSearchClient  # noqa: E402
+
+
+def _audio(n: int) -> list:
+    """Элемент playlist.list, как его отдаёт ВК: id, владелец, ссылка, название, артист, длительность."""
+    return [456239000 + n, -2001, "", f"Песня &amp; {n}", "<em>Кино</em>", 180 + n]
+
+
+def _playlist(first: int, last: int, has_more: bool, next_offset: int | None = None) -> dict:
+    return {
+        "id": -1,
+        "ownerId": 1,
+        "type": "search",
+        "accessHash": "f00d",
+        "hasMore": has_more,
+        "nextOffset": next_offset,
+        "list": [_audio(n) for n in range(first, last)],
+    }
+
+
+# Записанные ответы: поиск «кино» — 10 треков в section и ещё две страницы
+RECORDED = {
+    ("section", None): {"payload": [0, [
+        "<div class=\"audio_page_block\">поиск</div>",
+        {"playlists": [_playlist(0, 10, True, 10)]},
+    ]]},
+    ("load_section", "10"): {"payload": [0, [_playlist(10, 20, True, 20)]]},
+    ("load_section", "20"): {"payload": [0, [_playlist(20, 25, False)]]},
+}
+
+# Ответы-проверки: q запроса → (код HTTP, заголовки, тело)
+CHALLENGES = {
+    "redirect": (302, {"Location": "https://vk.com/challenge.html?hash=1"}, ""),
+    "captcha": (200, {}, "<!--" + json.dumps({"payload": ["2", [{"captcha_sid": "81", "captcha_img": "x"}]]})),
+    "html": (200, {"Content-Type": "text/html"}, "<html><body>Подтвердите, что вы не робот</body></html>"),
+    "code": (200, {}, json.dumps({"payload": ["3", []]})),
+}
+
+
+class _FakeVK(BaseHTTPRequestHandler):
+    requests: list = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        form = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode()).items()}
+        act = parse_qs(urlparse(self.path).query).get("act", [""])[0]
+        type(self).requests.append((act, form, self.headers.get("Cookie", "")))
+
+        if form.get("q") in CHALLENGES:
+            status, headers, body = CHALLENGES[form["q"]]
+        else:
+            key = (act, form.get("offset") if act == "load_section" else None)
+            status, headers, body = 200, {}, json.dumps(RECORDED[key])
+
+        data = body.encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@unittest.skipUnless(vk_engine.REQUESTS_AVAILABLE, "нужен requests")
+class HttpSearchClientTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        vk_engine.setup_logging("OFF")
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeVK)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        _FakeVK.requests = []
+        # Домен стенда вместо .vk.com — иначе cookies на него не уйдут
+        cookies = [{"name": "remixsid", "value": "s1", "domain": "127.0.0.1", "path": "/"}]
+        self.client = _VKHttpSearchClient(cookies, user_id=1, base_url=self.base_url)
+
+    def test_paginates_until_has_more_is_false(self):
+        tracks = self.client.search("кино", 0)
+
+        self.assertEqual(len(tracks), 25)
+        self.assertEqual(tracks[0], ("Кино", "Песня & 0", "3:00", tracks[0].owner, "", "-2001_456239000"))
+        self.assertEqual(tracks[-1].full_id, "-2001_456239024")
+        acts = [(act, form.get("offset")) for act, form, _ in _FakeVK.requests]
+        self.assertEqual(acts, [("section", None), ("load_section", "10"), ("load_section", "20")])
+        load = _FakeVK.requests[1][1]
+        self.assertEqual((load["playlist_id"], load["access_hash"], load["type"]), ("-1", "f00d", "search"))
+
+    def test_stops_at_limit(self):
+        tracks = self.client.search("кино", 12)
+
+        self.assertEqual([t.full_id for t in tracks],
+                         [f"-2001_{456239000 + n}" for n in range(12)])
+        self.assertEqual([act for act, _, _ in _FakeVK.requests], ["section", "load_section"])
+
+    def test_limit_within_first_page(self):
+        self.assertEqual(len(self.client.search("кино", 5)), 5)
+        self.assertEqual(len(_FakeVK.requests), 1)
+
+    def test_challenges_fall_back_to_browser(self):
+        for query in CHALLENGES:
+            with self.subTest(query=query):
+                with self.assertRaises(_VKChallenge):
+                    self.client._post("section", {"act": "section", "q": query})
+                # search() не бросает, а возвращает None — движок уходит в браузер
+                self.assertIsNone(self.client.search(query, 10))
+
+    def test_sends_session_cookies(self):
+        self.client.search("кино", 5)
+        self.assertIn("remixsid=s1", _FakeVK.requests[0][2])
+
+    def test_keeps_cookie_domain(self):
+        client = _VKHttpSearchClient(
+            [{"name": "remixsid", "value": "s1", "domain": ".vk.com", "path": "/"}],
+            user_id=1, base_url=self.base_url,
+        )
+        self.assertEqual([c.domain for c in client.session.cookies], [".vk.com"])
+        client.search("кино", 5)
+        # Cookie сессии ВК не уходит на посторонний хост
+        self.assertEqual(_FakeVK.requests[0][2], "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,545 @@
+# VKSearch — замеры производительности
+#
+# Запуск:
+#   python vk_bench.py              — разбор data-audio: быстрый путь против BeautifulSoup
+#   python vk_bench.py --rows 500   — только страница на 500 строк
+#   python vk_bench.py --imports    — время импорта модулей (python -X importtime)
+#   python vk_bench.py --suite      — набор замеров горячих путей со сравнением
+#                                     с bench_baseline.json (--save — записать его)
+#
+
+import argparse
+import base64
+import gc
+import glob
+import html
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import vk_engine
+
+VKEngine = vk_engine.VKEngine
+
+
+# ------------------------------------------------------
+# СИНТЕТИЧЕСКИЕ СТРАНИЦЫ
+# ------------------------------------------------------
+_ROW_TEMPLATE = (
+    '<div class="audio_row audio_row_with_cover _audio_row _audio_row_{owner}_{aid} '
+    'audio_can_add audio_has_thumb{claimed}" data-full-id="{owner}_{aid}" '
+    'onclick="return getAudioPlayer().toggleAudio(this, event)" data-audio="{data}" '
+    'data-is-current="0">'
+    '<div class="audio_row_content _audio_row_content">'
+    '<button class="blind_label _audio_row__play_btn" aria-label="Воспроизвести">'
+    '</button>'
+    '<div class="audio_row__cover" style="background-image:url(https://sun9-1.userapi.com/'
+    'c{aid}/cover.jpg)"></div><div class="audio_row__cover_back _audio_row__cover_back">'
+    '</div><div class="audio_row__cover_icon _audio_row__cover_icon"></div>'
+    '<div class="audio_row__inner"><div class="audio_row__performer_title">'
+    '<div class="audio_row__performers"><a href="/audio?performer=1&amp;q={artist_q}">'
+    '{artist}</a></div><div class="audio_row__title _audio_row__title" '
+    'onmouseover="setTitle(this)"><span class="audio_row__title_inner _audio_row__title_inner">'
+    '{title}</span><span class="audio_row__title_inner_subtitle"></span></div></div>'
+    '<div class="audio_row__info _audio_row__info"><div class="audio_row__duration '
+    'audio_row__duration-s _audio_row__duration">{dur}</div></div></div>'
+    '<div class="audio_player__place _audio_player__place"></div></div></div>'
+)
+
+_WORDS = [
+    "Кино", "Звезда", "по", "имени", "Солнце", "Группа", "крови", "Ночь",
+    "Summer", "Love", "Night", "City", "Lights", "Dance", "Rock", "&", "feat.",
+]
+
+
+def make_row(rnd: random.Random, idx: int, owner: int = -2000001) -> str:
+    aid = 456239000 + idx
+    artist = " ".join(rnd.choice(_WORDS) for _ in range(rnd.randint(1, 3)))
+    title = " ".join(rnd.choice(_WORDS) for _ in range(rnd.randint(1, 5)))
+    if idx % 7 == 0:
+        title = f"{title} <em>(Remix)</em>"
+    dur = rnd.randint(90, 420)
+    data = [
+        aid, owner, "", html.escape(title, quote=False), html.escape(artist, quote=False),
+        dur, 0, 0, "", 0, 2, "", "[]",
+        "cf8d/5ed2//6ed1/////2d04", "", {"duration": dur, "content_id": f"{owner}_{aid}"},
+    ]
+    return _ROW_TEMPLATE.format(
+        owner=owner, aid=aid,
+        claimed=" audio_claimed" if idx % 50 == 49 else "",
+        data=html.escape(json.dumps(data, ensure_ascii=False), quote=True),
+        artist=html.escape(artist), artist_q=html.escape(artist),
+        title=html.escape(title), dur=f"{dur // 60}:{dur % 60:02d}",
+    )
+
+
+def make_page(rows: int, seed: int = 1) -> str:
+    """Страница старого интерфейса: шапка, rows строк audio_row, подвал со скриптами."""
+    rnd = random.Random(seed)
+    head = (
+        '<!DOCTYPE html><html><head><title>Музыка</title>'
+        + "".join(f'<script src="/js/cmodules/web/module{i}.js"></script>' for i in range(40))
+        + '</head><body><div id="page_layout"><div id="side_bar">'
+        + '<nav class="left_menu_nav_wrap">' + '<a class="left_row">Пункт</a>' * 30
+        + '</nav></div><div id="page_body"><div class="audio_page__audio_rows_list _audio_page__audio_rows_list">'
+    )
+    body = "".join(make_row(rnd, i) for i in range(rows))
+    foot = (
+        '</div></div></div><script>var cur = {"oid": 1, "module": "audio"};'
+        + "window.__data = " + json.dumps({"x": list(range(2000))}) + ';</script></body></html>'
+    )
+    return head + body + foot
+
+
+def make_js_payload(rows: int, seed: int = 1) -> str:
+    """
+    Ответ _JS_EXTRACT_TRACKS нового интерфейса: JSON-список словарей.
+    Как на живой странице — немного повторов и строк без названия.
+    """
+    rnd = random.Random(seed)
+    items = []
+    for idx in range(rows):
+        aid = 456239000 + (idx - 1 if idx % 40 == 39 else idx)
+        dur = rnd.randint(90, 420)
+        items.append({
+            "full_id": f" {-2000001 - idx % 3}_{aid} ",
+            "title": "" if idx % 97 == 96 else " ".join(rnd.choice(_WORDS) for _ in range(rnd.randint(1, 5))),
+            "artist": " ".join(rnd.choice(_WORDS) for _ in range(rnd.randint(1, 3))),
+            "duration": f"{dur // 60}:{dur % 60:02d}",
+        })
+    return json.dumps(items, ensure_ascii=False)
+
+
+def make_extra_url(rnd: random.Random, idx: int) -> tuple[str, str]:
+    """
+    Ссылка audio_api_unavailable.mp3?extra=... и то, во что она должна
+    раскодироваться. Операции i/s/r строятся от ответа назад, так что
+    _decode_vk_audio_url обязан вернуть ровно его.
+    """
+    real = (
+        f"https://cs{rnd.randint(1, 999)}.vkuseraudio.net/s/v1/ac/"
+        + "".join(rnd.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(48))
+        + f"/index.m3u8?siren=1&id={idx}"
+    )
+    scrambled = real
+    ops = []
+    for _ in range(rnd.randint(2, 8)):
+        kind = rnd.choice("iisr")
+        if kind == "i":
+            pos = rnd.randrange(len(scrambled))
+            ops.append(f"i({pos},{ord(scrambled[pos])})")
+            scrambled = scrambled[:pos] + scrambled[pos + 1:]
+        elif kind == "s":
+            a, b = rnd.randrange(len(scrambled)), rnd.randrange(len(scrambled))
+            ops.append(f"s({a},{b})")
+            chars = list(scrambled)
+            chars[a], chars[b] = chars[b], chars[a]
+            scrambled = "".join(chars)
+        else:
+            ops.append("r")
+            scrambled = scrambled[::-1]
+    payload = "\t".join([scrambled] + ops[::-1]).encode("utf-8")
+    extra = base64.b64encode(payload).decode("ascii").replace("+", "-").replace("/", "_").rstrip("=")
+    return f"https://vk.com/mp3/audio_api_unavailable.mp3?extra={extra}#AQ", real
+
+
+def make_extra_urls(count: int, seed: int = 1) -> list[tuple[str, str]]:
+    rnd = random.Random(seed)
+    return [make_extra_url(rnd, idx) for idx in range(count)]
+
+
+# ------------------------------------------------------
+# ЗАМЕРЫ
+# ------------------------------------------------------
+def _best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench_parse(row_counts: list[int], repeat: int = 3):
+    print(f"{'строк':>6} {'размер':>9} {'bs4, мс':>10} {'fast, мс':>10} {'ускорение':>10}")
+    for rows in row_counts:
+        page = make_page(rows)
+        fast = VKEngine._parse_search_results_fast(page, None)
+        slow = VKEngine._parse_search_results_bs4(page, None)
+        if fast != slow:
+            raise SystemExit(f"результаты разошлись на {rows} строках: {len(fast)} против {len(slow)}")
+
+        t_fast = _best_of(lambda: VKEngine._parse_search_results_fast(page, None), repeat)
+        t_slow = _best_of(lambda: VKEngine._parse_search_results_bs4(page, None), repeat)
+        print(
+            f"{rows:>6} {len(page) / 1024 / 1024:>7.2f}МБ {t_slow * 1000:>10.1f} "
+            f"{t_fast * 1000:>10.1f} {t_slow / t_fast:>9.1f}x"
+        )
+
+
+# Тяжёлые зависимости: после импорта модулей VKSearch их быть не должно
+_HEAVY_MODULES = ("selenium", "webdriver_manager", "bs4", "requests", "yt_dlp", "asyncio")
+
+
+def _import_times(module: str) -> dict[str, int]:
+    """
+    Импорт module в новом процессе под python -X importtime.
+    Возвращает {модуль: накопленное время, мкс} для всех импортированных модулей.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"import {module} не удался:\n{proc.stderr[-2000:]}")
+    times = {}
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        times[parts[2].strip()] = int(parts[1])
+    return times
+
+
+def bench_imports(modules: list[str], repeat: int = 3):
+    print(f"{'модуль':<10} {'импорт, мс':>11}  тяжёлые зависимости")
+    for module in modules:
+        runs = [_import_times(module) for _ in range(repeat)]
+        best = min(run[module] for run in runs)
+        heavy = sorted({m.split(".")[0] for m in runs[0]} & set(_HEAVY_MODULES))
+        print(f"{module:<10} {best / 1000:>11.1f}  {', '.join(heavy) or '—'}")
+
+
+# ------------------------------------------------------
+# НАБОР ЗАМЕРОВ (--suite)
+# ------------------------------------------------------
+# Горячие пути без сети и браузера: разбор страниц старого интерфейса,
+# обработка ответа _JS_EXTRACT_TRACKS, расшифровка extra=, сортировка и
+# фильтр таблицы. Корпуса — синтетические (SUITE_SIZES строк) и записанные:
+# файлы из --fixtures (*.html — страница, *.json — ответ _JS_EXTRACT_TRACKS,
+# *.txt — ссылки extra= по строке).
+SUITE_SIZES = (50, 500, 5000)
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_fixtures")
+# Насколько хуже базы (по времени и по пику памяти) — уже регрессия. На
+# общих и виртуальных машинах время плавает на десятки процентов даже с
+# поправкой на эталон, поэтому порог с запасом; на тихой машине — --threshold 0.2
+REGRESSION_THRESHOLD = 0.5
+# Замер повторяется, пока один прогон не займёт хотя бы столько
+_MIN_RUN_SEC = 0.1
+# BeautifulSoup — запасной путь и в десятки раз медленнее: на больших
+# страницах его результат только сверяется с быстрым разбором
+_BS4_MAX_ROWS = 500
+
+
+class _Case:
+    """Один замер: fn() обрабатывает rows строк; check() — что результат верный."""
+
+    def __init__(self, name: str, rows: int, fn, check=None):
+        self.name = name
+        self.rows = rows
+        self.fn = fn
+        self.check = check
+
+
+def _extract_stub(payload: str):
+    """Объект с driver, у которого execute_script отдаёт записанный ответ JS."""
+    driver = SimpleNamespace(execute_script=lambda script, *args: payload)
+    return SimpleNamespace(driver=driver, _JS_EXTRACT_TRACKS=VKEngine._JS_EXTRACT_TRACKS)
+
+
+def _decode_all(urls: list[str]) -> list[str]:
+    decode = VKEngine._decode_vk_audio_url
+    return [decode(url) for url in urls]
+
+
+def _page_cases(label: str, page: str) -> list[_Case]:
+    rows = page.count("data-audio=")
+    has_bs4 = vk_engine._module_available("bs4")
+    cases = [_Case(
+        f"parse.fast[{label}]", rows,
+        lambda: VKEngine._parse_search_results_fast(page, None),
+        (lambda result: result == VKEngine._parse_search_results_bs4(page, None)) if has_bs4 else None,
+    )]
+    if has_bs4 and rows <= _BS4_MAX_ROWS:
+        cases.append(_Case(f"parse.bs4[{label}]", rows,
+                           lambda: VKEngine._parse_search_results_bs4(page, None)))
+    return cases
+
+
+def _extract_case(label: str, payload: str) -> _Case:
+    stub = _extract_stub(payload)
+    return _Case(
+        f"extract.js[{label}]", len(json.loads(payload)),
+        lambda: VKEngine._extract_tracks_via_js(stub),
+    )
+
+
+def _decode_case(label: str, pairs: list[tuple[str, str | None]]) -> _Case:
+    urls = [url for url, _ in pairs]
+    expected = [real for _, real in pairs]
+
+    def check(result):
+        return all(real is None or got == real for got, real in zip(result, expected))
+
+    return _Case(f"decode.extra[{label}]", len(urls), lambda: _decode_all(urls), check)
+
+
+def _table_cases(label: str, tracks: list) -> list[_Case]:
+    """Сортировка и фильтр таблицы окна (нужен PyQt5, QApplication — нет)."""
+    try:
+        from PyQt5.QtCore import Qt
+        import vk_search
+    except ImportError:
+        return []
+    model = vk_search._TrackTableModel()
+    model.append(tracks)
+    proxy = vk_search._TrackProxyModel()
+    proxy.setSourceModel(model)
+    spec = [(0, Qt.AscendingOrder), (1, Qt.DescendingOrder)]
+    return [
+        _Case(f"table.sort[{label}]", model.rowCount(), lambda: proxy.set_sort(spec)),
+        _Case(f"table.filter[{label}]", model.rowCount(),
+              lambda: model.filter_rows("кино ночь")),
+    ]
+
+
+def suite_cases(sizes, fixtures_dir: str | None) -> list[_Case]:
+    cases = []
+    for rows in sizes:
+        page = make_page(rows)
+        cases += _page_cases(str(rows), page)
+        cases.append(_extract_case(str(rows), make_js_payload(rows)))
+        cases.append(_decode_case(str(rows), make_extra_urls(rows)))
+        cases += _table_cases(str(rows), VKEngine._parse_search_results_fast(page, None))
+
+    if fixtures_dir and os.path.isdir(fixtures_dir):
+        for path in sorted(glob.glob(os.path.join(fixtures_dir, "*"))):
+            label = os.path.basename(path)
+            with open(path, encoding="utf-8") as f:
+                data = f.read()
+            if path.endswith(".html"):
+                cases += _page_cases(label, data)
+            elif path.endswith(".json"):
+                cases.append(_extract_case(label, data))
+            elif path.endswith(".txt"):
+                urls = [line.strip() for line in data.splitlines() if line.strip()]
+                cases.append(_decode_case(label, [(url, None) for url in urls]))
+    return cases
+
+
+def _measure(case: _Case, repeat: int) -> dict:
+    """Лучшее время одного вызова (с автоподбором числа вызовов) и пик памяти."""
+    result = case.fn()
+    if case.check is not None and not case.check(result):
+        raise SystemExit(f"{case.name}: результат не совпал с эталоном")
+
+    # Как timeit: сборщик мусора выключен, иначе время зависит от того,
+    # сколько объектов уже создали предыдущие замеры
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        best = _best_per_call(case.fn, repeat)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    # Память — отдельным прогоном: tracemalloc заметно замедляет код
+    tracemalloc.start()
+    try:
+        case.fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"rows": case.rows, "ms": round(best * 1000, 4), "peak_kb": round(peak / 1024, 1)}
+
+
+def _best_per_call(fn, repeat: int) -> float:
+    """Лучшее время одного вызова; вызовов в прогоне столько, чтобы он занял _MIN_RUN_SEC."""
+    loops = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= _MIN_RUN_SEC or loops >= 10000:
+            break
+        loops *= 10 if elapsed < _MIN_RUN_SEC / 10 else 2
+    best = elapsed / loops
+    for _ in range(repeat - 1):
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        best = min(best, (time.perf_counter() - t0) / loops)
+    return best
+
+
+def _calibration_ms(repeat: int = 5) -> float:
+    """
+    Время эталонной нагрузки (разбор JSON, строки, сортировка) на этой машине.
+    Время к базе сравнивается с поправкой на него, поэтому базу, записанную
+    на другой машине или под другой нагрузкой, тоже можно использовать.
+    """
+    rnd = random.Random(7)
+    doc = json.dumps([[rnd.random(), " ".join(rnd.choice(_WORDS) for _ in range(4))] for _ in range(2000)],
+                     ensure_ascii=False)
+
+    def workload():
+        rows = json.loads(doc)
+        rows.sort(key=lambda row: row[1].casefold())
+        return sum(len(row[1].split()) for row in rows)
+
+    gc.disable()
+    try:
+        return _best_per_call(workload, repeat) * 1000
+    finally:
+        gc.enable()
+
+
+def _scaling(results: dict[str, dict]) -> list[str]:
+    """
+    Кривые масштабирования по синтетическим размерам: показатель k в t ~ n^k
+    между соседними размерами (1 — линейно, 2 — квадратично).
+    """
+    families: dict[str, list[tuple[int, float]]] = {}
+    for name, res in results.items():
+        family, _, label = name.partition("[")
+        if label.rstrip("]").isdigit() and res["rows"]:
+            families.setdefault(family, []).append((res["rows"], res["ms"]))
+    lines = []
+    for family, points in families.items():
+        points.sort()
+        steps = []
+        for (n1, t1), (n2, t2) in zip(points, points[1:]):
+            if n2 > n1 and t1 > 0 and t2 > 0:
+                steps.append(f"{n1}→{n2}: k={math.log(t2 / t1) / math.log(n2 / n1):.2f}")
+        per_row = ", ".join(f"{n}: {t * 1000 / n:.2f}" for n, t in points)
+        lines.append(f"{family:<14} мкс/строку {per_row}" + (f"; {'; '.join(steps)}" if steps else ""))
+    return lines
+
+
+def _compare(results: dict[str, dict], baseline: dict, threshold: float, speed: float) -> list[str]:
+    """
+    Регрессии относительно сохранённого замера: время (с поправкой speed —
+    во сколько раз эта машина сейчас медленнее записавшей базу) или пик
+    памяти выше порога.
+    """
+    regressions = []
+    for name, res in results.items():
+        base = baseline.get("cases", {}).get(name)
+        if not base:
+            continue
+        for key, unit, scale in (("ms", "мс", speed), ("peak_kb", "КБ", 1.0)):
+            expected = base[key] * scale
+            if expected > 0 and res[key] > expected * (1 + threshold):
+                regressions.append(
+                    f"{name}: {key} {expected:.4g} → {res[key]} {unit} "
+                    f"(+{(res[key] / expected - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def bench_suite(sizes, repeat: int, baseline_path: str, save: bool, threshold: float,
+                fixtures_dir: str | None, only: str | None = None) -> int:
+    """Весь набор; код выхода 1 — есть регрессии относительно baseline_path."""
+    baseline = {}
+    if not save and os.path.isfile(baseline_path):
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    calibration = _calibration_ms()
+    base_calibration = baseline.get("calibration_ms")
+
+    results = {}
+    print(f"{'замер':<26} {'строк':>6} {'мс':>10} {'опер/с':>10} {'мкс/строку':>11} "
+          f"{'пик, КБ':>9} {'к базе':>8}")
+    for case in suite_cases(sizes, fixtures_dir):
+        if only and only not in case.name:
+            continue
+        # Эталон перемеряется между замерами и берётся лучший: скорость
+        # машины под нагрузкой плавает, а время замеров — тоже лучшее
+        calibration = min(calibration, _calibration_ms(1))
+        res = _measure(case, repeat)
+        results[case.name] = res
+        base = baseline.get("cases", {}).get(case.name)
+        speed = calibration / base_calibration if base_calibration else 1.0
+        delta = f"{(res['ms'] / (base['ms'] * speed) - 1) * 100:+.0f}%" if base and base["ms"] else "—"
+        per_row = f"{res['ms'] * 1000 / res['rows']:.2f}" if res["rows"] else "—"
+        print(f"{case.name:<26} {res['rows']:>6} {res['ms']:>10.3f} {1000 / res['ms']:>10.1f} "
+              f"{per_row:>11} {res['peak_kb']:>9.1f} {delta:>8}")
+
+    print()
+    for line in _scaling(results):
+        print(line)
+
+    if save:
+        document = {
+            "python": platform.python_version(),
+            "machine": f"{platform.system()} {platform.machine()}",
+            "saved": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "calibration_ms": round(calibration, 4),
+            "cases": results,
+        }
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(document, f, ensure_ascii=False, indent=1)
+            f.write("\n")
+        print(f"\nбаза сохранена в {baseline_path}")
+        return 0
+    if not baseline:
+        print(f"\nбазы нет ({baseline_path}) — сохранить: --save")
+        return 0
+
+    speed = calibration / base_calibration if base_calibration else 1.0
+    regressions = _compare(results, baseline, threshold, speed)
+    print(f"\nбаза: {baseline_path} ({baseline.get('saved', '?')}, python {baseline.get('python', '?')}), "
+          f"порог +{threshold * 100:.0f}%, машина сейчас x{speed:.2f} к базе")
+    for line in regressions:
+        print(f"РЕГРЕССИЯ {line}")
+    if not regressions:
+        print("регрессий нет")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры VKSearch")
+    parser.add_argument("--rows", type=int, nargs="*", default=[50, 500, 2000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--imports", action="store_true",
+                        help="время импорта vk_engine, vk_search и vk_cli")
+    parser.add_argument("--suite", action="store_true",
+                        help="набор замеров горячих путей со сравнением с базой")
+    parser.add_argument("--sizes", type=int, nargs="*", default=list(SUITE_SIZES),
+                        help="размеры синтетических корпусов для --suite")
+    parser.add_argument("--only", help="--suite: только замеры, в имени которых есть эта строка")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR,
+                        help="каталог записанных корпусов (*.html, *.json, *.txt)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="файл базы для --suite")
+    parser.add_argument("--save", action="store_true", help="--suite: записать результат как базу")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="допустимое ухудшение к базе (0.5 — на 50%%)")
+    args = parser.parse_args()
+
+    if args.imports:
+        bench_imports(["vk_engine", "vk_search", "vk_cli"], args.repeat)
+        return
+
+    # Отладочные сообщения парсера не нужны в замерах
+    vk_engine.setup_logging("OFF")
+    if args.suite:
+        sys.exit(bench_suite(args.sizes, args.repeat, args.baseline, args.save,
+                             args.threshold, args.fixtures, args.only))
+    bench_parse(args.rows, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
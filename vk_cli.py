@@ -0,0 +1,366 @@
+# VKSearch — командная строка (без окна)
+#
+# Запуск:
+#   python vk_cli.py search "кино группа крови" -n 50
+#   python vk_cli.py search -i queries.txt -b 3 > tracks.jsonl
+#   python vk_cli.py playlist https://vk.com/music/playlist/-2000001_1 -n 0
+#   python vk_cli.py profile durov club1
+#   python vk_cli.py download -d music tracks.jsonl
+#   python vk_cli.py search "кино" | python vk_cli.py download -d music
+#
+# Работает на vk_engine.VKEngine, PyQt5 не нужен: браузеры запускаются без
+# окна с сессией, которую сохраняет python vk_search.py после входа.
+# Треки — в stdout (JSON lines, json или tsv), лог и итоговая сводка — в stderr.
+#
+# Коды выхода: 0 — всё успешно, 1 — часть строк/треков без результата,
+# 2 — неверные аргументы, 3 — нет сессии ВК / ни один браузер не вошёл,
+# 130 — прервано.
+#
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+# Сообщения при импорте (нет yt-dlp и т.п.) не должны попасть в вывод треков
+with contextlib.redirect_stdout(sys.stderr):
+    import vk_engine
+
+VKEngine = vk_engine.VKEngine
+Track = vk_engine.Track
+# Как и в движке — импортируется при первом использовании
+asyncio = vk_engine.asyncio
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_NO_SESSION = 3
+EXIT_INTERRUPTED = 130
+
+
+# ------------------------------------------------------
+# ВЫВОД
+# ------------------------------------------------------
+def _setup_logging(verbosity: int, log_file: str | None = None):
+    """
+    -q — ничего, по умолчанию — WARNING/ERROR, -v — весь лог; всё в stderr.
+    --log-file — тот же лог ещё и в файл с ротацией по размеру.
+    """
+    level = {-1: "OFF", 0: "WARNING"}.get(verbosity, "DEBUG")
+    vk_engine.setup_logging(level, stream=sys.stderr, log_file=log_file)
+
+
+class _Output:
+    """
+    Потоковый вывод записей: jsonl и tsv пишутся по мере готовности
+    (сразу можно передать дальше по конвейеру), json — одним документом в конце.
+    """
+
+    def __init__(self, fmt: str, path: str | None, tsv_fields: tuple):
+        self.fmt = fmt
+        self.tsv_fields = tsv_fields
+        self.stream = open(path, "w", encoding="utf-8") if path else sys.stdout
+        self.records: list[dict] = []
+
+    def write(self, record: dict):
+        if self.fmt == "json":
+            self.records.append(record)
+            return
+        if self.fmt == "tsv":
+            line = "\t".join(
+                str(record.get(k) if record.get(k) is not None else "").replace("\t", " ")
+                for k in self.tsv_fields
+            )
+        else:
+            line = json.dumps(record, ensure_ascii=False)
+        self.stream.write(line + "\n")
+        self.stream.flush()
+
+    def close(self, document: dict | None = None):
+        if self.fmt == "json":
+            json.dump(document if document is not None else self.records,
+                      self.stream, ensure_ascii=False, indent=1)
+            self.stream.write("\n")
+        self.stream.flush()
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+
+def _print_summary(kind: str, stats: dict):
+    """Итог одной строкой JSON в stderr — для cron и логов."""
+    vk_engine.flush_logging()
+    print(json.dumps({"summary": kind, **stats}, ensure_ascii=False), file=sys.stderr, flush=True)
+
+
+def _read_lines(values: list[str], input_path: str | None) -> list[str]:
+    """Аргументы + строки файла (-i, "-" — stdin); пустые, # и повторы отбрасываются."""
+    lines = list(values)
+    if input_path:
+        f = sys.stdin if input_path == "-" else open(input_path, "r", encoding="utf-8-sig")
+        with f:
+            lines.extend(line.strip() for line in f)
+    return list(dict.fromkeys(line for line in lines if line and not line.startswith("#")))
+
+
+# ------------------------------------------------------
+# СОБЫТИЯ ДВИЖКА
+# ------------------------------------------------------
+async def _drive(engine, job, on_event):
+    """
+    Выполняет корутину движка job, по ходу передавая его события
+    (engine.events()) в on_event. Возвращает результат job.
+    """
+    with engine.events() as events:
+        task = asyncio.ensure_future(job)
+        while not task.done():
+            waiter = asyncio.ensure_future(events.__anext__())
+            await asyncio.wait({task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            if waiter.done():
+                on_event(waiter.result())
+            else:
+                waiter.cancel()
+        # События, отправленные потоками движка перед самым концом job
+        await asyncio.sleep(0)
+        while (event := events.get_nowait()) is not None:
+            on_event(event)
+    return task.result()
+
+
+# ------------------------------------------------------
+# SEARCH / PLAYLIST / PROFILE
+# ------------------------------------------------------
+async def cmd_collect(engine, args, kind: str | None) -> int:
+    lines = _read_lines(args.items, args.input)
+    if not lines:
+        print("нет запросов: укажите их аргументами или через -i", file=sys.stderr)
+        return EXIT_USAGE
+
+    out = _Output(args.format, args.output,
+                  ("artist", "title", "duration_str", "owner", "full_id", "url"))
+    seen: set[str] = set()
+
+    def on_event(event):
+        if event["type"] != "item":
+            return
+        report = event["report"]
+        for row in report["tracks"]:
+            t = Track.from_row(row)
+            # Один трек из нескольких строк выводится один раз (как в таблице окна)
+            if t.full_id in seen:
+                continue
+            seen.add(t.full_id)
+            out.write({
+                "artist": t.artist, "title": t.title, "duration": t.duration,
+                "duration_str": t.duration_str, "owner": t.owner, "url": t.url,
+                "full_id": t.full_id, "page": report["url"], "line": report["line"],
+            })
+
+    batch = await _drive(engine, engine.search_many(
+        lines, args.count, kind=kind, browsers=args.browsers, http_workers=args.jobs
+    ), on_event)
+    stats = batch["stats"]
+    out.close({"stats": stats, "items": batch["items"]})
+    _print_summary(args.command, stats)
+
+    if batch["orphaned"]:
+        return EXIT_NO_SESSION
+    return EXIT_FAILED if stats["failed"] else EXIT_OK
+
+
+# ------------------------------------------------------
+# DOWNLOAD
+# ------------------------------------------------------
+def _read_track_records(paths: list[str]) -> list[dict]:
+    """
+    Треки из вывода search/playlist/profile: JSON lines или документ -f json
+    ({"stats", "items"}: у трека нет поля page — берётся url строки).
+    """
+    records = []
+    for path in paths or ["-"]:
+        if path == "-":
+            text = sys.stdin.read()
+        else:
+            with open(path, "r", encoding="utf-8-sig") as f:
+                text = f.read()
+        try:
+            doc = json.loads(text)
+        except ValueError:
+            doc = None
+        if isinstance(doc, dict) and "items" in doc:
+            for item in doc["items"]:
+                for row in item.get("tracks") or []:
+                    t = Track.from_row(row)
+                    records.append({"artist": t.artist, "title": t.title, "url": t.url,
+                                    "full_id": t.full_id, "page": item.get("url")})
+            continue
+        for n, line in enumerate(text.splitlines(), 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                vk_engine.log_message(f"WARNING: {path}:{n}: не JSON, строка пропущена")
+                continue
+            if isinstance(rec, dict) and rec.get("full_id"):
+                records.append(rec)
+    unique: dict[str, dict] = {}
+    for rec in records:
+        unique.setdefault(rec["full_id"], rec)
+    return list(unique.values())
+
+
+async def cmd_download(engine, args) -> int:
+    records = _read_track_records(args.files)
+    if not records:
+        print("нет треков: передайте вывод search/playlist/profile", file=sys.stderr)
+        return EXIT_USAGE
+    os.makedirs(args.dir, exist_ok=True)
+
+    # Треки одной страницы подряд — браузер открывает её один раз
+    page_order: dict[str, int] = {}
+    records.sort(key=lambda rec: page_order.setdefault(rec.get("page") or "", len(page_order)))
+    by_id = {rec["full_id"]: rec for rec in records}
+    tracks = [
+        Track(rec.get("artist") or "", rec.get("title") or "", rec.get("duration") or 0,
+              rec.get("owner") or "", rec.get("url") or "", rec["full_id"])
+        for rec in records
+    ]
+    pages = {rec["full_id"]: rec["page"] for rec in records if rec.get("page")}
+
+    out = _Output(args.format, args.output, ("status", "path", "full_id", "via"))
+    results = []
+    browsers_ready = 0
+    t_start = time.perf_counter()
+
+    def on_event(event):
+        nonlocal browsers_ready
+        if event["type"] == "browsers":
+            browsers_ready = event["ready"]
+        if event["type"] != "download":
+            return
+        rec = by_id[event["full_id"]]
+        result = {
+            "full_id": rec["full_id"], "artist": rec.get("artist"), "title": rec.get("title"),
+            "status": event["status"], "path": event["path"], "via": event["via"],
+            "elapsed": event["elapsed"], "error": event["error"],
+        }
+        results.append(result)
+        out.write(result)
+
+    # Ссылки получают браузеры без окна (клик по треку), скачивание идёт
+    # параллельно, пока браузер уже кликает следующий трек
+    await _drive(engine, engine.download_many(
+        tracks, args.dir, concurrency=args.jobs, skip_existing=True,
+        pages=pages, browsers=args.browsers,
+    ), on_event)
+
+    wall = time.perf_counter() - t_start
+    by_status = {s: sum(1 for r in results if r["status"] == s) for s in ("ok", "skipped", "failed")}
+    ok_paths = [r["path"] for r in results if r["status"] == "ok"]
+    stats = {
+        "tracks": len(results),
+        **by_status,
+        "browsers": browsers_ready,
+        "bytes": sum(os.path.getsize(p) for p in ok_paths if os.path.isfile(p)),
+        "wall_sec": round(wall, 2),
+        "tracks_per_min": round(by_status["ok"] / wall * 60, 1) if wall else None,
+    }
+    out.close({"stats": stats, "tracks": results})
+    _print_summary("download", stats)
+
+    if by_status["failed"] and not browsers_ready:
+        return EXIT_NO_SESSION
+    return EXIT_FAILED if by_status["failed"] else EXIT_OK
+
+
+# ------------------------------------------------------
+# АРГУМЕНТЫ
+# ------------------------------------------------------
+def build_parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("-f", "--format", choices=("jsonl", "json", "tsv"), default="jsonl",
+                        help="формат вывода (по умолчанию jsonl — по строке на трек)")
+    common.add_argument("-o", "--output", help="файл вывода (по умолчанию stdout)")
+    common.add_argument("-b", "--browsers", type=int, default=vk_engine.BATCH_BROWSERS,
+                        help="сколько браузеров без окна работают параллельно")
+    common.add_argument("-j", "--jobs", type=int, default=vk_engine.BATCH_HTTP_WORKERS,
+                        help="параллельные HTTP-запросы / скачивания")
+    common.add_argument("--metrics", metavar="FILE",
+                        help="метрики по этапам в файл при выходе (.json — JSON, иначе Prometheus)")
+    common.add_argument("--log-file", metavar="FILE",
+                        help="лог в файл с ротацией по размеру (VK_SEARCH_LOG_FILE)")
+    verbosity = common.add_mutually_exclusive_group()
+    verbosity.add_argument("-v", "--verbose", action="store_const", dest="verbosity",
+                           const=1, default=0, help="весь лог в stderr")
+    verbosity.add_argument("-q", "--quiet", action="store_const", dest="verbosity",
+                           const=-1, help="без лога (сводка остаётся)")
+
+    collect = argparse.ArgumentParser(add_help=False, parents=[common])
+    collect.add_argument("-i", "--input", help="файл со строками (по одной), - — stdin")
+    collect.add_argument("-n", "--count", type=int, default=30,
+                         help="треков на строку, 0 — все, что отдаст ВК (по умолчанию 30)")
+    collect.add_argument("--backend", choices=("browser", "http"),
+                         help="как искать (по умолчанию VK_SEARCH_BACKEND)")
+    collect.add_argument("--no-cache", action="store_true",
+                         help="не брать результаты из кэша (свежие всё равно кэшируются)")
+
+    parser = argparse.ArgumentParser(
+        description="VKSearch без окна: поиск, плейлисты, профили и скачивание"
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("search", parents=[collect],
+                       help="поиск (ссылки на плейлист/профиль тоже понимаются)")
+    p.add_argument("items", nargs="*", metavar="QUERY")
+    p = sub.add_parser("playlist", parents=[collect], help="треки плейлистов/альбомов")
+    p.add_argument("items", nargs="*", metavar="URL")
+    p = sub.add_parser("profile", parents=[collect], help="аудиозаписи профилей/групп")
+    p.add_argument("items", nargs="*", metavar="PROFILE")
+    p = sub.add_parser("download", parents=[common],
+                       help="скачать треки из вывода search/playlist/profile")
+    p.add_argument("files", nargs="*", metavar="FILE", help="JSON lines / json, - — stdin")
+    p.add_argument("-d", "--dir", default=".", help="папка для mp3 (по умолчанию текущая)")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.browsers < 1 or args.jobs < 1:
+        print("--browsers и --jobs должны быть >= 1", file=sys.stderr)
+        return EXIT_USAGE
+    _setup_logging(args.verbosity, args.log_file)
+
+    if getattr(args, "backend", None):
+        vk_engine.SEARCH_BACKEND = args.backend
+    if getattr(args, "no_cache", False):
+        vk_engine.RESULT_CACHE_REFRESH = True
+    if hasattr(args, "count"):
+        args.count = max(args.count, 0)
+    if args.metrics:
+        vk_engine.METRICS_FILE = args.metrics
+
+    if not os.path.isfile(vk_engine.SESSION_FILE):
+        print(
+            f"нет сохранённой сессии ВК ({vk_engine.SESSION_FILE}): "
+            f"войдите один раз через python vk_search.py",
+            file=sys.stderr,
+        )
+        return EXIT_NO_SESSION
+
+    engine = VKEngine()
+    try:
+        if args.command == "download":
+            return asyncio.run(cmd_download(engine, args))
+        kind = {"search": None, "playlist": "pl", "profile": "pr"}[args.command]
+        return asyncio.run(cmd_collect(engine, args, kind))
+    except KeyboardInterrupt:
+        print("прервано", file=sys.stderr)
+        return EXIT_INTERRUPTED
+    finally:
+        engine.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,5143 @@
+# VKSearch — движок без Qt
+#
+# Поиск, получение ссылок и скачивание: Selenium-браузер, HTTP-поиск, кэши.
+# Окно (vk_search.py) и командная строка (vk_cli.py) — подписчики событий
+# движка; Qt здесь не импортируется.
+#
+#   engine = VKEngine()
+#   engine.open_session(interactive=False)
+#   tracks = await engine.search("кино группа крови", 50)
+#   results = await engine.download_many(tracks, "music")
+#
+
+import sys
+import atexit
+import functools
+import importlib
+import importlib.util
+import threading
+import gzip
+import hashlib
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, as_completed
+from queue import Queue, Empty, Full
+import time
+import json
+import subprocess
+import os
+import tempfile
+import re
+import html as html_lib
+from urllib.parse import quote_plus
+
+# ------------------------------------------------------
+# ЛОГГЕР
+# ------------------------------------------------------
+# log_message("УРОВЕНЬ: текст") — уровень берётся из префикса строки: DEBUG,
+# INFO, WARNING, ERROR; остальные (NAV:, DOWNLOAD:, yt-dlp: ...) — INFO.
+# Поток, который пишет в лог, не ждёт ввода-вывода: запись кладётся в
+# очередь, в консоль и файл её выводит отдельный поток. В частых местах
+# аргументы передаются отдельно — log_message("DEBUG: скролл #%d", n), —
+# тогда строка собирается только если уровень включён, и уже в потоке
+# вывода. Повторяющиеся DEBUG-сообщения прореживаются.
+import logging
+
+LOG_LEVEL = os.environ.get("VK_SEARCH_LOG_LEVEL", "INFO").upper()
+# Лог в файл с ротацией по размеру (пусто — только консоль)
+LOG_FILE = os.environ.get("VK_SEARCH_LOG_FILE", "")
+LOG_FILE_MAX_BYTES = int(float(os.environ.get("VK_SEARCH_LOG_MAX_MB", "10")) * 1024 * 1024)
+LOG_FILE_BACKUPS = 3
+# DEBUG-сообщения одного вида: первые LOG_SAMPLE_FIRST пишутся все, дальше —
+# каждое LOG_SAMPLE_EVERY-е (1 — без прореживания)
+LOG_SAMPLE_FIRST = 20
+LOG_SAMPLE_EVERY = max(1, int(os.environ.get("VK_SEARCH_LOG_SAMPLE", "50")))
+
+_LOG_LEVELS = {
+    "DEBUG": logging.DEBUG, "INFO": logging.INFO, "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR, "OFF": logging.CRITICAL + 1,
+}
+_LOG_PREFIXES = (
+    ("DEBUG", logging.DEBUG), ("ERROR", logging.ERROR),
+    ("WARNING", logging.WARNING), ("INFO", logging.INFO),
+)
+_logger = logging.getLogger("vk_search")
+_logger.propagate = False
+_log_listener = None
+_log_lock = threading.Lock()
+
+
+class _SampleFilter(logging.Filter):
+    """
+    Прореживает повторяющиеся DEBUG-сообщения. Вид сообщения — шаблон до
+    подстановки аргументов (или начало готовой строки); работает в потоке,
+    который пишет в лог, поэтому отброшенное не попадает даже в очередь.
+    """
+
+    MAX_KINDS = 2000
+
+    def __init__(self, first: int, every: int):
+        super().__init__()
+        self.first = first
+        self.every = every
+        self._seen: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.every <= 1:
+            return True
+        key = record.msg if record.args else str(record.msg)[:32]
+        with self._lock:
+            if len(self._seen) >= self.MAX_KINDS:
+                self._seen.clear()
+            count = self._seen.get(key, 0) + 1
+            self._seen[key] = count
+        if count <= self.first:
+            return True
+        if count % self.every:
+            return False
+        record.msg = f"{record.msg} [похожих: {count}, пишется каждое {self.every}-е]"
+        return True
+
+
+def _external_log_handler():
+    """Если рядом есть модуль logger (своя запись лога), сообщения идут и в него."""
+    try:
+        from logger import log_message as external
+    except Exception:
+        return None
+
+    class _ExternalHandler(logging.Handler):
+        def emit(self, record):
+            try:
+                external(record.getMessage())
+            except Exception:
+                self.handleError(record)
+
+    return _ExternalHandler()
+
+
+def setup_logging(level: str | None = None, stream=None, log_file: str | None = None):
+    """
+    (Пере)настраивает лог: уровень (DEBUG/INFO/WARNING/ERROR/OFF), консоль
+    (по умолчанию stdout, False — без консоли) и файл с ротацией по размеру.
+    Без вызова лог настраивается сам при первом сообщении по VK_SEARCH_LOG_*.
+    """
+    global _log_listener
+    from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+    class _DeferredQueueHandler(QueueHandler):
+        # Запись уходит в очередь как есть: строку соберёт поток вывода
+        # (аргументы лога — неизменяемые значения, копировать их не нужно)
+        def prepare(self, record):
+            return record
+
+    level = (level or LOG_LEVEL).upper()
+    log_file = LOG_FILE if log_file is None else log_file
+
+    handlers = []
+    if stream is not False:
+        console = logging.StreamHandler(stream or sys.stdout)
+        console.setFormatter(logging.Formatter("%(message)s"))
+        handlers.append(console)
+    if log_file:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+            rotating = RotatingFileHandler(
+                log_file, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS,
+                encoding="utf-8",
+            )
+            rotating.setFormatter(logging.Formatter("%(asctime)s [%(threadName)s] %(message)s"))
+            handlers.append(rotating)
+        except OSError as e:
+            print(f"WARNING: не удалось открыть файл лога {log_file}: {e}", file=sys.stderr)
+    external = _external_log_handler()
+    if external is not None:
+        handlers.append(external)
+
+    with _log_lock:
+        if _log_listener is not None:
+            _log_listener.stop()
+        for handler in list(_logger.handlers):
+            _logger.removeHandler(handler)
+        for log_filter in list(_logger.filters):
+            _logger.removeFilter(log_filter)
+
+        _logger.setLevel(_LOG_LEVELS.get(level, logging.INFO))
+        _logger.addFilter(_SampleFilter(LOG_SAMPLE_FIRST, LOG_SAMPLE_EVERY))
+        log_queue = Queue()
+        _logger.addHandler(_DeferredQueueHandler(log_queue))
+        if _log_listener is None:
+            atexit.register(flush_logging)
+        _log_listener = QueueListener(log_queue, *handlers)
+        _log_listener.start()
+
+
+def flush_logging():
+    """Дописывает всё, что стоит в очереди лога (перед выходом из программы)."""
+    with _log_lock:
+        if _log_listener is not None:
+            _log_listener.stop()
+            _log_listener.start()
+
+
+def log_message(msg: str, *args):
+    """
+    Сообщение в лог. Аргументы подставляются в msg через % в потоке вывода
+    и только если уровень сообщения включён.
+    """
+    if _log_listener is None:
+        with _log_lock:
+            configured = _log_listener is not None
+        if not configured:
+            setup_logging()
+    level = logging.INFO
+    for prefix, prefix_level in _LOG_PREFIXES:
+        if msg.startswith(prefix):
+            level = prefix_level
+            break
+    if _logger.isEnabledFor(level):
+        _logger.log(level, msg, *args)
+
+# ------------------------------------------------------
+# ЗАВИСИМОСТИ (импорт при первом использовании)
+# ------------------------------------------------------
+# selenium, webdriver_manager, bs4 и requests тянут за собой сотни модулей.
+# Чтобы импорт vk_engine/vk_search (например, только чтобы поднять уже
+# открытое окно) был быстрым, пакеты импортируются при первом обращении,
+# а флаги наличия проверяют только, что пакет установлен (find_spec).
+class _LazyImport:
+    """
+    Модуль или объект модуля, который импортируется при первом обращении:
+    webdriver.Chrome(...), By.CSS_SELECTOR, BeautifulSoup(html, ...).
+    """
+
+    __slots__ = ("_module", "_attr", "_target")
+
+    def __init__(self, module: str, attr: str | None = None):
+        self._module = module
+        self._attr = attr
+        self._target = None
+
+    def _resolve(self):
+        target = self._target
+        if target is None:
+            target = importlib.import_module(self._module)
+            if self._attr:
+                target = getattr(target, self._attr)
+            self._target = target
+        return target
+
+    def __getattr__(self, name: str):
+        return getattr(self._resolve(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+
+def _module_available(name: str) -> bool:
+    """Установлен ли пакет — без его импорта."""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+# Флаги наличия зависимостей
+SELENIUM_AVAILABLE = True
+REQUESTS_AVAILABLE = True
+YTDLP_AVAILABLE = True
+
+# ------------------------------------------------------
+# SELENIUM + BS4
+# ------------------------------------------------------
+for _name in ("selenium", "webdriver_manager"):
+    if not _module_available(_name):
+        SELENIUM_AVAILABLE = False
+        log_message(f"ERROR: Selenium не доступен: нет модуля {_name}")
+
+if not _module_available("bs4"):
+    SELENIUM_AVAILABLE = False
+    log_message("ERROR: BeautifulSoup (bs4) не доступен: нет модуля bs4")
+
+webdriver = _LazyImport("selenium.webdriver")
+By = _LazyImport("selenium.webdriver.common.by", "By")
+WebDriverWait = _LazyImport("selenium.webdriver.support.ui", "WebDriverWait")
+EC = _LazyImport("selenium.webdriver.support.expected_conditions")
+ChromeDriverManager = _LazyImport("webdriver_manager.chrome", "ChromeDriverManager")
+Service = _LazyImport("selenium.webdriver.chrome.service", "Service")
+BeautifulSoup = _LazyImport("bs4", "BeautifulSoup")
+
+# ------------------------------------------------------
+# requests для скачивания
+# ------------------------------------------------------
+if not _module_available("requests"):
+    REQUESTS_AVAILABLE = False
+    log_message("ERROR: requests не доступен: нет модуля requests")
+
+requests = _LazyImport("requests")
+
+# asyncio нужен только async-API движка (там его уже импортировал вызывающий)
+asyncio = _LazyImport("asyncio")
+
+# ------------------------------------------------------
+# yt-dlp для скачивания с ВК (запускается как программа, модуль не импортируем)
+# ------------------------------------------------------
+if not _module_available("yt_dlp"):
+    YTDLP_AVAILABLE = False
+    log_message("WARNING: yt-dlp не доступен (pip install yt-dlp): нет модуля yt_dlp")
+
+# ------------------------------------------------------
+# НАСТРОЙКИ
+# ------------------------------------------------------
+# Каталог с данными программы: профиль браузера, сохранённая сессия
+APP_DATA_DIR = (
+    os.environ.get("VK_SEARCH_DATA_DIR")
+    or os.path.join(os.path.expanduser("~"), ".vk_music_search")
+)
+# Постоянный профиль Chrome (user-data-dir) — сохраняет логин между запусками
+CHROME_PROFILE_DIR = os.path.join(APP_DATA_DIR, "chrome_profile")
+# Cookies последней удачной сессии (запасной вариант, если профиль занят)
+SESSION_FILE = os.path.join(APP_DATA_DIR, "session.json")
+# Путь к ChromeDriver и версия Chrome, для которой он подобран: пока Chrome
+# не обновился, ChromeDriverManager (проверка версий, сеть) не вызывается
+CHROMEDRIVER_CACHE_FILE = os.path.join(APP_DATA_DIR, "chromedriver.json")
+# Если сессия действительна — работать без окна браузера
+HEADLESS_WHEN_LOGGED_IN = os.environ.get("VK_SEARCH_HEADLESS", "1") != "0"
+# Поиск: "browser" — через страницу в Selenium, "http" — запросами al_audio.php
+# с cookies сессии (при капче/проверке — автоматически через браузер)
+SEARCH_BACKEND = os.environ.get("VK_SEARCH_BACKEND", "browser").lower()
+
+# Облегчённая загрузка страниц: стратегия "eager" (get() не ждёт картинок и
+# прочих подресурсов) и блокировка через CDP картинок, шрифтов и видео — для
+# разбора data-audio и состояния React они не нужны. Скрипты, XHR и аудиопоток
+# (m3u8/ts/mp3) не блокируются. Видимое окно браузера облегчается только после
+# входа: страница логина и капча остаются целыми
+LEAN_MODE = os.environ.get("VK_SEARCH_LEAN", "1") != "0"
+LEAN_BLOCKED_URLS = [
+    "*.jpg*", "*.jpeg*", "*.png*", "*.gif*", "*.webp*", "*.avif*", "*.ico*",
+    "*.woff*", "*.ttf*", "*.otf*",
+    "*.mp4*", "*.webm*",
+    "*ad.mail.ru*", "*top-fwz1.mail.ru*", "*ads.vk.com*",
+]
+
+# Подгрузка списков скроллом: после скролла ждём роста числа строк,
+# «тишина» SCROLL_QUIET_MS без новых строк SCROLL_QUIET_ROUNDS раз подряд — конец
+SCROLL_QUIET_MS = 800
+SCROLL_QUIET_ROUNDS = 3
+SCROLL_MAX_WAIT_MS = 8000
+
+# Кэш результатов: повтор запроса/ссылки отдаётся мгновенно
+RESULT_CACHE_FILE = os.path.join(APP_DATA_DIR, "results_cache.json.gz")
+RESULT_CACHE_MAX_ENTRIES = 200
+RESULT_CACHE_TTL = 6 * 3600
+# После выдачи из кэша всё равно обновить результаты в фоне
+RESULT_CACHE_REFRESH = os.environ.get("VK_SEARCH_CACHE_REFRESH", "0") == "1"
+
+# Пакетный поиск: сколько браузеров работают параллельно
+# (основной + фоновые headless с cookies сохранённой сессии)
+BATCH_BROWSERS = max(1, int(os.environ.get("VK_SEARCH_BATCH_BROWSERS", "2")))
+# Параллельные HTTP-запросы пакета при SEARCH_BACKEND == "http"
+BATCH_HTTP_WORKERS = 4
+
+# Короткое имя профиля → числовой ID владельца (без захода на страницу профиля)
+OWNER_ID_CACHE_FILE = os.path.join(APP_DATA_DIR, "owner_ids.json")
+OWNER_ID_CACHE_TTL = 30 * 24 * 3600
+
+# Режим «вся коллекция»: без ограничения числа треков, треки пишутся на диск
+# (<COLLECTIONS_DIR>/<ключ>.jsonl) с контрольными точками — после падения
+# загрузка продолжается с последней из них
+COLLECTIONS_DIR = os.path.join(APP_DATA_DIR, "collections")
+COLLECTION_CHECKPOINT_EVERY = 500
+# Сколько первых треков коллекции показывать в таблице
+COLLECTION_TABLE_ROWS = 2000
+
+# Предзагрузка ссылок на поток в простое: первые PREFETCH_TOP_N строк
+# результатов и выделенные строки. Ссылки ВК подписаны и живут недолго
+PREFETCH_ENABLED = os.environ.get("VK_SEARCH_PREFETCH", "0") == "1"
+PREFETCH_TOP_N = 5
+PREFETCH_TTL = 10 * 60
+# Сколько секунд браузер должен простаивать, прежде чем начать предзагрузку
+PREFETCH_IDLE_SEC = 1.5
+# Долгая подгрузка в основном браузере между шагами скролла отдаёт его
+# ждущему скачиванию, но ждёт его не дольше DRIVER_YIELD_MAX_SEC секунд
+DRIVER_YIELD_MAX_SEC = 30
+
+# Сторож сессии в пакете: после неудачной строки браузер сразу проверяет,
+# не вышли ли мы из ВК, после удачной — не чаще раза в SESSION_WATCHDOG_INTERVAL
+# секунд. Вход потерян — пакет ждёт повторного входа до SESSION_RELOGIN_TIMEOUT
+SESSION_WATCHDOG_INTERVAL = 60
+SESSION_RELOGIN_TIMEOUT = 15 * 60
+
+# Пул задач движка: поиск, пакеты и скачивание идут не больше чем в
+# ENGINE_WORKERS потоках. В очереди ждут не больше ENGINE_MAX_PENDING задач —
+# дальше submit() ждёт места (синхронный код) или await (асинхронный)
+ENGINE_WORKERS = max(2, int(os.environ.get("VK_SEARCH_WORKERS", "6")))
+ENGINE_MAX_PENDING = 64
+# Сколько треков download_many качает одновременно (ссылки браузер всё равно
+# получает по одной) и сколько раз повторяет неудачное скачивание
+DOWNLOAD_CONCURRENCY = max(1, int(os.environ.get("VK_SEARCH_DOWNLOADS", "3")))
+DOWNLOAD_RETRIES = 2
+
+# Метрики по этапам (_Metrics): VK_SEARCH_METRICS_PORT — отдавать их по HTTP
+# на 127.0.0.1 (/metrics — Prometheus, /metrics.json), VK_SEARCH_METRICS_FILE —
+# записывать в файл после каждого пакета и при закрытии (.json — JSON,
+# иначе текст Prometheus, например для textfile collector node_exporter)
+METRICS_PORT = int(os.environ.get("VK_SEARCH_METRICS_PORT", "0") or 0)
+METRICS_FILE = os.environ.get("VK_SEARCH_METRICS_FILE") or None
+
+_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"
+)
+
+
+# ------------------------------------------------------
+# ТРЕК
+# ------------------------------------------------------
+class Track:
+    """
+    Трек из результатов поиска. Длительность — число секунд, исполнитель и
+    владелец интернируются (в больших плейлистах они повторяются).
+    Ведёт себя как прежний кортеж (artist, title, "m:ss", owner, url, full_id):
+    индексы, len(), list()/json — поэтому кэш, отчёты и файлы коллекций
+    читаются и пишутся как раньше.
+    """
+
+    __slots__ = ("artist", "title", "duration", "owner", "url", "full_id")
+
+    def __init__(self, artist: str, title: str, duration, owner: str = "",
+                 url: str = "", full_id: str = ""):
+        self.artist = sys.intern(artist or "")
+        self.title = title or ""
+        if isinstance(duration, (int, float)):
+            self.duration = int(duration)
+        else:
+            self.duration = self.parse_duration(duration)
+        self.owner = sys.intern(owner or "")
+        self.url = url or ""
+        self.full_id = full_id or ""
+
+    @classmethod
+    def from_row(cls, row) -> "Track":
+        """Из Track, кортежа или списка (кэш, JSON); недостающие поля — пустые."""
+        if isinstance(row, cls):
+            return row
+        row = list(row[:6]) + [""] * (6 - len(row))
+        return cls(str(row[0] or ""), str(row[1] or ""), row[2] or 0,
+                   str(row[3] or ""), str(row[4] or ""), str(row[5] or ""))
+
+    @staticmethod
+    def parse_duration(text) -> int:
+        """"m:ss" / "h:mm:ss" / "ss" → секунды, непонятное — 0."""
+        try:
+            seconds = 0
+            for part in str(text).split(":"):
+                seconds = seconds * 60 + int(part)
+            return seconds
+        except ValueError:
+            return 0
+
+    @staticmethod
+    def owner_label(owner_id) -> str:
+        """Человекочитаемый владелец: id123 / club123."""
+        try:
+            oid = int(owner_id)
+        except (TypeError, ValueError):
+            return str(owner_id or "")
+        if oid < 0:
+            return f"club{abs(oid)}"
+        return f"id{oid}" if oid else str(owner_id)
+
+    @property
+    def duration_str(self) -> str:
+        if self.duration <= 0:
+            return ""
+        return f"{self.duration // 60}:{self.duration % 60:02d}"
+
+    def _as_tuple(self) -> tuple:
+        return (self.artist, self.title, self.duration_str, self.owner, self.url, self.full_id)
+
+    def __len__(self):
+        return 6
+
+    def __getitem__(self, index):
+        if isinstance(index, int):
+            if index in (2, -4):
+                return self.duration_str
+            return getattr(self, self.__slots__[index])
+        return self._as_tuple()[index]
+
+    def __iter__(self):
+        return iter(self._as_tuple())
+
+    def __eq__(self, other):
+        if isinstance(other, (Track, tuple, list)):
+            return self._as_tuple() == tuple(other)
+        return NotImplemented
+
+    def __hash__(self):
+        # Равен кортежу с теми же полями — значит, и хэш как у кортежа
+        return hash(self._as_tuple())
+
+    def __repr__(self):
+        return f"Track{self._as_tuple()!r}"
+
+
+# ------------------------------------------------------
+# ПУЛ ЗАДАЧ
+# ------------------------------------------------------
+class _BoundedExecutor(Executor):
+    """
+    Пул потоков с ограниченной очередью: submit() ждёт, пока в очереди
+    освободится место, submit_nowait() в этом случае бросает queue.Full.
+    Потоки создаются по мере нужды и работают как демоны: незаконченное
+    скачивание не держит закрытие программы. Задача, поставленная из
+    потока самого пула, не ждёт: если её некому взять сразу, она
+    выполняется тут же, в вызывающем потоке.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self._queue: Queue = Queue(maxsize=max_pending)
+        self._threads: list[threading.Thread] = []
+        self._idle = 0
+        self._lock = threading.Lock()
+        self._shutdown = False
+        self._worker_local = threading.local()
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        return self._put(fn, args, kwargs, block=True)
+
+    def submit_nowait(self, fn, /, *args, **kwargs) -> Future:
+        return self._put(fn, args, kwargs, block=False)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        with self._lock:
+            self._shutdown = True
+            threads = list(self._threads)
+        for _ in threads:
+            self._queue.put(None)
+        if wait:
+            for t in threads:
+                t.join()
+
+    def _put(self, fn, args, kwargs, block: bool) -> Future:
+        if self._shutdown:
+            raise RuntimeError("пул задач остановлен")
+        item = (Future(), fn, args, kwargs)
+        if getattr(self._worker_local, "inside", False):
+            # Из задачи пула ждать места нельзя: если так ждут все потоки,
+            # пул встанет навсегда. Некому взять сразу — выполняем на месте.
+            with self._lock:
+                served = (self._queue.qsize() < self._idle
+                          or len(self._threads) < self.max_workers)
+            if not served:
+                self._run(item)
+                return item[0]
+            try:
+                self._queue.put(item, block=False)
+            except Full:
+                self._run(item)
+                return item[0]
+        else:
+            self._queue.put(item, block=block)
+        with self._lock:
+            # Новый поток — если ждущих задач (с этой) больше, чем
+            # свободных потоков, и есть куда расти
+            if self._queue.qsize() > self._idle and len(self._threads) < self.max_workers:
+                t = threading.Thread(
+                    target=self._worker, daemon=True, name=f"vk-engine-{len(self._threads) + 1}"
+                )
+                self._threads.append(t)
+                t.start()
+        return item[0]
+
+    @staticmethod
+    def _run(item):
+        future, fn, args, kwargs = item
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+
+    def _worker(self):
+        self._worker_local.inside = True
+        while True:
+            with self._lock:
+                self._idle += 1
+            item = self._queue.get()
+            with self._lock:
+                self._idle -= 1
+            if item is None:
+                return
+            self._run(item)
+
+
+class _EventStream:
+    """
+    Поток событий движка для asyncio (VKEngine.events). Подписывается сразу
+    при создании, поэтому события между вызовом и первым await не теряются.
+    Очередь ограничена maxsize: если потребитель не успевает, выбрасывается
+    самое старое событие статуса или прогресса (они устаревают первыми);
+    треки, отчёты и результаты скачивания не теряются никогда.
+    close() (или выход из with) — отписаться и закончить перебор.
+    """
+
+    _LOSSY = frozenset({"status", "progress"})
+
+    def __init__(self, engine: "VKEngine", maxsize: int):
+        self._loop = asyncio.get_running_loop()
+        self._maxsize = maxsize
+        self._pending: deque = deque()
+        self._wake = asyncio.Event()
+        self._unsubscribe = engine.subscribe(self._push)
+
+    def _push(self, event: dict):
+        # Из любого потока: в очередь кладёт цикл asyncio
+        try:
+            self._loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            pass  # цикл уже закрыт
+
+    def _put(self, event: dict):
+        if len(self._pending) >= self._maxsize:
+            for i, old in enumerate(self._pending):
+                if old["type"] in self._LOSSY:
+                    del self._pending[i]
+                    break
+        self._pending.append(event)
+        self._wake.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        while not self._pending:
+            if self._unsubscribe is None:
+                raise StopAsyncIteration
+            self._wake.clear()
+            await self._wake.wait()
+        return self._pending.popleft()
+
+    def get_nowait(self) -> dict | None:
+        """Следующее уже пришедшее событие или None."""
+        return self._pending.popleft() if self._pending else None
+
+    def close(self):
+        if self._unsubscribe is not None:
+            self._unsubscribe()
+            self._unsubscribe = None
+        self._wake.set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ------------------------------------------------------
+# МЕТРИКИ
+# ------------------------------------------------------
+class _Metrics:
+    """
+    Счётчики, гистограммы и датчики по этапам: переходы, скролл, сбор треков,
+    получение ссылок, скачивание, конвертация, повторы, очереди.
+    snapshot() — снимок для JSON, prometheus_text() — текстовый формат
+    Prometheus, serve(port) — оба по HTTP.
+    """
+
+    # Границы корзин: время, сек, и скорость скачивания, байт/сек
+    TIME_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 180)
+    RATE_BUCKETS = (16e3, 64e3, 256e3, 1e6, 4e6, 16e6, 64e6)
+
+    # имя → (тип, описание, корзины гистограммы)
+    SPECS = {
+        "vk_navigation_seconds": (
+            "histogram", "Переход на страницу: get() и тайминги документа (phase)", TIME_BUCKETS),
+        "vk_scroll_seconds": ("histogram", "Подгрузка списка скроллом, целиком", TIME_BUCKETS),
+        "vk_scrolls_total": ("counter", "Скроллов при подгрузке списков", None),
+        "vk_collect_seconds": (
+            "histogram", "Сбор треков строки: поиск/плейлист/профиль (kind) по источнику (source)",
+            TIME_BUCKETS),
+        "vk_tracks_collected_total": ("counter", "Собрано треков (kind, source)", None),
+        "vk_resolve_seconds": (
+            "histogram", "Получение ссылки на поток (method: click, al_audio, prefetch, failed)",
+            TIME_BUCKETS),
+        "vk_http_seconds": ("histogram", "Запросы al_audio.php без браузера (act)", TIME_BUCKETS),
+        "vk_http_requests_total": ("counter", "Запросы al_audio.php (act, result)", None),
+        "vk_cache_lookups_total": ("counter", "Обращения к кэшу результатов (result: hit, miss)", None),
+        "vk_downloads_total": ("counter", "Скачивания (method: m3u8, direct; result)", None),
+        "vk_download_seconds": ("histogram", "Время скачивания файла (method)", TIME_BUCKETS),
+        "vk_download_bytes_total": ("counter", "Скачано байт (method)", None),
+        "vk_download_rate_bytes_per_second": (
+            "histogram", "Скорость скачивания файла (method)", RATE_BUCKETS),
+        "vk_transcode_seconds": ("histogram", "Конвертация в MP3 (tool)", TIME_BUCKETS),
+        "vk_retries_total": ("counter", "Повторы по этапам и причинам (stage, reason)", None),
+        "vk_queue_depth": ("gauge", "Задач в очереди (queue: engine, batch, prefetch)", None),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (имя, ((метка, значение), ...)) → значение / [корзины..., сумма, количество]
+        self._counters: dict[tuple, float] = {}
+        self._gauges: dict[tuple, float] = {}
+        self._gauge_fns: dict[tuple, object] = {}
+        self._histograms: dict[tuple, list] = {}
+        self.started = time.time()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def gauge_fn(self, name: str, fn, **labels):
+        """Датчик, значение которого читается при снимке: fn() → число."""
+        with self._lock:
+            self._gauge_fns[self._key(name, labels)] = fn
+
+    def observe(self, name: str, value: float, **labels):
+        buckets = self.SPECS[name][2]
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * len(buckets) + [0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    def _collect(self):
+        """Копия всех значений под блокировкой; датчики-функции читаются после."""
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            gauge_fns = dict(self._gauge_fns)
+            histograms = {k: list(v) for k, v in self._histograms.items()}
+        for key, fn in gauge_fns.items():
+            try:
+                gauges[key] = fn()
+            except Exception:
+                continue
+        return counters, gauges, histograms
+
+    def snapshot(self) -> dict:
+        counters, gauges, histograms = self._collect()
+
+        def values(items):
+            out: dict[str, list] = {}
+            for (name, labels), value in sorted(items.items()):
+                out.setdefault(name, []).append({"labels": dict(labels), "value": value})
+            return out
+
+        hist_out: dict[str, list] = {}
+        for (name, labels), hist in sorted(histograms.items()):
+            buckets = self.SPECS[name][2]
+            count, total = hist[-1], hist[-2]
+            hist_out.setdefault(name, []).append({
+                "labels": dict(labels),
+                "count": count,
+                "sum": round(total, 4),
+                "avg": round(total / count, 4) if count else None,
+                "buckets": {str(b): n for b, n in zip(buckets, hist)},
+            })
+        return {
+            "time": round(time.time(), 3),
+            "uptime_sec": round(time.time() - self.started, 1),
+            "counters": values(counters),
+            "gauges": values(gauges),
+            "histograms": hist_out,
+        }
+
+    @staticmethod
+    def _labels_text(labels, extra: tuple = ()) -> str:
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (
+            f'{k}="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+            for k, v in pairs
+        )
+        return "{" + ",".join(escaped) + "}"
+
+    def prometheus_text(self) -> str:
+        counters, gauges, histograms = self._collect()
+        by_name: dict[str, list] = {}
+        for items in (counters, gauges, histograms):
+            for name, labels in items:
+                by_name.setdefault(name, []).append(labels)
+
+        lines = []
+        for name in sorted(by_name):
+            kind, help_text, buckets = self.SPECS.get(name, ("untyped", "", None))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels in sorted(by_name[name]):
+                key = (name, labels)
+                if key in histograms:
+                    hist = histograms[key]
+                    # В файле гистограммы корзины накопительные (value <= le)
+                    for bound, n in zip(buckets, hist):
+                        lines.append(f"{name}_bucket{self._labels_text(labels, (('le', repr(float(bound))),))} {n}")
+                    lines.append(f"{name}_bucket{self._labels_text(labels, (('le', '+Inf'),))} {hist[-1]}")
+                    lines.append(f"{name}_sum{self._labels_text(labels)} {hist[-2]:.6f}")
+                    lines.append(f"{name}_count{self._labels_text(labels)} {hist[-1]}")
+                else:
+                    value = counters.get(key, gauges.get(key, 0))
+                    lines.append(f"{name}{self._labels_text(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """Снимок в файл: .json — JSON, иначе текст Prometheus. Запись атомарная."""
+        try:
+            if path.lower().endswith(".json"):
+                data = json.dumps(self.snapshot(), ensure_ascii=False, indent=1)
+            else:
+                data = self.prometheus_text()
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            tmp_path = path + f".{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            log_message(f"WARNING: не удалось записать метрики в {path}: {e}")
+
+    def serve(self, port: int, host: str = "127.0.0.1"):
+        """HTTP в фоновом потоке: /metrics — Prometheus, /metrics.json — JSON."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] == "/metrics.json":
+                    body = json.dumps(metrics.snapshot(), ensure_ascii=False).encode("utf-8")
+                    content_type = "application/json; charset=utf-8"
+                elif self.path.split("?")[0] == "/metrics":
+                    body = metrics.prometheus_text().encode("utf-8")
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True, name="vk-metrics").start()
+        log_message(f"INFO: метрики: http://{host}:{server.server_port}/metrics")
+        return server
+
+
+# Одни метрики на процесс: их пишут движок, HTTP-клиент и кэши
+_metrics = _Metrics()
+_metrics_server = None
+
+
+def _metered_collect(kind: str):
+    """Метод сбора треков → vk_collect_seconds и vk_tracks_collected_total."""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            t0 = time.perf_counter()
+            results = None
+            try:
+                results = method(self, *args, **kwargs)
+                return results
+            finally:
+                source = self._last_interface or "unknown"
+                _metrics.observe("vk_collect_seconds", time.perf_counter() - t0,
+                                 kind=kind, source=source)
+                n = results if isinstance(results, int) else len(results or ())
+                if n:
+                    _metrics.inc("vk_tracks_collected_total", n, kind=kind, source=source)
+        return wrapper
+    return decorate
+
+
+def _metered_download(method):
+    """
+    Метод скачивания (url, path) → vk_downloads_total, время, байты и скорость.
+    Считается только внешний вызов: запасной способ внутри него — часть той же попытки.
+    """
+    @functools.wraps(method)
+    def wrapper(self, url: str, path: str):
+        depth = getattr(self._local, "download_depth", 0)
+        self._local.download_depth = depth + 1
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            ok = method(self, url, path)
+            return ok
+        finally:
+            self._local.download_depth = depth
+            if depth == 0:
+                self._record_download("m3u8" if ".m3u8" in url else "direct", path,
+                                      time.perf_counter() - t0, ok)
+    return wrapper
+
+
+# ------------------------------------------------------
+# ДВИЖОК
+# ------------------------------------------------------
+class VKEngine:
+    """
+    Поиск и скачивание музыки ВК без Qt:
+    - основной Selenium-браузер (окно только для входа) и фоновые без окна;
+    - HTTP-поиск через al_audio.php, кэш результатов и ID владельцев;
+    - ограниченный пул задач (submit() / await) и поток событий — словари
+      {"type": "status" | "progress_start" | "progress" | "progress_end" |
+      "session" | "tracks" | "results" | "item" | "browsers" | "download", ...};
+      tag, переданный в search() / search_many() / download_many(), приходит
+      в их событиях — по нему клиент отличает свой запрос от прежних.
+
+    Синхронные методы блокируют вызывающий поток; async-методы выполняют их
+    в пуле задач и не блокируют цикл asyncio.
+    """
+
+    def __init__(self):
+        # Состояние, своё у каждого рабочего потока пакетного поиска:
+        # подменённый драйвер, интерфейс и страница последних результатов
+        self._local = threading.local()
+        self._shared_interface = ""
+        self._shared_search_url: str | None = None
+        # Основной браузер нельзя дёргать из двух потоков сразу
+        # (пакетный поиск и клик по треку при скачивании)
+        self._driver_lock = threading.RLock()
+        # Сколько действий пользователя ждут/держат основной браузер:
+        # пока > 0, предзагрузка ссылок не начинается и прерывает текущий клик
+        self._user_driver_waiting = 0
+        self._user_driver_count_lock = threading.Lock()
+        # Подгрузка отдала браузер скачиванию (_yield_driver): со страницы не уходить
+        self._driver_lent = False
+
+        self.driver = None
+        self._driver_paths = _DriverPathCache(CHROMEDRIVER_CACHE_FILE, CHROME_PROFILE_DIR)
+        # Сброшен, пока open_session запускает основной браузер: запросы,
+        # пришедшие раньше, ждут его (wait_for_session)
+        self._session_ready = threading.Event()
+        self._session_ready.set()
+        # Основной браузер запущен без окна (для повторного входа нужен новый, с окном)
+        self._driver_headless = False
+        # Сторож сессии в пакете: сброшен, пока ждём повторного входа в ВК.
+        # relogin_interactive — открывать для входа окно браузера (окно поиска);
+        # иначе ждём, пока сессию обновят в SESSION_FILE (vk_cli.py)
+        self._session_ok = threading.Event()
+        self._session_ok.set()
+        self._session_watch_lock = threading.Lock()
+        self._relogin_gave_up = False
+        self.relogin_interactive = False
+
+        # Для отслеживания скорости скачивания
+        self._download_start_time: float = 0
+        self._download_bytes: int = 0
+
+        # Кэш результатов и интерфейс ВК, с которого пришли последние треки
+        self._result_cache = _ResultCache(
+            RESULT_CACHE_FILE, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL
+        )
+        self._last_interface = ""
+        # Короткое имя профиля → числовой ID (профиль открывается сразу на /audios<id>)
+        self._owner_ids = _OwnerIdCache(OWNER_ID_CACHE_FILE, OWNER_ID_CACHE_TTL)
+
+        # HTTP-поиск без браузера (SEARCH_BACKEND == "http")
+        self._http_client: _VKHttpSearchClient | None = None
+        # Страница, с которой получены результаты, если браузер сейчас не на ней
+        # (HTTP-поиск, кэш): туда нужно перейти, чтобы кликнуть по треку при скачивании
+        self._last_search_url = None
+        # Пакетный поиск: full_id → страница, с которой пришёл трек
+        self._track_pages: dict[str, str] = {}
+
+        # Предзагрузка ссылок: full_id → (время, url); очередь full_id на разрешение
+        self._prefetched: dict[str, tuple[float, str]] = {}
+        self._prefetch_lock = threading.Lock()
+        self._prefetch_wanted: list[str] = []
+        self._prefetch_wake = threading.Event()
+        self._prefetch_thread: threading.Thread | None = None
+        self._last_user_driver_use = 0.0
+
+        # Подписчики событий, пул задач и цикл asyncio для корутин из синхронного кода
+        self._subscribers: list = []
+        self._subscribers_lock = threading.Lock()
+        self._executor = _BoundedExecutor(ENGINE_WORKERS, ENGINE_MAX_PENDING)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_lock = threading.Lock()
+
+        # Метрики по этапам (общие на процесс)
+        self.metrics = _metrics
+        _metrics.gauge_fn("vk_queue_depth", self._executor._queue.qsize, queue="engine")
+        _metrics.gauge_fn("vk_queue_depth", lambda: len(self._prefetch_wanted), queue="prefetch")
+        global _metrics_server
+        if METRICS_PORT and _metrics_server is None:
+            try:
+                _metrics_server = _metrics.serve(METRICS_PORT)
+            except OSError as e:
+                log_message(f"WARNING: порт метрик {METRICS_PORT} недоступен: {e}")
+
+    # --------------------------------------------------
+    # СОБЫТИЯ И ПУЛ ЗАДАЧ
+    # --------------------------------------------------
+
+    def subscribe(self, callback):
+        """
+        callback(event) вызывается на каждое событие в том потоке, где оно
+        произошло. Возвращает функцию отписки.
+        """
+        with self._subscribers_lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._subscribers_lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def _emit(self, event_type: str, **data):
+        event = {"type": event_type, **data}
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                log_message(f"WARNING: подписчик события {event_type}: {e}")
+
+    def events(self, maxsize: int = 1000) -> "_EventStream":
+        """
+        Поток событий для asyncio: async for event in engine.events().
+        Вызывать внутри цикла asyncio; with engine.events() as events — с отпиской
+        на выходе. При переполнении теряются только старые status и progress.
+        """
+        return _EventStream(self, maxsize)
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """fn в пуле задач; при полной очереди ждёт места. Исключение задачи пишется в лог."""
+        future = self._executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(self._log_job_error)
+        return future
+
+    @staticmethod
+    def _log_job_error(future: Future):
+        if not future.cancelled() and future.exception() is not None:
+            log_message(f"ERROR: задача движка: {future.exception()!r}")
+
+    async def _call(self, fn, *args):
+        """fn(*args) в пуле задач; пока очередь полна — ждём, не блокируя цикл."""
+        while True:
+            try:
+                future = self._executor.submit_nowait(fn, *args)
+            except Full:
+                await asyncio.sleep(0.05)
+                continue
+            return await asyncio.wrap_future(future)
+
+    def run_coroutine(self, coro) -> Future:
+        """Корутина движка из синхронного кода (окна) — в фоновом цикле asyncio."""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever, daemon=True, name="vk-engine-loop"
+                ).start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def close(self):
+        """Закрывает основной браузер, пул задач и фоновый цикл asyncio."""
+        try:
+            if self._driver is not None:
+                self._driver.quit()
+        except Exception:
+            pass
+        self.driver = None
+        self._executor.shutdown(wait=False)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        self._result_cache.flush()
+        self._write_metrics()
+
+    def _write_metrics(self):
+        """Снимок метрик в METRICS_FILE, если он задан."""
+        if METRICS_FILE:
+            _metrics.write(METRICS_FILE)
+
+    # --------------------------------------------------
+    # ПОИСК, ССЫЛКИ, СКАЧИВАНИЕ
+    # --------------------------------------------------
+
+    def collect(self, query: str, count: int = 30, tag=None) -> list[Track]:
+        """
+        Запрос, ссылка на плейлист или профиль → треки: из кэша, HTTP-поиском
+        или браузером. count=0 — всё, что отдаст ВК. Блокирует поток;
+        без браузера с входом в ВК и при ошибке ВК — RuntimeError.
+        Треки приходят и по мере загрузки — событиями "tracks" (tag, query, tracks),
+        в конце — "results" (tag, query, kind, source, count, elapsed).
+        """
+        kind, value = self.classify_query(query)
+        done = {}
+
+        def on_delta(idx, tracks):
+            self._emit("tracks", tag=tag, query=query, tracks=list(tracks))
+
+        def on_done(idx, line, kind, source, page_url, elapsed, tracks, error):
+            done["report"] = self._item_report(line, kind, source, page_url, elapsed, tracks, error)
+            done["tracks"] = list(tracks)
+
+        if RESULT_CACHE_REFRESH:
+            # Из кэша показываем сразу, свежие результаты догоняют дельтами
+            entry = self._result_cache.get(_ResultCache.make_key(kind, value, count))
+            if entry is not None:
+                cached = [Track.from_row(t) for t in entry["tracks"]]
+                self._item_report(query, kind, "cache", entry.get("url"), 0.0, cached)
+                self._emit("tracks", tag=tag, query=query, tracks=cached)
+                self._set_search_status(f"Из кэша: {len(cached)} треков, обновляю...")
+
+        self._run_items([(0, query, kind, value)], count, on_done, browsers=1, on_delta=on_delta)
+        if not done:
+            raise RuntimeError("нет браузера с входом в ВК")
+        report = done["report"]
+        if report["error"]:
+            raise RuntimeError(report["error"])
+        self._emit("results", tag=tag, query=query, kind=kind, source=report["source"],
+                   count=len(done["tracks"]), elapsed=report["elapsed"])
+        return done["tracks"]
+
+    async def search(self, query: str, count: int = 30, tag=None) -> list[Track]:
+        return await self._call(self.collect, query, count, tag)
+
+    def collect_many(self, lines: list[str], count: int = 30, kind: str | None = None,
+                     browsers: int | None = None, http_workers: int | None = None,
+                     tag=None) -> dict:
+        """
+        Пакет строк (запросы, ссылки на плейлисты и профили; kind — все строки
+        этого типа, см. classify_query). Строки разбираются параллельно: кэш,
+        HTTP-поиск, браузеры (основной и фоновые, всего browsers).
+        После каждой строки — событие "item" (tag, index, done, total, report).
+        Возвращает {"stats": batch_stats(...), "items": [отчёт строки],
+        "orphaned": сколько строк не разобрал ни один браузер}.
+        """
+        reports: list[dict | None] = [None] * len(lines)
+        done_lock = threading.Lock()
+        done = [0]
+        t_start = time.perf_counter()
+
+        def finish(idx, line, item_kind, source, page_url, elapsed, tracks, error=None):
+            report = self._item_report(line, item_kind, source, page_url, elapsed, tracks, error)
+            reports[idx] = report
+            with done_lock:
+                done[0] += 1
+                n = done[0]
+            log_message(
+                f"INFO: BATCH [{n}/{len(lines)}] {item_kind} {line!r}: {len(tracks)} треков "
+                f"за {elapsed:.1f} с ({source}){' — ' + error if error else ''}"
+            )
+            self._set_search_status(f"Пакет: {n}/{len(lines)}...")
+            self._emit("item", tag=tag, index=idx, done=n, total=len(lines), report=report)
+
+        items = []
+        for idx, line in enumerate(lines):
+            item_kind, value = self.classify_query(line, kind)
+            if value is None:
+                finish(idx, line, item_kind, "none", None, 0.0, [],
+                       "не ссылка на плейлист" if item_kind == "pl" else "не ссылка на профиль")
+                continue
+            items.append((idx, line, item_kind, value))
+
+        self._run_items(items, count, finish, browsers=browsers, http_workers=http_workers)
+
+        # Строки, до которых не дошёл ни один браузер (сессия истекла, Chrome не запустился)
+        orphaned = 0
+        for idx, line, item_kind, _ in items:
+            if reports[idx] is None:
+                orphaned += 1
+                finish(idx, line, item_kind, "none", None, 0.0, [], "нет браузера с входом в ВК")
+        return {
+            "stats": self.batch_stats(reports, time.perf_counter() - t_start),
+            "items": reports,
+            "orphaned": orphaned,
+        }
+
+    async def search_many(self, lines: list[str], count: int = 30, kind: str | None = None,
+                          browsers: int | None = None, http_workers: int | None = None,
+                          tag=None) -> dict:
+        return await self._call(self.collect_many, lines, count, kind, browsers, http_workers, tag)
+
+    def collect_collection(self, query: str, tag=None,
+                           preview: int = COLLECTION_TABLE_ROWS) -> dict:
+        """
+        Режим «вся коллекция» для ссылки на плейлист или профиль: все треки
+        пишутся в _CollectionSpool (<COLLECTIONS_DIR>/<ключ>.jsonl), событиями
+        "tracks" отдаются только первые preview. Сначала постранично через
+        al_audio.php (продолжается с offset контрольной точки), при проверке ВК —
+        браузером в потоковом режиме: треки сразу уходят в файл, позиция в
+        списке попадает в контрольную точку, а строки до неё браузер не разбирает.
+        Возвращает {"count", "resumed", "shown", "elapsed", "rate", "path"};
+        без браузера с входом в ВК, если HTTP не выгрузил всё, — RuntimeError.
+        """
+        kind, value = self.classify_query(query)
+        if kind == "q":
+            raise RuntimeError("не ссылка на плейлист или профиль")
+        self._wait_for_main_browser()
+        spool = _CollectionSpool(COLLECTIONS_DIR, f"{kind}:{value}", COLLECTION_CHECKPOINT_EVERY)
+        shown = [0]
+
+        def show(tracks):
+            room = preview - shown[0]
+            if room > 0 and tracks:
+                part = list(tracks[:room])
+                shown[0] += len(part)
+                self._emit("tracks", tag=tag, query=query, tracks=part)
+
+        show(list(spool.iter_tracks(preview)))
+
+        t0 = time.perf_counter()
+        last_report = [0.0]
+
+        def progress():
+            elapsed = time.perf_counter() - t0
+            if elapsed - last_report[0] < 1.0:
+                return
+            last_report[0] = elapsed
+            rate = (spool.count - spool.resumed) / elapsed if elapsed else 0
+            self._set_search_status(f"Коллекция: {spool.count} треков, {rate:.0f} тр/с...")
+
+        def on_tracks(tracks, offset=None):
+            show(spool.add(tracks, offset))
+            progress()
+
+        if not self._page_collection_http(kind, value, spool, on_tracks):
+            if self._driver is None:
+                raise RuntimeError("нет браузера с входом в ВК")
+            log_message("INFO: коллекция: продолжаю через браузер")
+            collect = self._collect_playlist if kind == "pl" else self._collect_profile
+            with self._user_driver():
+                collect(value, 0, on_tracks, keep=False, start=spool.offset or 0)
+
+        spool.checkpoint(done=True)
+        elapsed = time.perf_counter() - t0
+        rate = (spool.count - spool.resumed) / elapsed if elapsed else 0
+        log_message(
+            f"INFO: коллекция {value}: {spool.count} треков "
+            f"(продолжено с {spool.resumed}) за {elapsed:.1f} с, {rate:.0f} тр/с → {spool.tracks_path}"
+        )
+        status = f"Коллекция: {spool.count} треков за {elapsed:.0f} с ({rate:.0f} тр/с)"
+        if spool.count > shown[0]:
+            status += f", в таблице первые {shown[0]}; все — в {spool.tracks_path}"
+        self._set_search_status(status)
+        return {
+            "count": spool.count,
+            "resumed": spool.resumed,
+            "shown": shown[0],
+            "elapsed": round(elapsed, 3),
+            "rate": round(rate, 1),
+            "path": spool.tracks_path,
+        }
+
+    async def load_collection(self, query: str, tag=None,
+                              preview: int = COLLECTION_TABLE_ROWS) -> dict:
+        return await self._call(self.collect_collection, query, tag, preview)
+
+    def resolve_url(self, full_id: str, page: str | None = None) -> str | None:
+        """
+        Ссылка на поток трека: из предзагрузки или кликом в основном браузере.
+        page — страница с этим треком, если браузер сейчас не на ней.
+        """
+        if page:
+            self._track_pages.setdefault(full_id, page)
+        url = self._take_prefetched_url(full_id)
+        if url:
+            log_message("DOWNLOAD intercept: ссылка из предзагрузки")
+            _metrics.observe("vk_resolve_seconds", 0, method="prefetch")
+            return url
+        with self._user_driver():
+            # Браузер одолжен подгрузкой — кликаем только на её странице
+            return self._get_audio_url_via_click(full_id, allow_navigate=not self._driver_lent)
+
+    async def resolve(self, full_id: str, page: str | None = None) -> str | None:
+        return await self._call(self.resolve_url, full_id, page)
+
+    def _resolve_in_pool(self, resolvers: Queue, full_id: str) -> str | None:
+        """Клик по треку свободным браузером пула; потерю входа пережидает один раз."""
+        driver = resolvers.get()
+        previous = getattr(self._local, "driver", None)
+        self._local.driver = driver
+        try:
+            url = self._get_audio_url_via_click(full_id)
+            if url is None and self._session_lost(driver, failed=True):
+                # Вход потерян: ждём обновлённую сессию и пробуем ещё раз
+                self._session_ok.wait()
+                self._resume_after_relogin(driver, is_main=False)
+                url = self._get_audio_url_via_click(full_id)
+            return url
+        finally:
+            self._local.driver = previous
+            resolvers.put(driver)
+
+    def _launch_resolvers(self, n: int) -> Queue | None:
+        """
+        Пул из n браузеров без окна для ссылок одного вызова download_many:
+        запускаются параллельно, в пул попадают только вошедшие в ВК.
+        Возвращает очередь браузеров или None, если не вошёл ни один.
+        """
+        if self._driver is not None:
+            # Фоновым браузерам нужны cookies из SESSION_FILE
+            with self._user_driver():
+                self._save_session()
+        resolvers = Queue()
+
+        def launch(i: int):
+            try:
+                driver = self._launch_driver(headless=True, use_profile=False)
+            except Exception as e:
+                log_message(f"WARNING: браузер #{i} не запустился: {e}")
+                return
+            if self._probe_session(driver):
+                log_message(f"INFO: браузер #{i} готов")
+                resolvers.put(driver)
+                return
+            log_message(f"WARNING: браузер #{i} не залогинен")
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+        threads = [threading.Thread(target=launch, args=(i,), daemon=True) for i in range(1, n + 1)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return resolvers if resolvers.qsize() else None
+
+    @staticmethod
+    def _quit_resolvers(resolvers: Queue | None):
+        while resolvers is not None:
+            try:
+                driver = resolvers.get_nowait()
+            except Empty:
+                break
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+    def _download_one(self, track, path: str, resolvers: Queue | None = None,
+                      batch: bool = False) -> tuple[str | None, str | None]:
+        """
+        Скачивает трек: предзагруженная или прямая ссылка, иначе ссылка через
+        браузер и yt-dlp. Возвращает (способ "click" | "direct", None)
+        или (None, причина неудачи).
+        resolvers — пул браузеров своего вызова download_many (вместо основного),
+        batch — трек пакета (без полосы прогресса в окне).
+        """
+        track = Track.from_row(track)
+        previous = getattr(self._local, "batch_download", False)
+        self._local.batch_download = batch
+        try:
+            # Готовая ссылка браузера не ждёт: он может быть занят подгрузкой результатов
+            url = self._take_prefetched_url(track.full_id) if track.full_id else None
+            if url:
+                log_message("DOWNLOAD intercept: ссылка из предзагрузки")
+                _metrics.observe("vk_resolve_seconds", 0, method="prefetch")
+                if self._download_m3u8_via_ytdlp(url, path):
+                    return "click", None
+            if track.url.startswith("http"):
+                if self._download_via_direct_url(track.url, path):
+                    return "direct", None
+                # Оборванный файл помешал бы yt-dlp
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            has_browser = self.driver is not None or resolvers is not None
+            if has_browser and track.full_id:
+                if self._download_via_browser_intercept(track.full_id, path, resolvers):
+                    return "click", None
+            if track.url.startswith("http"):
+                return None, "ошибка скачивания"
+            if not has_browser:
+                return None, "нет браузера с входом в ВК"
+            return None, "не удалось получить ссылку или скачать"
+        finally:
+            self._local.batch_download = previous
+
+    def download_track(self, track, path: str) -> bool:
+        """Скачивает трек: готовая ссылка, иначе ссылка через браузер и yt-dlp."""
+        return self._download_one(track, path)[0] is not None
+
+    async def download(self, track, path: str) -> bool:
+        return await self._call(self.download_track, track, path)
+
+    async def download_many(self, tracks, folder: str, concurrency: int | None = None,
+                            retries: int = DOWNLOAD_RETRIES, skip_existing: bool = False,
+                            pages: dict | None = None, browsers: int | None = None,
+                            tag=None) -> list[dict]:
+        """
+        Скачивает треки в папку, до concurrency одновременно: пока один файл
+        качается, браузер уже получает ссылку следующего. Файл не перезаписывается —
+        одноимённый получает « (1)»; skip_existing — уже скачанный файл пропускается,
+        а недокачанный удаляется (повторный запуск докачает только недостающее).
+        Неудачный трек повторяется до retries раз, оставшиеся неудачи сохраняются
+        в <папка>/failed_tracks.json.
+
+        pages — full_id → страница с треком (куда перейти для клика).
+        browsers — ссылки получает пул из стольких браузеров без окна
+        (событие "browsers" с числом вошедших в ВК), а не основной браузер.
+
+        После каждого трека — событие "download" (tag, done, total, ok, status,
+        via, full_id, path, error, elapsed, eta). Возвращает
+        [{"track", "path", "ok", "status", "via", "error", "attempts", "elapsed"}]
+        в порядке треков; status — "ok", "skipped" или "failed".
+        """
+        tracks = [Track.from_row(t) for t in tracks]
+        if pages:
+            self._track_pages.update(pages)
+        limit = asyncio.Semaphore(concurrency or DOWNLOAD_CONCURRENCY)
+        results: list[dict | None] = [None] * len(tracks)
+        taken: set[str] = set()
+        paths = [self._free_path(folder, t, f"track_{i}", taken, existing_ok=skip_existing)
+                 for i, t in enumerate(tracks, 1)]
+        started = time.time()
+        done = 0
+
+        async def one(i: int, track: Track, path: str):
+            nonlocal done
+            t0 = time.perf_counter()
+            via = error = None
+            attempt = 0
+            if skip_existing and os.path.exists(path):
+                status, via = "skipped", "exists"
+            else:
+                async with limit:
+                    reason = ""
+                    while via is None and attempt <= retries:
+                        if attempt:
+                            log_message(f"RETRY [{attempt}/{retries}]: {os.path.basename(path)}")
+                            _metrics.inc("vk_retries_total", stage="download", reason=reason)
+                            await asyncio.sleep(1)
+                        attempt += 1
+                        try:
+                            via, error = await self._call(
+                                self._download_one, track, path, resolvers, True
+                            )
+                            reason = "failed"
+                        except Exception as e:
+                            log_message(f"DOWNLOAD: ошибка {e}")
+                            error = str(e)
+                            reason = type(e).__name__
+                status = "ok" if via else "failed"
+                if not via and skip_existing:
+                    # Недокачанный файл следующий запуск принял бы за готовый
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            ok = status != "failed"
+            elapsed = round(time.perf_counter() - t0, 3)
+            done += 1
+            results[i] = {"track": track, "path": path, "ok": ok, "status": status, "via": via,
+                          "error": error, "attempts": attempt, "elapsed": elapsed}
+            log_message(
+                f"DOWNLOAD BATCH [{done}/{len(tracks)}]: "
+                f"{'успешно скачан' if via else 'пропущен' if ok else 'не удалось скачать'} "
+                f"{os.path.basename(path)}{' — ' + error if error and not ok else ''}"
+            )
+            wall = time.time() - started
+            self._emit("download", tag=tag, done=done, total=len(tracks), ok=ok, status=status,
+                       via=via, full_id=track.full_id, path=path, error=error if not ok else None,
+                       elapsed=elapsed, eta=wall / done * (len(tracks) - done))
+
+        # Свой пул браузеров у каждого вызова: параллельные download_many не делят его
+        resolvers = None
+        try:
+            if browsers and tracks:
+                if SELENIUM_AVAILABLE:
+                    resolvers = await self._call(self._launch_resolvers, min(browsers, len(tracks)))
+                self._emit("browsers", tag=tag, ready=resolvers.qsize() if resolvers else 0)
+            await asyncio.gather(*(one(i, t, p) for i, (t, p) in enumerate(zip(tracks, paths))))
+        finally:
+            self._quit_resolvers(resolvers)
+            self._write_metrics()
+
+        failed = [r["track"] for r in results if not r["ok"]]
+        failed_file_path = os.path.join(folder, "failed_tracks.json")
+        try:
+            if failed:
+                with open(failed_file_path, 'w', encoding='utf-8') as f:
+                    json.dump(
+                        [{"artist": t.artist, "title": t.title, "direct_url": t.url,
+                          "audio_full_id": t.full_id} for t in failed],
+                        f, ensure_ascii=False, indent=2
+                    )
+                log_message(f"DOWNLOAD BATCH: список неудачных треков сохранён в {failed_file_path}")
+            elif os.path.exists(failed_file_path):
+                os.remove(failed_file_path)
+        except OSError as e:
+            log_message(f"WARNING: не удалось обновить список неудачных треков: {e}")
+        return results
+
+    def prefetch(self, full_ids: list[str], front: bool = False):
+        """
+        Ставит треки в очередь предзагрузки ссылок (front — раньше остальных):
+        пока основной браузер простаивает, он заранее кликает их на текущей
+        странице. Без VK_SEARCH_PREFETCH=1 ничего не делает.
+        """
+        if not PREFETCH_ENABLED or not YTDLP_AVAILABLE:
+            return
+        full_ids = [fid for fid in full_ids if fid]
+        with self._prefetch_lock:
+            if front:
+                rest = [fid for fid in self._prefetch_wanted if fid not in full_ids]
+                self._prefetch_wanted = full_ids + rest
+            else:
+                self._prefetch_wanted = full_ids
+        if self._prefetch_thread is None:
+            self._prefetch_thread = threading.Thread(target=self._prefetch_loop, daemon=True)
+            self._prefetch_thread.start()
+        self._prefetch_wake.set()
+
+    @staticmethod
+    def safe_filename(artist: str, title: str, fallback: str) -> str:
+        """«Исполнитель - Название» без символов, запрещённых в именах файлов."""
+        base_name = f"{artist} - {title}".strip(" -") or fallback
+        return "".join(c for c in base_name if c not in '<>:"/\\|?*') or fallback
+
+    def _free_path(self, folder: str, track: Track, fallback: str, taken: set,
+                   existing_ok: bool = False) -> str:
+        """
+        Свободный путь <папка>/<имя>.mp3: если занят — «<имя> (1).mp3» и т.д.
+        existing_ok — файл на диске путь не занимает (его пропустят как скачанный).
+        """
+        name = self.safe_filename(track.artist.strip(), track.title.strip(), fallback)
+        path = os.path.join(folder, name + ".mp3")
+        counter = 1
+        while path in taken or (not existing_ok and os.path.exists(path)):
+            path = os.path.join(folder, f"{name} ({counter}).mp3")
+            counter += 1
+        taken.add(path)
+        return path
+
+    # --------------------------------------------------
+    # ЗАПУСК БРАУЗЕРА И ЛОГИН
+    # --------------------------------------------------
+
+    def open_session(self, interactive: bool = True, timeout: float = 300) -> bool:
+        """
+        Запускает основной браузер и ждёт входа в ВК (блокирует поток).
+
+        Быстрый старт: если есть сохранённый профиль/сессия, браузер сначала
+        поднимается без окна и одной проверкой убеждается, что вход ещё
+        действителен. Видимое окно открывается только для повторного логина
+        (interactive=False — вместо этого сразу False). False — вход не
+        дождались за timeout, окно браузера остаётся открытым.
+        Ошибка запуска браузера — исключение.
+        """
+        self._session_ready.clear()
+        try:
+            return self._open_session(interactive, timeout)
+        finally:
+            self._session_ready.set()
+
+    def start_session(self, interactive: bool = True, timeout: float = 300) -> Future:
+        """
+        open_session в пуле задач (окно поиска открывается, не дожидаясь браузера).
+        Поиск, начатый раньше, чем браузер запустится, ждёт его.
+        """
+        # Сбрасываем здесь, а не в задаче: поиск может начаться раньше, чем она
+        self._session_ready.clear()
+        return self.submit(self.open_session, interactive, timeout)
+
+    def wait_for_session(self, timeout: float | None = None) -> bool:
+        """Ждёт, пока open_session закончит запуск браузера. False — не дождались."""
+        return self._session_ready.wait(timeout)
+
+    def _wait_for_main_browser(self):
+        """Запрос пришёл, пока open_session запускает основной браузер: ждём его."""
+        if self._session_ready.is_set():
+            return
+        self._set_search_status(
+            "Браузер ВК ещё запускается — запрос выполнится, как только он будет готов"
+        )
+        self._session_ready.wait()
+        if self._driver is not None:
+            self._set_search_status("Браузер готов, выполняю запрос...")
+
+    def _open_session(self, interactive: bool, timeout: float) -> bool:
+        started = time.time()
+
+        if HEADLESS_WHEN_LOGGED_IN and self._has_saved_session():
+            log_message("INFO: найдена сохранённая сессия, быстрый старт без окна")
+            driver = self._launch_driver(headless=True)
+            if self._probe_session(driver):
+                self.driver = driver
+                self._driver_headless = True
+                self._save_session()
+                log_message(
+                    f"INFO: сессия действительна, браузер готов за "
+                    f"{time.time() - started:.1f} сек"
+                )
+                self._emit("session", logged_in=True)
+                return True
+            log_message("INFO: сохранённая сессия недействительна, нужен повторный вход")
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+        if not interactive:
+            self._emit("session", logged_in=False)
+            return False
+
+        log_message("INFO: запуск Selenium-браузера для ВК")
+        driver = self._launch_driver(headless=False)
+        self.driver = driver
+        self._driver_headless = False
+        driver.get("https://vk.com")
+        log_message("INFO: Браузер открыт, жду логина...")
+
+        logged_in = self._wait_for_login(timeout)
+        self._emit("session", logged_in=logged_in)
+        return logged_in
+
+    def _wait_for_login(self, timeout: float) -> bool:
+        """Проверяем раз в секунду, вошёл ли пользователь в открытом окне."""
+        interval = 1
+        waited = 0
+
+        while waited < timeout:
+            if self._is_logged_in():
+                log_message("INFO: ВК-вход обнаружен")
+                self._save_session()
+                self._apply_lean_blocking(self.driver)
+                return True
+            time.sleep(interval)
+            waited += interval
+
+        log_message("WARNING: не удалось автоматически определить логин в ВК за отведённое время")
+        return False
+
+    @property
+    def driver(self):
+        """Драйвер текущего потока: фоновый браузер пакета или основной."""
+        return getattr(self._local, "driver", None) or self._driver
+
+    @driver.setter
+    def driver(self, value):
+        self._driver = value
+
+    # Значение, записанное в этом потоке, иначе — последнее записанное любым
+    # (поток скачивания читает то, что оставил поток поиска)
+    @property
+    def _last_interface(self) -> str:
+        return getattr(self._local, "interface", self._shared_interface)
+
+    @_last_interface.setter
+    def _last_interface(self, value: str):
+        self._local.interface = self._shared_interface = value
+
+    @property
+    def _batch_download_mode(self) -> bool:
+        """Поток скачивает трек пакета download_many (флаг своего вызова, не движка)."""
+        return getattr(self._local, "batch_download", False)
+
+    @property
+    def _last_search_url(self) -> str | None:
+        return getattr(self._local, "search_url", self._shared_search_url)
+
+    @_last_search_url.setter
+    def _last_search_url(self, value: str | None):
+        self._local.search_url = self._shared_search_url = value
+
+    def _launch_driver(self, headless: bool = False, use_profile: bool = True):
+        """
+        Создаёт Chrome с постоянным профилем CHROME_PROFILE_DIR.
+        Если профиль занят другим экземпляром Chrome (или use_profile=False) —
+        запускает с временным профилем и восстанавливает cookies из SESSION_FILE.
+        """
+        def build_options(use_profile: bool):
+            options = webdriver.ChromeOptions()
+            if headless:
+                options.add_argument("--headless=new")
+                options.add_argument("--window-size=1920,1080")
+                # Без окна нет жеста пользователя — разрешаем воспроизведение по клику из JS
+                options.add_argument("--autoplay-policy=no-user-gesture-required")
+            else:
+                options.add_argument("--start-maximized")
+            if use_profile:
+                os.makedirs(CHROME_PROFILE_DIR, exist_ok=True)
+                options.add_argument(f"--user-data-dir={CHROME_PROFILE_DIR}")
+            options.add_argument("--disable-blink-features=AutomationControlled")
+            options.add_argument(f"user-agent={_USER_AGENT}")
+
+            # Включаем performance logging для перехвата сетевых запросов
+            options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+            if LEAN_MODE:
+                options.page_load_strategy = "eager"
+            return options
+
+        def start(options):
+            started = time.time()
+            cached_path = self._driver_paths.get()
+            if cached_path:
+                try:
+                    driver = webdriver.Chrome(service=Service(cached_path), options=options)
+                    log_message(
+                        f"INFO: Chrome запущен за {time.time() - started:.1f} сек "
+                        f"(ChromeDriver из кэша)"
+                    )
+                    return driver
+                except Exception as e:
+                    # Занятый профиль и т.п. — не вина драйвера, решает вызывающий
+                    if "version" not in str(e).lower():
+                        raise
+                    log_message(f"WARNING: сохранённый ChromeDriver не подходит к Chrome: {e}")
+                    _metrics.inc("vk_retries_total", stage="driver", reason="version")
+                    self._driver_paths.forget()
+
+            try:
+                driver_path = ChromeDriverManager().install()
+                driver = webdriver.Chrome(service=Service(driver_path), options=options)
+            except Exception as e:
+                log_message(
+                    f"WARNING: ChromeDriverManager не сработал: {e}, "
+                    f"пробую webdriver.Chrome() по умолчанию"
+                )
+                driver = webdriver.Chrome(options=options)
+                driver_path = getattr(driver.service, "path", None)
+            log_message(f"INFO: Chrome запущен за {time.time() - started:.1f} сек")
+            self._driver_paths.put(driver_path, (driver.capabilities or {}).get("browserVersion"))
+            return driver
+
+        driver = None
+        if use_profile:
+            try:
+                driver = start(build_options(use_profile=True))
+            except Exception as e:
+                log_message(f"WARNING: не удалось открыть профиль {CHROME_PROFILE_DIR}: {e}")
+
+        if driver is None:
+            driver = start(build_options(use_profile=False))
+            self._restore_saved_cookies(driver)
+        if headless:
+            self._apply_lean_blocking(driver)
+        return driver
+
+    @staticmethod
+    def _apply_lean_blocking(driver):
+        """Блокирует LEAN_BLOCKED_URLS через CDP (действует до закрытия браузера)."""
+        if not LEAN_MODE:
+            return
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URLS})
+            log_message(f"INFO: облегчённый режим: блокируется шаблонов URL: {len(LEAN_BLOCKED_URLS)}")
+        except Exception as e:
+            log_message(f"WARNING: не удалось включить блокировку ресурсов: {e}")
+
+    def _navigate(self, url: str):
+        """
+        driver.get() с замером: сколько вернулся get() и тайминги документа
+        (Navigation Timing: DOMContentLoaded, load — 0, если ещё не наступил).
+        """
+        t0 = time.perf_counter()
+        self.driver.get(url)
+        get_ms = (time.perf_counter() - t0) * 1000
+        _metrics.observe("vk_navigation_seconds", get_ms / 1000, phase="get")
+        try:
+            timing = self.driver.execute_script("""
+                var n = performance.getEntriesByType('navigation')[0];
+                if (!n) return null;
+                return [Math.round(n.domContentLoadedEventEnd), Math.round(n.loadEventEnd),
+                        performance.getEntriesByType('resource').length];
+            """)
+        except Exception:
+            timing = None
+        if timing:
+            dcl_ms, load_ms, resources = timing
+            if dcl_ms:
+                _metrics.observe("vk_navigation_seconds", dcl_ms / 1000, phase="dom_content_loaded")
+            if load_ms:
+                _metrics.observe("vk_navigation_seconds", load_ms / 1000, phase="load")
+            log_message(
+                f"NAV: {url} — get() {get_ms:.0f} мс, DOMContentLoaded {dcl_ms} мс, "
+                f"load {load_ms or '—'} мс, ресурсов {resources} "
+                f"({'облегчённый' if LEAN_MODE else 'полный'} режим)"
+            )
+        else:
+            log_message(f"NAV: {url} — get() {get_ms:.0f} мс")
+
+    def _has_saved_session(self) -> bool:
+        """Был ли хоть один удачный вход (сессия сохраняется после логина)."""
+        return os.path.isfile(SESSION_FILE)
+
+    def _probe_session(self, driver) -> bool:
+        """
+        Одна дешёвая проверка сохранённой сессии: открываем ленту и смотрим,
+        не перекинуло ли на страницу входа. Для гостя /feed всегда уходит на логин.
+        """
+        try:
+            driver.get("https://vk.com/feed")
+            url = driver.current_url or ""
+            if "/login" in url or "/join" in url or "id.vk.com" in url:
+                return False
+            if not re.search(r'vk\.com/feed', url):
+                return False
+        except Exception as e:
+            log_message(f"WARNING: проверка сессии не удалась: {e}")
+            return False
+
+        # Страница уже загружена — даём SPA пару секунд отрисовать шапку
+        for _ in range(10):
+            state = self._session_state(driver)
+            if state == "logged_in":
+                return True
+            if state != "unknown":
+                return False
+            time.sleep(0.25)
+        return False
+
+    def _save_session(self):
+        """Сохраняет cookies текущей сессии ВК в SESSION_FILE."""
+        if self.driver is None:
+            return
+        try:
+            cookies = self.driver.get_cookies()
+            if not cookies:
+                return
+            # id пользователя — для HTTP-поиска без браузера (vk_cli.py)
+            try:
+                user_id = self.driver.execute_script(
+                    "try { return (window.vk && window.vk.id) || null } catch(e) { return null }"
+                )
+            except Exception:
+                user_id = None
+            os.makedirs(APP_DATA_DIR, exist_ok=True)
+            tmp_path = SESSION_FILE + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(
+                    {"saved_at": time.time(), "user_id": user_id, "cookies": cookies},
+                    f, ensure_ascii=False
+                )
+            try:
+                os.chmod(tmp_path, 0o600)
+            except Exception:
+                pass
+            os.replace(tmp_path, SESSION_FILE)
+            log_message(f"INFO: сессия сохранена ({len(cookies)} cookies)")
+        except Exception as e:
+            log_message(f"WARNING: не удалось сохранить сессию: {e}")
+
+    def _restore_saved_cookies(self, driver):
+        """Подкладывает cookies из SESSION_FILE в браузер с временным профилем."""
+        try:
+            with open(SESSION_FILE, 'r', encoding='utf-8') as f:
+                cookies = json.load(f).get("cookies") or []
+        except Exception:
+            return
+        if not cookies:
+            return
+        try:
+            # Cookies можно добавить только находясь на домене
+            driver.get("https://vk.com/robots.txt")
+            restored = 0
+            for cookie in cookies:
+                if cookie.get('sameSite') not in (None, 'Strict', 'Lax', 'None'):
+                    cookie = {k: v for k, v in cookie.items() if k != 'sameSite'}
+                try:
+                    driver.add_cookie(cookie)
+                    restored += 1
+                except Exception:
+                    continue
+            log_message(f"INFO: восстановлено cookies из сохранённой сессии: {restored}")
+        except Exception as e:
+            log_message(f"WARNING: не удалось восстановить cookies: {e}")
+
+    # Все признаки входа проверяются в странице одним вызовом execute_script.
+    # Возвращает {"state": "logged_in" | "logged_out" | "challenge" | "unknown",
+    # "signal": что сработало}. unknown — признаков нет, страница ещё грузится
+    _SESSION_PROBE_JS = """
+        var href = location.href;
+        if (/\\/(login|join)([\\/?#]|$)|id\\.vk\\.com/.test(href))
+            return {state: 'logged_out', signal: 'url'};
+        if (/challenge|captcha/.test(location.pathname))
+            return {state: 'challenge', signal: 'url'};
+        try {
+            if (window.vk && window.vk.id) return {state: 'logged_in', signal: 'vk.id'};
+        } catch (e) {}
+        var selectors = arguments[0];
+        for (var i = 0; i < selectors.length; i++) {
+            if (document.querySelector(selectors[i]))
+                return {state: 'logged_in', signal: selectors[i]};
+        }
+        if (document.querySelector(arguments[1]))
+            return {state: 'logged_out', signal: 'login_form'};
+        return {state: 'unknown', signal: document.readyState};
+    """
+    # data-testid (актуальные на 2025–2026), затем старые селекторы как запасной вариант
+    _LOGGED_IN_SELECTORS = [
+        "[data-testid='header-profile-menu']",
+        "[data-testid='header-profile-menu-button']",
+        "[data-testid='leftmenu']",
+        "[data-testid='header-notification-button']",
+        "a#top_profile_link",
+        "a.top_profile_link",
+        "a.TopNavBtn__profileLink",
+        "div#side_bar",
+        "nav.left_menu_nav_wrap",
+    ]
+    # Форма входа на главной для гостя
+    _LOGIN_FORM_SELECTOR = "#index_email, form.VkIdForm, [data-testid='enter-another-way']"
+
+    def _session_state(self, driver=None) -> str:
+        """Состояние входа в ВК на текущей странице — за один запрос к браузеру."""
+        driver = driver or self.driver
+        if driver is None:
+            return "unknown"
+        try:
+            result = driver.execute_script(
+                self._SESSION_PROBE_JS, self._LOGGED_IN_SELECTORS, self._LOGIN_FORM_SELECTOR
+            ) or {}
+        except Exception as e:
+            log_message(f"WARNING: ошибка при проверке логина: {e}")
+            return "unknown"
+        state = result.get("state") or "unknown"
+        log_message("DEBUG: проверка входа: %s (%s)", state, result.get('signal'))
+        return state
+
+    def _is_logged_in(self, driver=None) -> bool:
+        """Проверяем, что пользователь залогинен в ВК."""
+        return self._session_state(driver) == "logged_in"
+
+    # --------------------------------------------------
+    # СТОРОЖ СЕССИИ В ПАКЕТЕ
+    # --------------------------------------------------
+
+    def _session_lost(self, driver, failed: bool) -> bool:
+        """
+        Проверка после строки пакета в потоке браузера driver. True — вход
+        потерян (страница входа или проверка ВК): пакет поставлен на паузу
+        до повторного входа, строку нужно повторить.
+        """
+        if self._relogin_gave_up:
+            return False
+        now = time.monotonic()
+        if not failed and now - getattr(self._local, "session_checked", 0) < SESSION_WATCHDOG_INTERVAL:
+            return False
+        self._local.session_checked = now
+        state = self._session_state(driver)
+        if state not in ("logged_out", "challenge"):
+            return False
+
+        with self._session_watch_lock:
+            if not self._session_ok.is_set():
+                return True  # паузу уже поставил другой браузер
+            self._session_ok.clear()
+        reason = "проверка ВК" if state == "challenge" else "выход из ВК"
+        if self.relogin_interactive:
+            hint = "войди заново в окне браузера"
+        else:
+            hint = "войди заново через python vk_search.py"
+        log_message(f"WARNING: BATCH: потерян вход ({reason}) — пауза, {hint}; пакет продолжится сам")
+        self._set_search_status(f"Пакет на паузе: {reason}, {hint}")
+        self._emit("session", logged_in=False, reason=state)
+        threading.Thread(target=self._relogin_watch, daemon=True, name="vk-relogin").start()
+        return True
+
+    def _relogin_watch(self):
+        """Ждёт повторного входа в ВК и снимает пакет с паузы."""
+        paused_at = time.time()
+        logged_in = False
+        try:
+            if self.relogin_interactive and self._driver is not None:
+                with self._driver_lock:
+                    if self._driver_headless:
+                        # Основной браузер без окна: для входа нужен видимый
+                        try:
+                            self._driver.quit()
+                        except Exception:
+                            pass
+                        self.driver = self._launch_driver(headless=False)
+                        self._driver_headless = False
+                    self._driver.get("https://vk.com")
+                logged_in = self._wait_for_login(SESSION_RELOGIN_TIMEOUT)
+            else:
+                # Без окна: ждём, пока сессию обновят в SESSION_FILE
+                while time.time() - paused_at < SESSION_RELOGIN_TIMEOUT:
+                    try:
+                        if os.path.getmtime(SESSION_FILE) > paused_at:
+                            logged_in = True
+                            break
+                    except OSError:
+                        pass
+                    time.sleep(2)
+        except Exception as e:
+            log_message(f"ERROR: BATCH: повторный вход не удался: {e}")
+
+        if logged_in:
+            log_message(f"INFO: BATCH: вход восстановлен за {time.time() - paused_at:.0f} сек, продолжаю")
+            self._set_search_status("Вход восстановлен, пакет продолжается...")
+        else:
+            # Дальше строки пакета просто завершатся ошибкой
+            self._relogin_gave_up = True
+            log_message("ERROR: BATCH: вход в ВК не восстановлен, продолжаю без проверки сессии")
+        self._emit("session", logged_in=logged_in)
+        self._session_ok.set()
+
+    def _resume_after_relogin(self, driver, is_main: bool):
+        """
+        Браузер пакета после паузы: основной мог смениться, фоновым нужны
+        новые cookies. Вызывается внутри задачи, поставившей _local.driver, —
+        она же его и снимает.
+        """
+        if is_main:
+            driver = self._driver
+            self._local.driver = driver
+        elif not self._relogin_gave_up:
+            self._restore_saved_cookies(driver)
+        self._local.session_checked = time.monotonic()
+        return driver
+
+    @staticmethod
+    def _record_download(method: str, path: str, seconds: float, ok: bool):
+        """Метрики одного скачивания: размер — по сохранённому файлу (.mp3 или .ts)."""
+        _metrics.inc("vk_downloads_total", method=method, result="ok" if ok else "failed")
+        _metrics.observe("vk_download_seconds", seconds, method=method)
+        if not ok:
+            return
+        size = 0
+        for candidate in (path, path.rsplit('.', 1)[0] + '.ts'):
+            try:
+                size = os.path.getsize(candidate)
+                break
+            except OSError:
+                continue
+        if size:
+            _metrics.inc("vk_download_bytes_total", size, method=method)
+            if seconds > 0:
+                _metrics.observe("vk_download_rate_bytes_per_second", size / seconds, method=method)
+
+    @_metered_download
+    def _download_m3u8_silent(self, url: str, path: str) -> bool:
+        """
+        Скачивает аудио без обновления UI (для параллельного скачивания).
+        """
+        is_m3u8 = 'index.m3u8' in url or '.m3u8' in url
+
+        if is_m3u8:
+            try:
+                output_path = path
+                if output_path.lower().endswith('.mp3'):
+                    output_path = output_path[:-4]
+
+                cmd = [
+                    'yt-dlp',
+                    '--no-warnings',
+                    '--quiet',  # Тихий режим
+                    '-o', output_path + '.%(ext)s',
+                    '-x',
+                    '--audio-format', 'mp3',
+                    '--audio-quality', '0',
+                    url
+                ]
+
+                result = subprocess.run(
+                    cmd,
+                    capture_output=True,
+                    text=True,
+                    timeout=180,  # 3 минуты таймаут
+                    creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+                )
+
+                return result.returncode == 0
+
+            except subprocess.TimeoutExpired:
+                log_message(f"DOWNLOAD: таймаут для {path}")
+                return False
+            except Exception as e:
+                log_message(f"DOWNLOAD: ошибка {e}")
+                return False
+        else:
+            # Прямая ссылка - качаем через requests
+            return self._download_via_direct_url(url, path)
+
+    # ---- ПРЕДЗАГРУЗКА ССЫЛОК ----
+    @contextmanager
+    def _user_driver(self):
+        """
+        Основной браузер для действия пользователя (поиск, скачивание):
+        предзагрузка сразу бросает текущий клик и не начинает новых.
+        """
+        with self._user_driver_count_lock:
+            self._user_driver_waiting += 1
+        depth = getattr(self._local, "user_driver_depth", 0)
+        try:
+            with self._driver_lock:
+                self._local.user_driver_depth = depth + 1
+                try:
+                    yield
+                finally:
+                    self._local.user_driver_depth = depth
+        finally:
+            with self._user_driver_count_lock:
+                self._user_driver_waiting -= 1
+            self._last_user_driver_use = time.monotonic()
+
+    def _yield_driver(self):
+        """
+        Шаг долгой подгрузки в основном браузере: если браузер ждёт другое
+        действие пользователя (скачивание уже показанной строки), отдаёт его
+        на время клика. Ждущий не уходит со страницы (_driver_lent), так что
+        подгрузка продолжается с того же места.
+        """
+        depth = getattr(self._local, "user_driver_depth", 0)
+        if not depth or self.driver is not self._driver or self._user_driver_waiting <= depth:
+            return
+        log_message("DEBUG: подгрузка уступает браузер скачиванию")
+        self._driver_lent = True
+        for _ in range(depth):
+            self._driver_lock.release()
+        try:
+            deadline = time.monotonic() + DRIVER_YIELD_MAX_SEC
+            while self._user_driver_waiting > depth and time.monotonic() < deadline:
+                time.sleep(0.05)
+        finally:
+            for _ in range(depth):
+                self._driver_lock.acquire()
+            self._driver_lent = False
+
+    def _take_prefetched_url(self, audio_full_id: str) -> str | None:
+        """Забирает свежую предзагруженную ссылку (одноразово)."""
+        with self._prefetch_lock:
+            entry = self._prefetched.pop(audio_full_id, None)
+        if entry is None or time.time() - entry[0] > PREFETCH_TTL:
+            return None
+        return entry[1]
+
+    def _user_needs_driver(self) -> bool:
+        return self._user_driver_waiting > 0
+
+    def _prefetch_loop(self):
+        """
+        Фоновый поток: пока браузер простаивает, кликает треки из очереди
+        на текущей странице и запоминает ссылки на поток.
+        """
+        while True:
+            self._prefetch_wake.wait()
+            self._prefetch_wake.clear()
+            while self.driver is not None:
+                with self._prefetch_lock:
+                    now = time.time()
+                    for fid in [f for f, (ts, _) in self._prefetched.items() if now - ts > PREFETCH_TTL]:
+                        del self._prefetched[fid]
+                    wanted = [f for f in self._prefetch_wanted if f not in self._prefetched]
+                    self._prefetch_wanted = wanted
+                if not wanted:
+                    break
+
+                idle_for = time.monotonic() - self._last_user_driver_use
+                if self._user_needs_driver() or idle_for < PREFETCH_IDLE_SEC:
+                    time.sleep(max(0.2, PREFETCH_IDLE_SEC - idle_for))
+                    continue
+                if not self._driver_lock.acquire(blocking=False):
+                    time.sleep(0.5)
+                    continue
+                fid = wanted[0]
+                try:
+                    url = self._get_audio_url_via_click(
+                        fid, allow_navigate=False, should_abort=self._user_needs_driver
+                    )
+                finally:
+                    self._driver_lock.release()
+
+                with self._prefetch_lock:
+                    if url:
+                        self._prefetched[fid] = (time.time(), url)
+                        log_message(f"PREFETCH: ссылка для {fid} готова")
+                    if not self._user_needs_driver() and fid in self._prefetch_wanted:
+                        # Не получилось (нет на странице и т.п.) — не повторяем
+                        self._prefetch_wanted.remove(fid)
+
+    def _download_via_browser_intercept(self, audio_full_id: str, path: str,
+                                        resolvers: Queue | None = None) -> bool:
+        """
+        Кликает на трек в браузере, перехватывает m3u8 URL через Performance Log,
+        затем скачивает через yt-dlp. resolvers — кликает свободный браузер этого пула.
+        """
+        try:
+            self._set_search_status("Получаю ссылку на аудио...")
+            log_message(f"DOWNLOAD intercept: audio_id={audio_full_id}")
+
+            # Ссылка из предзагрузки или клик по треку на странице
+            if resolvers is not None:
+                m3u8_url = self._resolve_in_pool(resolvers, audio_full_id)
+            else:
+                m3u8_url = self.resolve_url(audio_full_id)
+
+            if not m3u8_url:
+                log_message("DOWNLOAD intercept: не удалось получить m3u8 URL")
+                return False
+
+            log_message(f"DOWNLOAD intercept: got URL: {m3u8_url[:80]}...")
+
+            # Скачиваем через yt-dlp
+            return self._download_m3u8_via_ytdlp(m3u8_url, path)
+
+        except Exception as e:
+            log_message(f"DOWNLOAD intercept failed: {e}")
+            return False
+
+    def _find_audio_element(self, audio_full_id: str):
+        """
+        Ищет строку трека на текущей странице.
+        Возвращает (элемент или None, это новый интерфейс).
+        """
+        audio_element = None
+        use_new_interface = False
+
+        # Старый интерфейс: div.audio_row[data-full-id="..."]
+        try:
+            audio_element = self.driver.find_element(
+                By.CSS_SELECTOR, f'div.audio_row[data-full-id="{audio_full_id}"]'
+            )
+        except Exception:
+            # Пробуем найти по data-audio атрибуту
+            rows = self.driver.find_elements(By.CSS_SELECTOR, 'div.audio_row')
+            for row in rows:
+                try:
+                    data_audio = row.get_attribute('data-audio')
+                    if data_audio and audio_full_id in data_audio:
+                        audio_element = row
+                        break
+                except Exception:
+                    continue
+
+        # Новый интерфейс: [data-testentitytag="audio"] — ищем по индексу из JS Map
+        if not audio_element:
+            try:
+                idx = self.driver.execute_script("""
+                    var target = arguments[0];
+                    var rows = document.querySelectorAll('[data-testentitytag="audio"]');
+                    if (!rows.length) return -1;
+                    var fk = Object.keys(rows[0]).find(function(k){ return k.startsWith('__reactFiber'); });
+                    if (!fk) return -1;
+                    var tp = rows[0][fk].memoizedProps.track.entity.trackProvider;
+                    var ids = [];
+                    tp.entities.data_.forEach(function(v, k){ ids.push(k); });
+                    return ids.indexOf(target);
+                """, audio_full_id)
+                if idx is not None and idx >= 0:
+                    new_rows = self.driver.find_elements(By.CSS_SELECTOR, '[data-testentitytag="audio"]')
+                    if idx < len(new_rows):
+                        audio_element = new_rows[idx]
+                        use_new_interface = True
+            except Exception:
+                pass
+
+        return audio_element, use_new_interface
+
+    def _get_audio_url_via_click(self, audio_full_id: str, allow_navigate: bool = True,
+                                 should_abort=None) -> str | None:
+        """
+        Кликает на трек и получает URL аудио из сетевых запросов.
+        allow_navigate=False — не уходить с текущей страницы (предзагрузка).
+        should_abort() → True — бросить ожидание и вернуть None.
+        """
+        t0 = time.perf_counter()
+        self._local.resolve_method = "failed"
+        url = self._click_for_audio_url(audio_full_id, allow_navigate, should_abort)
+        method = self._local.resolve_method if url or self._local.resolve_method == "aborted" else "failed"
+        _metrics.observe("vk_resolve_seconds", time.perf_counter() - t0, method=method)
+        return url
+
+    def _click_for_audio_url(self, audio_full_id: str, allow_navigate: bool,
+                             should_abort) -> str | None:
+        if not self.driver:
+            return None
+
+        try:
+            # Включаем перехват сетевых запросов через CDP
+            self.driver.execute_cdp_cmd('Network.enable', {})
+
+            # Очищаем историю запросов
+            self.driver.execute_cdp_cmd('Network.clearBrowserCache', {})
+
+            audio_element, use_new_interface = self._find_audio_element(audio_full_id)
+
+            # Результаты получены не с открытой страницы (HTTP-поиск, кэш, пакет) —
+            # открываем страницу, с которой они были, и ищем ещё раз
+            page_url = self._track_pages.get(audio_full_id) or self._last_search_url
+            if (not audio_element and allow_navigate and page_url
+                    and self.driver.current_url != page_url):
+                log_message(f"DOWNLOAD: открываю страницу результатов {page_url}")
+                self._navigate(page_url)
+                try:
+                    WebDriverWait(self.driver, 10).until(
+                        lambda d: d.find_elements(
+                            By.CSS_SELECTOR, 'div.audio_row, [data-testentitytag="audio"]'
+                        )
+                    )
+                except Exception:
+                    pass
+                audio_element, use_new_interface = self._find_audio_element(audio_full_id)
+
+            if not audio_element:
+                log_message(f"DOWNLOAD: не найден элемент трека {audio_full_id}")
+                return None
+
+            # Инъектируем перехватчик XHR/fetch/audio ДО клика
+            try:
+                self.driver.execute_script("""
+                    window.__vk_al_audio_response = null;
+                    window.__vk_audio_stream_url = null;
+
+                    // Сохранить URL аудиопотока (только реальные HTTP-ссылки на аудио)
+                    function _vkCaptureStream(u) {
+                        if (!window.__vk_audio_stream_url && u &&
+                            !u.startsWith('data:') && !u.startsWith('blob:') &&
+                            (u.indexOf('vkuseraudio') !== -1 || u.indexOf('.m3u8') !== -1)) {
+                            window.__vk_audio_stream_url = u;
+                        }
+                    }
+
+                    if (!window.__vk_xhr_patched) {
+                        window.__vk_xhr_patched = true;
+                        var _origOpen = XMLHttpRequest.prototype.open;
+                        var _origSend = XMLHttpRequest.prototype.send;
+                        XMLHttpRequest.prototype.open = function(method, url) {
+                            this._vkUrl = url || '';
+                            return _origOpen.apply(this, arguments);
+                        };
+                        XMLHttpRequest.prototype.send = function() {
+                            var xhr = this;
+                            _vkCaptureStream(xhr._vkUrl);
+                            this.addEventListener('load', function() {
+                                if (xhr._vkUrl.indexOf('al_audio.php') !== -1) {
+                                    window.__vk_al_audio_response = xhr.responseText;
+                                }
+                                _vkCaptureStream(xhr._vkUrl);
+                            });
+                            return _origSend.apply(this, arguments);
+                        };
+                    }
+                    if (!window.__vk_fetch_patched) {
+                        window.__vk_fetch_patched = true;
+                        var _origFetch = window.fetch;
+                        window.fetch = function(input, init) {
+                            var url = typeof input === 'string' ? input : (input ? input.url : '');
+                            _vkCaptureStream(url);
+                            return _origFetch.apply(window, arguments).then(function(resp) {
+                                if (url && url.indexOf('al_audio.php') !== -1) {
+                                    resp.clone().text().then(function(t) {
+                                        window.__vk_al_audio_response = t;
+                                    }).catch(function(){});
+                                }
+                                return resp;
+                            });
+                        };
+                    }
+                """)
+            except Exception:
+                pass
+
+            # Кликаем на кнопку воспроизведения
+            if use_new_interface:
+                try:
+                    play_btn = audio_element.find_element(
+                        By.CSS_SELECTOR, '[data-testid="MusicTrackRow_PlaybackControls"]'
+                    )
+                    self.driver.execute_script("arguments[0].click();", play_btn)
+                except Exception:
+                    self.driver.execute_script("arguments[0].click();", audio_element)
+            else:
+                try:
+                    play_btn = audio_element.find_element(
+                        By.CSS_SELECTOR, '.audio_play_wrap, .audio_row__play_btn, .audio_row__cover'
+                    )
+                    self.driver.execute_script("arguments[0].click();", play_btn)
+                except Exception:
+                    self.driver.execute_script("arguments[0].click();", audio_element)
+
+            log_message("DOWNLOAD: кликнули на трек, ждём загрузки URL...")
+
+            # Ждём URL: stream_url (приоритет), JS globals, ответ al_audio.php
+            audio_url = None
+            stream_url = None
+            al_response = None
+            aborted = False
+            for i in range(20):  # 20 * 0.3 = 6 сек максимум
+                time.sleep(0.3)
+                if should_abort is not None and should_abort():
+                    aborted = True
+                    break
+
+                # Приоритет 1: реальный URL аудиопотока (уже расшифрованный VK'ом)
+                if not stream_url:
+                    stream_url = self.driver.execute_script(
+                        "return window.__vk_audio_stream_url;"
+                    )
+
+                # Приоритет 2: ответ al_audio.php (нужно декодировать)
+                if not al_response:
+                    al_response = self.driver.execute_script(
+                        "return window.__vk_al_audio_response;"
+                    )
+
+                # Приоритет 3: JS globals (window.ap, HTML5 audio)
+                if not audio_url:
+                    audio_url = self.driver.execute_script("""
+                        try {
+                            if (window.ap && window.ap._impl) {
+                                var impl = window.ap._impl;
+                                if (impl._currentAudio && impl._currentAudio.url) return impl._currentAudio.url;
+                                if (impl.currentAudio && impl.currentAudio.url) return impl.currentAudio.url;
+                            }
+                        } catch(e) {}
+                        try {
+                            if (typeof getAudioPlayer === 'function') {
+                                var p = getAudioPlayer();
+                                if (p) {
+                                    if (p._impl && p._impl._currentAudio) return p._impl._currentAudio.url;
+                                    if (p.getCurrentAudio) { var a = p.getCurrentAudio(); if (a && a.url) return a.url; }
+                                }
+                            }
+                        } catch(e) {}
+                        try {
+                            var audioEl = document.querySelector('audio');
+                            if (audioEl && audioEl.src && audioEl.src.length > 10) return audioEl.src;
+                        } catch(e) {}
+                        return null;
+                    """)
+
+                # Прерываем только если нашли реальный URL (stream_url / audio_url)
+                # al_response мало — VK ещё не успел расшифровать URL и сделать запрос на поток
+                if stream_url or audio_url:
+                    log_message(f"DOWNLOAD: stream/player URL получен за {(i + 1) * 0.3:.1f} сек")
+                    break
+                if al_response and not stream_url and i == 19:
+                    log_message("DOWNLOAD: stream URL не появился за 6 сек, используем al_response")
+
+            # Останавливаем воспроизведение
+            try:
+                self.driver.execute_script("""
+                    try { if (window.ap && window.ap.pause) window.ap.pause(); } catch(e) {}
+                    try { var audio = document.querySelector('audio'); if (audio) audio.pause(); } catch(e) {}
+                """)
+            except Exception:
+                pass
+
+            if aborted:
+                log_message(f"PREFETCH: прервано ради действия пользователя ({audio_full_id})")
+                self._local.resolve_method = "aborted"
+                return None
+
+            # Способ 1: прямой URL аудиопотока (VK уже расшифровал)
+            self._local.resolve_method = "click"
+            if stream_url:
+                log_message(f"DOWNLOAD: stream URL перехвачен: {stream_url[:120]}")
+                return stream_url
+
+            # Способ 2: URL из JS globals (window.ap / HTML5 audio)
+            if audio_url:
+                log_message(f"DOWNLOAD: URL из JS globals: {audio_url[:80]}...")
+                return audio_url
+
+            # Способ 2: URL из тела ответа al_audio.php
+            self._local.resolve_method = "al_audio"
+            if al_response:
+                log_message(f"DOWNLOAD: ответ al_audio.php ({len(al_response)} байт): {al_response[:300]}")
+                import re as _re
+                # Убираем JSON-экранирование \/ → / перед поиском
+                al_clean = al_response.replace('\\/', '/')
+                for pat in [
+                    r'https?://[^\s"\',\[\]{}]+index\.m3u8',
+                    r'https?://vkuseraudio\.net[^\s"\',\[\]{}]+',
+                    r'https?://[^\s"\',\[\]{}]+\.m3u8',
+                    r'https?://[^\s"\',\[\]{}]+audio_api_unavailable\.mp3\?extra=[^\s"\',\[\]{}]+',
+                    r'https?://[^\s"\',\[\]{}]+\.mp3',
+                ]:
+                    m = _re.search(pat, al_clean)
+                    if m:
+                        url_found = m.group(0)
+                        if 'audio_api_unavailable' in url_found:
+                            url_decoded = self._decode_vk_audio_url(url_found)
+                            if url_decoded != url_found:
+                                log_message(f"DOWNLOAD: декодирован URL: {url_decoded[:120]}")
+                                return url_decoded
+                            log_message(f"DOWNLOAD: decode не удался, пробуем другие паттерны")
+                            continue
+                        log_message(f"DOWNLOAD: URL из al_audio.php: {url_found[:80]}")
+                        return url_found
+                log_message("DOWNLOAD: URL не найден в ответе al_audio.php (неизвестный формат)")
+
+            log_message("DOWNLOAD intercept: не удалось получить URL")
+            return None
+
+        except Exception as e:
+            log_message(f"ERROR _get_audio_url_via_click: {e}")
+            return None
+
+    @staticmethod
+    def _decode_vk_audio_url(url: str) -> str:
+        """Декодирует audio_api_unavailable.mp3?extra=... VK obfuscated audio URL.
+
+        Алгоритм: base64url-декодирует параметр extra, получает строку вида
+        real_url[TAB op1 TAB op2 ...], применяет операции i(pos,code), s(a,b), r.
+        """
+        import base64
+        import re as _re
+
+        if not url or 'audio_api_unavailable' not in url:
+            return url
+
+        try:
+            parts_extra = url.split('?extra=')
+            if len(parts_extra) < 2:
+                return url
+            extra = parts_extra[1].split('#')[0]
+
+            def b64_decode(s):
+                s = s.replace('-', '+').replace('_', '/')
+                s += '=' * (-len(s) % 4)
+                return base64.b64decode(s).decode('utf-8', errors='replace')
+
+            decoded = b64_decode(extra)
+            log_message(f"DECODE: extra→ {repr(decoded[:120])}")
+
+            parts = decoded.split('\t')
+            real_url = parts[0]
+
+            for op in parts[1:]:
+                if not op:
+                    continue
+                m = _re.match(r'^i\((\d+),(\d+)\)$', op)
+                if m:
+                    pos, code = int(m.group(1)), int(m.group(2))
+                    if 0 <= pos <= len(real_url):
+                        real_url = real_url[:pos] + chr(code) + real_url[pos:]
+                    continue
+                m = _re.match(r'^s\((\d+),(\d+)\)$', op)
+                if m:
+                    a, b = int(m.group(1)), int(m.group(2))
+                    if 0 <= a < len(real_url) and 0 <= b < len(real_url):
+                        lst = list(real_url)
+                        lst[a], lst[b] = lst[b], lst[a]
+                        real_url = ''.join(lst)
+                    continue
+                if op == 'r':
+                    real_url = real_url[::-1]
+
+            if real_url.startswith('http'):
+                return real_url
+
+            log_message(f"DECODE: первая часть не URL: {repr(real_url[:80])}")
+        except Exception as e:
+            log_message(f"DECODE error: {e}")
+
+        return url
+
+    @_metered_download
+    def _download_m3u8_via_ytdlp(self, url: str, path: str) -> bool:
+        """Скачивает аудио URL через yt-dlp (subprocess) или requests."""
+
+        is_m3u8 = 'index.m3u8' in url or '.m3u8' in url
+
+        # Для m3u8 используем yt-dlp через subprocess (как в консоли)
+        if is_m3u8:
+            try:
+                # Показываем прогресс-бар только если не пакетный режим
+                if not self._batch_download_mode:
+                    self._show_progress_bar()
+                self._set_search_status("Скачиваю аудио...")
+                self._update_progress(0, "")
+                log_message(f"DOWNLOAD m3u8 subprocess: {url}")
+
+                # Убираем расширение, yt-dlp добавит сам
+                output_path = path
+                if output_path.lower().endswith('.mp3'):
+                    output_path = output_path[:-4]
+
+                # Формируем команду как в консоли
+                cmd = [
+                    'yt-dlp',
+                    '--no-warnings',
+                    '--newline',  # Важно: каждое обновление на новой строке
+                    '-o', output_path + '.%(ext)s',
+                    '-x',  # extract audio
+                    '--audio-format', 'mp3',
+                    '--audio-quality', '0',  # лучшее качество
+                    url
+                ]
+
+                log_message(f"DOWNLOAD cmd: {' '.join(cmd[:6])}...")
+
+                # Запускаем процесс
+                process = subprocess.Popen(
+                    cmd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    text=True,
+                    creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+                )
+
+                # Читаем вывод и обновляем статус
+                transcode_started = None
+                for line in process.stdout:
+                    line = line.strip()
+                    if line.startswith('[ExtractAudio]') and transcode_started is None:
+                        transcode_started = time.perf_counter()
+                    if line:
+                        # Логируем всё кроме строк прогресса скачивания
+                        if not ('[download]' in line and '%' in line):
+                            log_message("yt-dlp: %.100s", line)
+
+                        if '[download]' in line and '%' in line:
+                            # Парсим прогресс и скорость
+                            # Форматы:
+                            #   [download]  45.2% of 3.52MiB at 1.25MiB/s ETA 00:02
+                            #   [download]  79.4% of ~  27.12MiB at 1.73MiB/s ETA 00:03 (frag 28/37)
+                            try:
+                                # Процент текущего фрагмента
+                                percent_match = line.split('%')[0]
+                                percent_str = percent_match.split()[-1]
+                                frag_percent = float(percent_str)
+
+                                # Проверяем есть ли информация о фрагментах
+                                # Формат: (frag X/Y)
+                                overall_percent = frag_percent
+                                frag_info = ""
+                                if '(frag ' in line:
+                                    try:
+                                        frag_part = line.split('(frag ')[1].split(')')[0]
+                                        frag_current, frag_total = frag_part.split('/')
+                                        frag_current = int(frag_current)
+                                        frag_total = int(frag_total)
+                                        # Общий прогресс = (завершённые фрагменты + прогресс текущего) / всего
+                                        overall_percent = ((frag_current - 1) + frag_percent / 100) / frag_total * 100
+                                        frag_info = f" (фраг. {frag_current}/{frag_total})"
+                                    except:
+                                        pass
+
+                                # Размер файла
+                                size = ""
+                                if ' of ' in line:
+                                    size_part = line.split(' of ')[1].split()[0]
+                                    if size_part != '~':
+                                        size = size_part
+                                    elif ' of ~ ' in line:
+                                        size_part = line.split(' of ~ ')[1].split()[0]
+                                        size = "~" + size_part
+
+                                # Скорость
+                                speed = ""
+                                if ' at ' in line:
+                                    at_part = line.split(' at ')[1]
+                                    speed = at_part.split()[0]
+
+                                # ETA
+                                eta = ""
+                                if 'ETA' in line:
+                                    eta = line.split('ETA')[1].strip().split()[0]
+
+                                # Обновляем UI с общим прогрессом
+                                self._update_progress(overall_percent, f"{speed}" if speed else "")
+
+                                status = f"Скачиваю: {overall_percent:.1f}%"
+                                if size:
+                                    status += f" из {size}"
+                                if eta and eta != "00:00":
+                                    status += f" (осталось {eta})"
+                                self._set_search_status(status)
+
+                            except Exception as e:
+                                log_message(f"Parse error: {e}")
+
+                        elif '[download] 100%' in line or 'has already been downloaded' in line:
+                            self._update_progress(100, "")
+                            self._set_search_status("Загрузка завершена, конвертирую...")
+
+                        elif 'Destination' in line:
+                            self._set_search_status("Сохраняю...")
+
+                        elif 'Post-process' in line or 'ffmpeg' in line.lower() or 'Converting' in line:
+                            self._update_progress(100, "конвертация")
+                            self._set_search_status("Конвертирую в MP3...")
+
+                        elif 'Deleting original file' in line:
+                            self._set_search_status("Завершаю...")
+
+                process.wait()
+                if transcode_started is not None:
+                    _metrics.observe("vk_transcode_seconds", time.perf_counter() - transcode_started,
+                                     tool="yt-dlp")
+
+                if process.returncode == 0:
+                    self._update_progress(100, "готово")
+                    self._set_search_status("Скачивание завершено!")
+                    log_message("DOWNLOAD m3u8 subprocess: успешно")
+                    if not self._batch_download_mode:
+                        time.sleep(0.5)  # Показываем 100% прогресс на полсекунды
+                        self._hide_progress_bar()
+                    return True
+                else:
+                    if not self._batch_download_mode:
+                        self._hide_progress_bar()
+                    log_message(f"DOWNLOAD m3u8 subprocess: код возврата {process.returncode}")
+                    return False
+
+            except FileNotFoundError:
+                if not self._batch_download_mode:
+                    self._hide_progress_bar()
+                log_message("DOWNLOAD: yt-dlp не найден, пробуем вручную...")
+                return self._download_m3u8_manually(url, path)
+            except Exception as e:
+                if not self._batch_download_mode:
+                    self._hide_progress_bar()
+                log_message(f"DOWNLOAD m3u8 subprocess failed: {e}")
+                return self._download_m3u8_manually(url, path)
+
+        # Для прямых ссылок качаем через requests
+        else:
+            try:
+                self._set_search_status("Скачиваю аудио...")
+                self._update_progress(0, "")
+                log_message(f"DOWNLOAD direct audio: {url[:80]}...")
+
+                # Получаем cookies из Selenium
+                cookies_dict = {}
+                if self.driver:
+                    try:
+                        for cookie in self.driver.get_cookies():
+                            cookies_dict[cookie['name']] = cookie['value']
+                    except Exception:
+                        pass
+
+                headers = {
+                    "User-Agent": (
+                        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                        "AppleWebKit/537.36 (KHTML, like Gecko) "
+                        "Chrome/131.0.0.0 Safari/537.36"
+                    ),
+                    "Referer": "https://vk.com/",
+                    "Accept": "*/*",
+                    "Origin": "https://vk.com",
+                }
+
+                with requests.get(url, headers=headers, cookies=cookies_dict,
+                                stream=True, timeout=120) as r:
+                    r.raise_for_status()
+
+                    total_size = int(r.headers.get('content-length', 0))
+                    downloaded = 0
+                    start_time = time.time()
+                    last_update_time = start_time
+
+                    with open(path, "wb") as f:
+                        for chunk in r.iter_content(chunk_size=8192):
+                            if chunk:
+                                f.write(chunk)
+                                downloaded += len(chunk)
+
+                                current_time = time.time()
+                                # Обновляем UI не чаще чем раз в 0.2 секунды
+                                if current_time - last_update_time >= 0.2:
+                                    last_update_time = current_time
+
+                                    # Вычисляем прогресс
+                                    if total_size > 0:
+                                        percent = downloaded * 100 / total_size
+                                    else:
+                                        percent = 0
+
+                                    # Вычисляем скорость
+                                    elapsed = current_time - start_time
+                                    if elapsed > 0:
+                                        speed_bps = downloaded / elapsed
+                                        if speed_bps >= 1024 * 1024:
+                                            speed_str = f"{speed_bps / (1024*1024):.1f} MB/s"
+                                        elif speed_bps >= 1024:
+                                            speed_str = f"{speed_bps / 1024:.0f} KB/s"
+                                        else:
+                                            speed_str = f"{speed_bps:.0f} B/s"
+                                    else:
+                                        speed_str = ""
+
+                                    # Вычисляем ETA
+                                    eta_str = ""
+                                    if total_size > 0 and speed_bps > 0:
+                                        remaining = total_size - downloaded
+                                        eta_sec = remaining / speed_bps
+                                        if eta_sec < 60:
+                                            eta_str = f"{int(eta_sec)}с"
+                                        else:
+                                            eta_str = f"{int(eta_sec // 60)}м {int(eta_sec % 60)}с"
+
+                                    # Обновляем UI
+                                    self._update_progress(percent, speed_str)
+
+                                    # Форматируем размер
+                                    if total_size > 0:
+                                        if total_size >= 1024 * 1024:
+                                            size_str = f"{downloaded / (1024*1024):.1f}/{total_size / (1024*1024):.1f} MB"
+                                        else:
+                                            size_str = f"{downloaded / 1024:.0f}/{total_size / 1024:.0f} KB"
+                                        status = f"Скачиваю: {percent:.0f}% ({size_str})"
+                                    else:
+                                        if downloaded >= 1024 * 1024:
+                                            status = f"Скачано: {downloaded / (1024*1024):.1f} MB"
+                                        else:
+                                            status = f"Скачано: {downloaded / 1024:.0f} KB"
+
+                                    if eta_str:
+                                        status += f" ~{eta_str}"
+
+                                    self._set_search_status(status)
+
+                self._update_progress(100, "готово")
+                self._set_search_status("Скачивание завершено!")
+                log_message("DOWNLOAD direct audio: успешно")
+                return True
+
+            except Exception as e:
+                log_message(f"DOWNLOAD direct audio failed: {e}")
+                return False
+
+    @_metered_download
+    def _download_m3u8_manually(self, m3u8_url: str, path: str) -> bool:
+        """
+        Скачивает m3u8 вручную: парсит плейлист, качает сегменты, склеивает.
+        """
+        try:
+            self._set_search_status("Скачиваю сегменты...")
+            log_message(f"DOWNLOAD m3u8 manual: {m3u8_url[:60]}...")
+
+            cookies_dict = {}
+            if self.driver:
+                try:
+                    for cookie in self.driver.get_cookies():
+                        cookies_dict[cookie['name']] = cookie['value']
+                except Exception:
+                    pass
+
+            headers = {
+                "User-Agent": (
+                    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                    "AppleWebKit/537.36 (KHTML, like Gecko) "
+                    "Chrome/131.0.0.0 Safari/537.36"
+                ),
+                "Referer": "https://vk.com/",
+                "Origin": "https://vk.com",
+            }
+
+            # 1. Скачиваем m3u8 плейлист
+            resp = requests.get(m3u8_url, headers=headers, cookies=cookies_dict, timeout=30)
+            resp.raise_for_status()
+            m3u8_content = resp.text
+            log_message(f"DOWNLOAD: m3u8 content length: {len(m3u8_content)}")
+
+            # 2. Парсим сегменты (.ts файлы)
+            base_url = m3u8_url.rsplit('/', 1)[0] + '/'
+            segments = []
+            for line in m3u8_content.split('\n'):
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    if line.startswith('http'):
+                        segments.append(line)
+                    else:
+                        segments.append(base_url + line)
+
+            if not segments:
+                log_message("DOWNLOAD: не найдено сегментов в m3u8")
+                return False
+
+            log_message(f"DOWNLOAD: найдено {len(segments)} сегментов")
+
+            # 3. Скачиваем все сегменты и склеиваем
+            all_data = bytearray()
+            for i, seg_url in enumerate(segments):
+                self._set_search_status(f"Скачиваю сегмент {i+1}/{len(segments)}...")
+                try:
+                    seg_resp = requests.get(seg_url, headers=headers, cookies=cookies_dict, timeout=60)
+                    seg_resp.raise_for_status()
+                    all_data.extend(seg_resp.content)
+                except Exception as e:
+                    log_message(f"WARNING: не удалось скачать сегмент {i+1}: {e}")
+
+            if not all_data:
+                log_message("DOWNLOAD: не удалось скачать сегменты")
+                return False
+
+            # 4. Сохраняем как .ts файл
+            ts_path = path.rsplit('.', 1)[0] + '.ts'
+            with open(ts_path, 'wb') as f:
+                f.write(all_data)
+
+            log_message(f"DOWNLOAD: сохранено {len(all_data)} байт в {ts_path}")
+
+            # 5. Пробуем конвертировать в mp3 через ffmpeg
+            try:
+                import subprocess
+                mp3_path = path if path.lower().endswith('.mp3') else path.rsplit('.', 1)[0] + '.mp3'
+
+                self._set_search_status("Конвертирую в MP3...")
+                transcode_started = time.perf_counter()
+                result = subprocess.run(
+                    ['ffmpeg', '-y', '-i', ts_path, '-acodec', 'libmp3lame', '-q:a', '0', mp3_path],
+                    capture_output=True,
+                    timeout=120
+                )
+                _metrics.observe("vk_transcode_seconds", time.perf_counter() - transcode_started,
+                                 tool="ffmpeg")
+
+                if result.returncode == 0:
+                    # Удаляем .ts файл
+                    try:
+                        os.remove(ts_path)
+                    except Exception:
+                        pass
+                    self._set_search_status("Скачивание завершено!")
+                    log_message(f"DOWNLOAD: конвертировано в {mp3_path}")
+                    return True
+                else:
+                    log_message(f"DOWNLOAD: ffmpeg error: {result.stderr.decode()[:200]}")
+                    self._set_search_status(f"Сохранено как .ts (ffmpeg недоступен)")
+                    return True  # Всё равно успех, файл есть
+
+            except FileNotFoundError:
+                log_message("DOWNLOAD: ffmpeg не найден, оставляем .ts")
+                self._set_search_status(f"Сохранено как .ts (установи ffmpeg для MP3)")
+                return True
+            except Exception as e:
+                log_message(f"DOWNLOAD: ошибка конвертации: {e}")
+                self._set_search_status(f"Сохранено как .ts")
+                return True
+
+        except Exception as e:
+            log_message(f"DOWNLOAD m3u8 manual failed: {e}")
+            return False
+
+    @_metered_download
+    def _download_via_direct_url(self, url: str, path: str) -> bool:
+        """Скачивает по прямой ссылке с cookies из Selenium."""
+        try:
+            self._set_search_status("Скачиваю (прямая ссылка)...")
+            log_message(f"DOWNLOAD direct: {url[:80]}...")
+
+            # Получаем cookies из Selenium
+            cookies_dict = {}
+            if self.driver:
+                try:
+                    for cookie in self.driver.get_cookies():
+                        cookies_dict[cookie['name']] = cookie['value']
+                except Exception as e:
+                    log_message(f"WARNING: не удалось получить cookies: {e}")
+
+            headers = {
+                "User-Agent": (
+                    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                    "AppleWebKit/537.36 (KHTML, like Gecko) "
+                    "Chrome/120.0.0.0 Safari/537.36"
+                ),
+                "Referer": "https://vk.com/",
+                "Accept": "*/*",
+                "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
+            }
+
+            with requests.get(url, headers=headers, cookies=cookies_dict,
+                            stream=True, timeout=60) as r:
+                r.raise_for_status()
+
+                # Проверяем content-type
+                content_type = r.headers.get('content-type', '')
+                if 'audio' not in content_type and 'octet-stream' not in content_type:
+                    log_message(f"DOWNLOAD direct: неожиданный content-type: {content_type}")
+                    if 'text/html' in content_type:
+                        log_message("DOWNLOAD direct: получили HTML вместо аудио")
+                        return False
+
+                total_size = int(r.headers.get('content-length', 0))
+                downloaded = 0
+
+                with open(path, "wb") as f:
+                    for chunk in r.iter_content(chunk_size=8192):
+                        if chunk:
+                            f.write(chunk)
+                            downloaded += len(chunk)
+                            if total_size > 0:
+                                percent = int(downloaded * 100 / total_size)
+                                self._set_search_status(f"Скачиваю: {percent}%")
+
+            self._set_search_status("Скачивание завершено!")
+            log_message("DOWNLOAD direct: успешно")
+            return True
+
+        except Exception as e:
+            log_message(f"DOWNLOAD direct failed: {e}")
+            return False
+
+    def _export_cookies_for_ytdlp(self) -> str | None:
+        """
+        Экспортирует cookies из Selenium в формате Netscape для yt-dlp.
+        Возвращает путь к временному файлу или None.
+        """
+        if self.driver is None:
+            log_message("COOKIES: driver не доступен")
+            return None
+
+        try:
+            cookies = self.driver.get_cookies()
+            if not cookies:
+                log_message("COOKIES: нет cookies в браузере")
+                return None
+
+            # Создаём временный файл
+            fd, cookies_path = tempfile.mkstemp(suffix='.txt', prefix='vk_cookies_')
+
+            with os.fdopen(fd, 'w') as f:
+                # Заголовок Netscape cookies
+                f.write("# Netscape HTTP Cookie File\n")
+                f.write("# https://curl.haxx.se/rfc/cookie_spec.html\n")
+                f.write("# This is a generated file! Do not edit.\n\n")
+
+                for cookie in cookies:
+                    domain = cookie.get('domain', '')
+                    # Netscape формат требует точку в начале для поддоменов
+                    if not domain.startswith('.'):
+                        domain = '.' + domain
+
+                    flag = "TRUE" if domain.startswith('.') else "FALSE"
+                    path = cookie.get('path', '/')
+                    secure = "TRUE" if cookie.get('secure', False) else "FALSE"
+                    expiry = str(int(cookie.get('expiry', 0)))
+                    name = cookie.get('name', '')
+                    value = cookie.get('value', '')
+
+                    line = f"{domain}\t{flag}\t{path}\t{secure}\t{expiry}\t{name}\t{value}\n"
+                    f.write(line)
+
+            log_message(f"COOKIES: экспортировано {len(cookies)} cookies в {cookies_path}")
+            return cookies_path
+
+        except Exception as e:
+            log_message(f"ERROR: не удалось экспортировать cookies: {e}")
+            return None
+
+    def _ytdlp_progress_hook(self, d):
+        """Хук для отображения прогресса скачивания yt-dlp."""
+        if d['status'] == 'downloading':
+            percent = d.get('_percent_str', '?%').strip()
+            speed = d.get('_speed_str', '').strip()
+            self._set_search_status(f"Скачиваю: {percent} {speed}")
+        elif d['status'] == 'finished':
+            self._set_search_status("Конвертирую в MP3...")
+
+    # --------------------------------------------------
+    # СТАТУС И ПРОГРЕСС (события для окна и командной строки)
+    # --------------------------------------------------
+
+    def _set_search_status(self, text: str):
+        self._emit("status", text=text)
+
+    def _show_progress_bar(self, batch_mode: bool = False):
+        """Начало скачивания: показать прогресс (batch_mode — с индикатором пакета)."""
+        self._emit("progress_start", batch=batch_mode)
+
+    def _hide_progress_bar(self):
+        self._emit("progress_end")
+
+    def _update_progress(self, percent: float, speed_text: str = "", batch_text: str | None = None):
+        """Прогресс скачивания; batch_text=None — индикатор пакета не менять."""
+        self._emit("progress", percent=percent, speed=speed_text, batch=batch_text)
+
+    def classify_query(self, text: str, kind: str | None = None) -> tuple[str, str | None]:
+        """
+        Тип строки поиска (он же — для _ResultCache.make_key):
+        ("pl", url плейлиста) / ("pr", id профиля) / ("q", запрос).
+        kind="pl" / "pr" — строка должна быть этого типа, иначе значение None;
+        профиль тогда можно указать и коротким именем (durov, id1, club1).
+        """
+        if kind == "pl":
+            return "pl", self._parse_vk_playlist_url(text)
+        if kind == "pr":
+            return "pr", (self._parse_vk_profile_url(text)
+                          or self._parse_vk_profile_url(f"vk.com/{text.strip()}"))
+        playlist_url = self._parse_vk_playlist_url(text)
+        if playlist_url:
+            return "pl", playlist_url
+        vk_profile = self._parse_vk_profile_url(text)
+        if vk_profile:
+            return "pr", vk_profile
+        return "q", text
+
+    def _results_page_url(self) -> str | None:
+        """Страница, с которой пришли последние результаты этого потока."""
+        if self._last_interface == "http":
+            return self._last_search_url
+        try:
+            return self.driver.current_url
+        except Exception:
+            return None
+
+    # --------------------------------------------------
+    # ПАКЕТНЫЙ ПОИСК
+    # --------------------------------------------------
+
+    def _collect_item(self, kind: str, value: str, count: int,
+                      allow_http: bool = True, on_delta=None) -> list[tuple]:
+        """
+        Собирает треки одной строки пакета драйвером текущего потока;
+        on_delta(tracks) — новые треки по мере прокрутки.
+        """
+        if kind == "pl":
+            results = self._collect_playlist(value, count, on_delta)
+            if results is None:
+                raise RuntimeError("треки не найдены")
+        elif kind == "pr":
+            results = self._collect_profile(value, count, on_delta)
+            if results is None:
+                raise RuntimeError("аудиозаписи недоступны или скрыты")
+        else:
+            results = self._collect_search(value, count, on_delta, allow_http=allow_http)
+        return results
+
+    def _item_report(self, line, kind, source, page_url, elapsed, tracks, error=None) -> dict:
+        """Запись отчёта о строке пакета; треки запоминают страницу, с которой пришли."""
+        for t in tracks:
+            if len(t) >= 6 and t[5] and page_url:
+                self._track_pages.setdefault(t[5], page_url)
+        return {
+            "line": line,
+            "kind": kind,
+            "source": source,
+            "url": page_url,
+            "elapsed": round(elapsed, 3),
+            "error": error,
+            "tracks": [list(t) for t in tracks],
+        }
+
+    def _run_items(self, items: list[tuple], count: int, on_done,
+                   browsers: int | None = None, http_workers: int | None = None,
+                   on_delta=None):
+        """
+        Собирает треки строк items = [(idx, line, kind, value), ...]:
+        1) что есть в кэше — сразу;
+        2) запросы при SEARCH_BACKEND == "http" — параллельно, без браузера;
+        3) остальное разбирают браузеры: основной (если запущен) и фоновые без окна,
+           всего не больше browsers (по умолчанию BATCH_BROWSERS).
+        on_done(idx, line, kind, source, page_url, elapsed, tracks, error) вызывается
+        из рабочих потоков по мере готовности строк, on_delta(idx, tracks) — треки
+        строки, разбираемой браузером, по мере прокрутки. Строки, которые некому было
+        разобрать (ни один браузер не вошёл в ВК), остаются без вызова.
+        """
+        browsers = browsers or BATCH_BROWSERS
+        http_workers = http_workers or BATCH_HTTP_WORKERS
+        self._relogin_gave_up = False
+
+        def run(idx, line, kind, value, allow_http=True, driver=None):
+            t0 = time.perf_counter()
+            self._last_interface = ""
+            self._last_search_url = None
+            try:
+                tracks = self._collect_item(
+                    kind, value, count, allow_http,
+                    (lambda delta: on_delta(idx, delta)) if on_delta else None,
+                )
+                error = None
+            except Exception as e:
+                tracks, error = [], str(e)
+            if driver is not None and self._session_lost(driver, failed=not tracks):
+                # Вход потерян — строку повторим, когда он восстановится
+                browser_items.put((idx, line, kind, value))
+                _metrics.inc("vk_retries_total", stage="batch", reason="session")
+                return
+            source = self._last_interface or "unknown"
+            page_url = self._results_page_url()
+            if tracks:
+                self._result_cache.put(
+                    _ResultCache.make_key(kind, value, count), tracks, source, page_url
+                )
+            on_done(idx, line, kind, source, page_url, time.perf_counter() - t0, tracks, error)
+
+        # 1) Кэш
+        pending = []
+        for idx, line, kind, value in items:
+            entry = None
+            if not RESULT_CACHE_REFRESH:
+                entry = self._result_cache.get(_ResultCache.make_key(kind, value, count))
+            if entry is None:
+                pending.append((idx, line, kind, value))
+                continue
+            tracks = [Track.from_row(t) for t in entry["tracks"]]
+            on_done(idx, line, kind, "cache", entry.get("url"), 0.0, tracks, None)
+
+        # 2) HTTP-поиск: неудачные (капча, ошибка) уходят в браузер
+        browser_items = Queue()
+        if SEARCH_BACKEND == "http" and REQUESTS_AVAILABLE:
+            http_items = [item for item in pending if item[2] == "q"]
+            fallback = []
+
+            def run_http(idx, line, kind, value):
+                t0 = time.perf_counter()
+                self._last_search_url = None
+                tracks = self._search_via_http(value, count)
+                if tracks is None:
+                    return idx
+                url = self._last_search_url
+                self._result_cache.put(
+                    _ResultCache.make_key(kind, value, count), tracks, "http", url
+                )
+                on_done(idx, line, kind, "http", url, time.perf_counter() - t0, tracks, None)
+                return None
+
+            with ThreadPoolExecutor(max_workers=http_workers) as pool:
+                futures = {pool.submit(run_http, *item): item for item in http_items}
+                for future in as_completed(futures):
+                    try:
+                        if future.result() is None:
+                            continue
+                    except Exception as e:
+                        log_message(f"WARNING: BATCH http {futures[future][1]!r}: {e}")
+                    fallback.append(futures[future])
+                    _metrics.inc("vk_retries_total", stage="search", reason="http_fallback")
+            for item in pending:
+                if item[2] != "q" or item in fallback:
+                    browser_items.put(item)
+        else:
+            for item in pending:
+                browser_items.put(item)
+
+        # 3) Браузеры
+        def browser_loop(driver, is_main: bool):
+            # Основной браузер работает в вызывающем потоке — это может быть
+            # поток пула: после пакета его задачи не должны видеть этот браузер
+            previous = getattr(self._local, "driver", None)
+            self._local.driver = driver
+            self._local.session_checked = time.monotonic()
+            try:
+                while True:
+                    if not self._session_ok.is_set():
+                        self._session_ok.wait()
+                        driver = self._resume_after_relogin(driver, is_main)
+                    try:
+                        item = browser_items.get_nowait()
+                    except Empty:
+                        return
+                    _metrics.set("vk_queue_depth", browser_items.qsize(), queue="batch")
+                    if is_main:
+                        # Основной браузер нужен и для скачивания — по одной строке
+                        with self._user_driver():
+                            run(*item, allow_http=False, driver=driver)
+                    else:
+                        run(*item, allow_http=False, driver=driver)
+            finally:
+                self._local.driver = previous
+                self._local.session_checked = 0
+
+        def extra_browser(n: int):
+            try:
+                driver = self._launch_driver(headless=True, use_profile=False)
+            except Exception as e:
+                log_message(f"WARNING: BATCH: фоновый браузер #{n} не запустился: {e}")
+                return
+            try:
+                if not self._probe_session(driver):
+                    log_message(f"WARNING: BATCH: фоновый браузер #{n} не залогинен")
+                    return
+                log_message(f"INFO: BATCH: фоновый браузер #{n} готов")
+                browser_loop(driver, is_main=False)
+            finally:
+                try:
+                    driver.quit()
+                except Exception:
+                    pass
+
+        n_browser = browser_items.qsize()
+        if n_browser:
+            self._wait_for_main_browser()
+        has_main = self._driver is not None
+        n_extra = min(browsers, n_browser) - (1 if has_main else 0)
+        threads = []
+        if n_extra > 0:
+            # Фоновым браузерам нужны cookies из SESSION_FILE
+            if has_main:
+                with self._user_driver():
+                    self._save_session()
+            for n in range(1, n_extra + 1):
+                t = threading.Thread(target=extra_browser, args=(n,), daemon=True)
+                t.start()
+                threads.append(t)
+        if n_browser and has_main:
+            browser_loop(self._driver, is_main=True)
+        for t in threads:
+            t.join()
+        _metrics.set("vk_queue_depth", browser_items.qsize(), queue="batch")
+        # Кэш — одной записью на поиск или пакет, а не на каждую строку
+        self._result_cache.flush()
+        self._write_metrics()
+
+    @staticmethod
+    def batch_stats(reports: list, wall: float) -> dict:
+        """Сводка пакета: строки, треки, пропускная способность, задержки (min/avg/p50/p95/max)."""
+        reports = [r for r in reports if r is not None]
+        # "none" — строка не дошла до ВК (не ссылка, нет браузера)
+        latencies = sorted(r["elapsed"] for r in reports if r["source"] not in ("cache", "none"))
+
+        def pct(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        stats = {
+            "items": len(reports),
+            "failed": sum(1 for r in reports if r["error"] or not r["tracks"]),
+            "cached": sum(1 for r in reports if r["source"] == "cache"),
+            "tracks": sum(len(r["tracks"]) for r in reports),
+            "unique_tracks": len({t[5] for r in reports for t in r["tracks"] if len(t) >= 6 and t[5]}),
+            "wall_sec": round(wall, 2),
+            "items_per_min": round(len(reports) / wall * 60, 1) if wall else None,
+        }
+        if latencies:
+            stats["latency_sec"] = {
+                "min": latencies[0],
+                "avg": round(sum(latencies) / len(latencies), 3),
+                "p50": pct(0.5),
+                "p95": pct(0.95),
+                "max": latencies[-1],
+            }
+        return stats
+
+    def write_batch_report(self, path: str, batch: dict):
+        """
+        Сохраняет итог collect_many (stats, items) в <файл>.results.json
+        и выводит пропускную способность и задержки.
+        """
+        reports = [r for r in batch["items"] if r is not None]
+        stats = batch["stats"]
+        wall = stats["wall_sec"]
+
+        report_path = os.path.splitext(path)[0] + ".results.json"
+        try:
+            with open(report_path, "w", encoding="utf-8") as f:
+                json.dump({"stats": stats, "items": reports}, f, ensure_ascii=False, indent=1)
+            log_message(f"INFO: BATCH: отчёт сохранён в {report_path}")
+        except OSError as e:
+            log_message(f"WARNING: BATCH: не удалось сохранить отчёт: {e}")
+
+        log_message(f"INFO: BATCH: {json.dumps(stats, ensure_ascii=False)}")
+        status = (
+            f"Пакет: {stats['items']} строк за {wall:.0f} с "
+            f"({stats['items_per_min']}/мин), треков: {stats['unique_tracks']}"
+        )
+        if "latency_sec" in stats:
+            status += f", p50 {stats['latency_sec']['p50']:.1f} с, p95 {stats['latency_sec']['p95']:.1f} с"
+        if stats["failed"]:
+            status += f", без результата: {stats['failed']}"
+        self._set_search_status(status)
+
+    def _parse_vk_profile_url(self, text: str) -> str | None:
+        """
+        Проверяет, является ли текст URL-ом профиля/группы ВК.
+        Возвращает короткое имя или ID профиля, либо None.
+
+        Примеры:
+          https://vk.com/durov -> durov
+          vk.com/id1 -> id1
+          https://vk.com/club12345 -> club12345
+          https://vk.com/public12345 -> public12345
+        """
+
+        # Убираем пробелы
+        text = text.strip()
+
+        # Паттерн для VK URL
+        # Поддерживаем: https://vk.com/xxx, http://vk.com/xxx, vk.com/xxx
+        pattern = r'^(?:https?://)?(?:www\.)?vk\.com/([a-zA-Z0-9._]+)(?:\?.*)?$'
+        match = re.match(pattern, text)
+
+        if match:
+            profile_id = match.group(1)
+            # Исключаем служебные страницы
+            excluded = {'audio', 'audios', 'music', 'feed', 'im', 'friends',
+                       'groups', 'photos', 'video', 'docs', 'settings', 'login'}
+            if profile_id.lower() not in excluded:
+                return profile_id
+
+        return None
+
+    def _parse_vk_playlist_url(self, text: str) -> str | None:
+        """
+        Определяет, является ли текст ссылкой на плейлист или альбом ВК.
+        Возвращает нормализованный URL или None.
+
+        Поддерживаемые форматы:
+          https://vk.com/music/playlist/-143097069_1_5956a0443443bf6ae2
+          https://vk.com/music/playlist/-143097069_1
+          https://vk.com/music/album/-143097069_1_5956a0443443bf6ae2
+          vk.com/music/playlist/12345_1
+        """
+        text = text.strip()
+        pattern = r'^(?:https?://)?(?:www\.)?vk\.com/(music/(?:playlist|album)/[-\w]+)(?:\?.*)?$'
+        match = re.match(pattern, text)
+        if match:
+            return f"https://vk.com/{match.group(1)}"
+        return None
+
+    def _page_collection_http(self, kind: str, value: str, spool, on_tracks) -> bool:
+        """
+        Постранично выгружает коллекцию через _VKHttpSearchClient.iter_playlist.
+        True — коллекция выгружена до конца, False — нужен браузер.
+        """
+        if not REQUESTS_AVAILABLE:
+            return False
+        try:
+            if kind == "pl":
+                m = re.search(r'/(?:playlist|album)/(-?\d+)_(\d+)(?:_(\w+))?', value)
+                if not m:
+                    return False
+                owner_id, playlist_id, access_hash = m.group(1), m.group(2), m.group(3) or ""
+            else:
+                owner_id = self._owner_ids.get(value)
+                if not owner_id:
+                    if self._driver is None:
+                        raise RuntimeError(f"ID владельца {value} не в кэше, а браузера нет")
+                    with self._user_driver():
+                        owner_id = self._resolve_owner_id(value)
+                if not re.fullmatch(r'-?\d+', owner_id):
+                    return False
+                playlist_id, access_hash = -1, ""
+            # Для клика при скачивании: браузер на эту страницу не заходил
+            self._last_search_url = value if kind == "pl" else f"https://vk.com/audios{owner_id}"
+
+            if self._http_client is None:
+                if self._driver is not None:
+                    with self._user_driver():
+                        self._http_client = _VKHttpSearchClient.from_driver(
+                            self.driver, owner_ids=self._owner_ids
+                        )
+                else:
+                    # Без браузера: cookies последней сохранённой сессии
+                    self._http_client = _VKHttpSearchClient.from_session_file(
+                        SESSION_FILE, owner_ids=self._owner_ids
+                    )
+            for tracks, next_offset, has_more in self._http_client.iter_playlist(
+                owner_id, playlist_id, access_hash, spool.offset or 0
+            ):
+                on_tracks(tracks, next_offset)
+            return True
+        except _VKChallenge as e:
+            log_message(f"WARNING: коллекция: HTTP упёрся в проверку ВК ({e})")
+        except Exception as e:
+            log_message(f"WARNING: коллекция: HTTP-выгрузка не удалась: {e}")
+        spool.checkpoint()
+        return False
+
+    @_metered_collect("pl")
+    def _collect_playlist(self, url: str, count: int, on_delta=None,
+                          keep: bool = True, start: int = 0) -> list[tuple] | int | None:
+        """
+        Открывает плейлист/альбом и собирает треки (без обновления таблицы).
+        None — треков на странице нет (приватный плейлист или не загрузилась).
+        keep=False — потоковый режим для больших коллекций: треки не копятся,
+        а только уходят в on_delta(tracks, position), где position — позиция
+        в списке для контрольной точки; возвращается число треков. start —
+        позиция, до которой треки уже сохранены (см. _scroll_and_parse_audio).
+        """
+        log_message(f"INFO: открываю плейлист: {url}")
+        self._set_search_status("Открываю плейлист...")
+        self._navigate(url)
+
+        # Ждём загрузки страницы — пробуем несколько возможных селекторов
+        audio_selectors = [
+            (By.CLASS_NAME, "audio_row"),
+            (By.CSS_SELECTOR, "[data-audio]"),
+            (By.CSS_SELECTOR, ".audio_pl_snippet__row"),
+            (By.CSS_SELECTOR, "[class*='AudioRow']"),
+            (By.CSS_SELECTOR, "[class*='audio_row']"),
+        ]
+        found = False
+        for by, sel in audio_selectors:
+            try:
+                WebDriverWait(self.driver, 12).until(
+                    EC.presence_of_element_located((by, sel))
+                )
+                log_message(f"INFO: найден селектор аудио: {sel}")
+                found = True
+                break
+            except Exception:
+                continue
+
+        if not found:
+            # Последняя попытка: просто ждём 5 сек и смотрим что есть
+            time.sleep(5)
+            src = self.driver.page_source
+            # Логируем уникальные классы элементов с data-audio
+            try:
+                soup_dbg = BeautifulSoup(src, "html.parser")
+                has_data_audio = soup_dbg.find_all(attrs={"data-audio": True})
+                log_message("DEBUG playlist: data-audio элементов = %d", len(has_data_audio))
+                audio_rows = soup_dbg.find_all("div", class_=lambda c: c and "audio" in c.lower())
+                sample_classes = list({" ".join(el.get("class", [])) for el in audio_rows[:10]})
+                log_message("DEBUG playlist: div с 'audio' в классе: %s", sample_classes[:5])
+            except Exception as dbg_e:
+                log_message("DEBUG playlist parse error: %s", dbg_e)
+
+            results = self._parse_search_results(self.driver.page_source, count or None)
+            if not results:
+                return None
+
+        # Нажимаем "Показать все" / "Показать всё", если кнопка есть
+        self._click_show_all_button()
+
+        self._set_search_status("Загружаю треки...")
+        return self._scroll_and_extract_playlist(count, on_delta, keep, start)
+
+    # Извлекает треки из нового интерфейса ВК:
+    # audio_full_id берём из MobX Map (shared trackProvider, ключи совпадают с порядком строк),
+    # title/artist/duration читаем из DOM через data-testid.
+    _JS_EXTRACT_TRACKS = """
+        var rows = document.querySelectorAll('[data-testentitytag="audio"]');
+        if (rows.length === 0) return JSON.stringify([]);
+
+        // Получаем все audioId из shared trackProvider первой строки
+        var allAudioIds = [];
+        try {
+            var fk = Object.keys(rows[0]).find(function(k) { return k.startsWith('__reactFiber'); });
+            var tp = rows[0][fk].memoizedProps.track.entity.trackProvider;
+            tp.entities.data_.forEach(function(v, k) { allAudioIds.push(k); });
+        } catch(e) {}
+
+        var results = [];
+        var seen = {};
+        for (var i = 0; i < rows.length; i++) {
+            try {
+                var row = rows[i];
+                var audioId = allAudioIds[i] || null;
+                if (!audioId || seen[audioId]) continue;
+                seen[audioId] = true;
+
+                var titleEl    = row.querySelector('[data-testid="MusicTrackRow_Title"]');
+                var artistEl   = row.querySelector('[data-testid="MusicTrackRow_Authors"]');
+                var durationEl = row.querySelector('[data-testid="MusicTrackRow_Duration"]');
+
+                var title    = titleEl    ? titleEl.innerText.trim()    : '';
+                var artist   = artistEl   ? artistEl.innerText.trim()   : '';
+                var duration = durationEl ? durationEl.innerText.trim() : '';
+
+                if (!title) continue;
+                results.push({ full_id: audioId, title: title, artist: artist, duration: duration });
+            } catch(e) {}
+        }
+        return JSON.stringify(results);
+    """
+
+    def _extract_tracks_via_js(self) -> list[tuple]:
+        """
+        Извлекает треки из нового интерфейса ВК через JS (React Fiber + MobX Map).
+        Возвращает список кортежей в том же формате, что и _parse_search_results.
+        """
+        try:
+            raw_json = self.driver.execute_script(self._JS_EXTRACT_TRACKS)
+            if not raw_json:
+                return []
+            raw = json.loads(raw_json)
+        except Exception as e:
+            log_message(f"ERROR _extract_tracks_via_js: {e}")
+            return []
+
+        results = []
+        seen = set()
+        for t in raw:
+            full_id      = t.get("full_id", "").strip()
+            title        = t.get("title", "").strip()
+            artist       = t.get("artist", "").strip()
+            duration_str = t.get("duration", "").strip()
+
+            if not title or not full_id:
+                continue
+            if full_id in seen:
+                continue
+            seen.add(full_id)
+
+            results.append(Track(
+                (artist or "Неизвестный")[:80],
+                title[:120],
+                duration_str,
+                # владелец из full_id (формат: owner_id_audio_id)
+                Track.owner_label(full_id.split("_")[0])[:32],
+                "",        # url — получаем при скачивании через клик
+                full_id,
+            ))
+        return results
+
+    def _click_show_all_button(self):
+        """Нажимает кнопку 'Показать все/всё' на странице плейлиста, если она есть."""
+        try:
+            clicked = self.driver.execute_script("""
+                var texts = ['Показать все', 'Показать всё', 'Show all', 'show all'];
+                // Ищем по тексту среди кнопок и ссылок
+                var candidates = Array.from(
+                    document.querySelectorAll('button, a, span, div[role="button"]')
+                );
+                for (var i = 0; i < candidates.length; i++) {
+                    var el = candidates[i];
+                    var t = (el.innerText || el.textContent || '').trim();
+                    for (var j = 0; j < texts.length; j++) {
+                        if (t === texts[j] || t.startsWith(texts[j])) {
+                            el.click();
+                            return t;
+                        }
+                    }
+                }
+                return null;
+            """)
+            if clicked:
+                log_message(f"INFO: нажата кнопка '{clicked}', ждём загрузки всех треков...")
+                time.sleep(2)
+            else:
+                log_message("INFO: кнопка 'Показать все' не найдена")
+        except Exception as e:
+            log_message(f"WARNING: _click_show_all_button: {e}")
+
+    # Чтение треков прямо из MobX-хранилища нового интерфейса (trackProvider):
+    # id и метаданные берутся из одной записи entities, без сопоставления с DOM.
+    # arguments: [курсор, подгрузить следующую страницу, callback]
+    _JS_READ_TRACK_STORE = """
+        var done = arguments[arguments.length - 1];
+        var cursor = arguments[0] || 0;
+        var loadMore = arguments[1];
+
+        function provider() {
+            var rows = document.querySelectorAll('[data-testentitytag="audio"]');
+            if (!rows.length) return null;
+            var fk = Object.keys(rows[0]).find(function(k) { return k.startsWith('__reactFiber'); });
+            if (!fk) return null;
+            try { return rows[0][fk].memoizedProps.track.entity.trackProvider; } catch(e) { return null; }
+        }
+        function unbox(v) {
+            return (v && v.value_ !== undefined) ? v.value_ : v;
+        }
+        function text(v) {
+            v = unbox(v);
+            if (v === null || v === undefined) return '';
+            if (typeof v === 'string' || typeof v === 'number') return String(v);
+            if (Array.isArray(v)) return v.map(text).filter(Boolean).join(', ');
+            return text(v.name || v.title || '');
+        }
+        function entry(key, value) {
+            var e = unbox(value) || {};
+            var title = text(e.title);
+            var subtitle = text(e.subtitle);
+            if (subtitle) title += ' (' + subtitle + ')';
+            var artist = text(e.artist || e.performer || e.mainArtists || e.authors);
+            var duration = unbox(e.duration);
+            return [String(key), title, artist, duration === undefined ? '' : duration];
+        }
+        function hasMore(tp) {
+            var flags = ['hasMore', 'hasNextPage', 'canLoadMore'];
+            for (var i = 0; i < flags.length; i++) {
+                var f = unbox(tp[flags[i]]);
+                if (typeof f === 'boolean') return f;
+            }
+            if (typeof unbox(tp.isFullyLoaded) === 'boolean') return !unbox(tp.isFullyLoaded);
+            return null;
+        }
+        function loader(tp) {
+            var names = ['loadMore', 'loadNext', 'loadNextPage', 'fetchMore', 'fetchNext', 'loadNextChunk'];
+            for (var i = 0; i < names.length; i++) {
+                if (typeof tp[names[i]] === 'function') return names[i];
+            }
+            return null;
+        }
+        function read(tp, usedLoader) {
+            var items = [];
+            var i = 0;
+            tp.entities.data_.forEach(function(v, k) {
+                if (i++ >= cursor) items.push(entry(k, v));
+            });
+            return JSON.stringify({
+                total: i, items: items, has_more: hasMore(tp),
+                loader: usedLoader
+            });
+        }
+
+        var tp = provider();
+        if (!tp || !tp.entities || !tp.entities.data_) { done(null); return; }
+
+        var name = loader(tp);
+        if (!loadMore || !name || hasMore(tp) === false) { done(read(tp, loadMore ? name : null)); return; }
+
+        var finished = false;
+        function finish() { if (!finished) { finished = true; done(read(tp, name)); } }
+        setTimeout(finish, 10000);
+        try {
+            var p = tp[name]();
+            if (p && typeof p.then === 'function') p.then(finish, finish);
+            else setTimeout(finish, 300);
+        } catch(e) { finish(); }
+    """
+
+    def _read_track_store(self, cursor: int, seen_ids: set, load_more: bool = False) -> dict | None:
+        """
+        Читает записи trackProvider после cursor (и при load_more просит его
+        загрузить следующую страницу). Возвращает
+        {"tracks", "cursor", "has_more", "loader"} или None, если хранилища нет.
+        """
+        try:
+            self.driver.set_script_timeout(15)
+            raw_json = self.driver.execute_async_script(self._JS_READ_TRACK_STORE, cursor, load_more)
+            if not raw_json:
+                return None
+            raw = json.loads(raw_json)
+        except Exception as e:
+            log_message(f"WARNING: чтение trackProvider не удалось: {e}")
+            return None
+
+        tracks = []
+        for full_id, title, artist, duration in raw.get("items") or []:
+            full_id = (full_id or "").strip()
+            title = (title or "").strip()
+            if not full_id or not title or full_id in seen_ids:
+                continue
+            seen_ids.add(full_id)
+
+            if isinstance(duration, (int, float)):
+                duration = max(int(duration), 0)
+            else:
+                duration = str(duration or "").strip()
+
+            tracks.append(Track(
+                ((artist or "").strip() or "Неизвестный")[:80],
+                title[:120],
+                duration,
+                Track.owner_label(full_id.split("_")[0])[:32],
+                "",        # url — получаем при скачивании через клик
+                full_id,
+            ))
+
+        return {
+            "tracks": tracks,
+            "cursor": int(raw.get("total") or 0),
+            "has_more": raw.get("has_more"),
+            "loader": raw.get("loader"),
+        }
+
+    def _load_tracks_via_store(self, count: int, on_delta=None,
+                               keep: bool = True, start: int = 0) -> list[tuple] | int | None:
+        """
+        Загружает треки нового интерфейса через trackProvider: читаем записи
+        хранилища и просим провайдер подгрузить следующую страницу сам.
+        Если провайдер не умеет грузить дальше — подгружаем скроллом, но
+        данные всё равно берём из хранилища. None — хранилища на странице нет.
+        keep=False — см. _collect_playlist (позиция — курсор хранилища).
+        start — записи до этой позиции уже сохранены: провайдер всё равно
+        подгружает их страницы, но из хранилища они не читаются.
+        """
+        limit = count if count > 0 else None
+        seen_ids = set()
+        emit = self._limited_emitter(on_delta, limit, positions=not keep)
+
+        first = self._read_track_store(start, seen_ids)
+        if first is None:
+            return None
+        results = []
+        total = 0
+
+        def take(step):
+            nonlocal total
+            total += len(step["tracks"])
+            if keep:
+                results.extend(step["tracks"])
+            emit(step["tracks"], step["cursor"])
+
+        take(first)
+        cursor = first["cursor"]
+        has_more = first["has_more"]
+        log_message(f"INFO: trackProvider: {cursor} записей в хранилище")
+        if start:
+            log_message(f"INFO: продолжаю с позиции {start}: первые записи не читаю")
+
+        idle_rounds = 0
+        calls = 1
+        while (limit is None or total < limit) and has_more is not False and idle_rounds < 3:
+            self._set_search_status(
+                f"Загружаю треки... ({total}/{limit if limit else '∞'})"
+            )
+            step = self._read_track_store(max(cursor, start), seen_ids, load_more=True)
+            calls += 1
+            if step is None:
+                break
+            if not step["loader"]:
+                # Провайдер не умеет грузить сам — подталкиваем скроллом
+                if self._scroll_and_wait('[data-testentitytag="audio"]') is None:
+                    break
+                step = self._read_track_store(max(cursor, start), seen_ids)
+                if step is None:
+                    break
+
+            take(step)
+            self._yield_driver()
+            idle_rounds = 0 if step["cursor"] > cursor else idle_rounds + 1
+            cursor = max(cursor, step["cursor"])
+            has_more = step["has_more"]
+
+        log_message(f"INFO: trackProvider: итого {total} треков за {calls} вызовов")
+        self._last_interface = "store"
+        if not keep:
+            return min(total, limit) if limit else total
+        if limit:
+            results = results[:limit]
+        return results
+
+    @staticmethod
+    def _limited_emitter(on_delta, limit: int | None, positions: bool = False):
+        """
+        Обёртка над on_delta: суммарно отдаёт не больше limit треков.
+        positions=True — вызывает on_delta(tracks, position) (потоковый режим).
+        """
+        sent = 0
+
+        def emit(tracks, position: int | None = None):
+            nonlocal sent
+            if on_delta is None or not tracks:
+                return
+            if limit is not None:
+                tracks = tracks[:max(0, limit - sent)]
+                if not tracks:
+                    return
+            sent += len(tracks)
+            if positions:
+                on_delta(list(tracks), position)
+            else:
+                on_delta(list(tracks))
+
+        return emit
+
+    # Скролл с ожиданием в странице: ждём роста числа строк (или тишины
+    # quiet_ms), вместо фиксированной паузы. arguments: [селектор строк,
+    # quiet_ms, max_ms, callback]. Признак конца списка — скрытая/отсутствующая
+    # кнопка «Показать ещё» или видимый маркер конца.
+    _JS_SCROLL_AND_WAIT = """
+        var done = arguments[arguments.length - 1];
+        var selector = arguments[0];
+        var quietMs = arguments[1];
+        var maxMs = arguments[2];
+
+        function count() { return document.querySelectorAll(selector).length; }
+        function visible(el) { return !!(el && (el.offsetWidth || el.offsetHeight || el.getClientRects().length)); }
+        function atEnd() {
+            var more = document.querySelector('.ui_load_more_btn, .audio_page__load_more, #ui_audio_load_more');
+            if (more && !visible(more) && window.innerHeight + window.scrollY >= document.body.scrollHeight - 2) return true;
+            var markers = document.querySelectorAll('.audio_page__footer_end, [data-testid="MusicPlaylistTracks_End"]');
+            for (var i = 0; i < markers.length; i++) if (visible(markers[i])) return true;
+            return false;
+        }
+
+        var start = Date.now();
+        var before = count();
+        var last = before;
+        var lastChange = start;
+        var rows = document.querySelectorAll(selector);
+        if (rows.length) rows[rows.length - 1].scrollIntoView({block: 'end'});
+        window.scrollTo(0, document.body.scrollHeight);
+
+        var timer = setInterval(function() {
+            var now = Date.now();
+            var c = count();
+            if (c !== last) { last = c; lastChange = now; }
+            // Выросло и новые строки перестали прибывать (100 мс) — готово
+            var grown = c > before && now - lastChange >= 100;
+            var quiet = now - lastChange >= quietMs;
+            if (grown || quiet || now - start >= maxMs) {
+                clearInterval(timer);
+                done({before: before, after: c, elapsed_ms: now - start, end: atEnd()});
+            }
+        }, 50);
+    """
+
+    def _scroll_and_wait(self, row_selector: str) -> dict | None:
+        """
+        Один шаг подгрузки: скролл вниз и ожидание в странице, пока число
+        строк не вырастет или не пройдёт SCROLL_QUIET_MS без изменений.
+        Возвращает {"before", "after", "elapsed_ms", "end"} или None.
+        """
+        try:
+            self.driver.set_script_timeout(SCROLL_MAX_WAIT_MS / 1000 + 5)
+            return self.driver.execute_async_script(
+                self._JS_SCROLL_AND_WAIT, row_selector, SCROLL_QUIET_MS, SCROLL_MAX_WAIT_MS
+            )
+        except Exception as e:
+            log_message(f"WARNING: ошибка при скролле: {e}")
+            return None
+
+    def _scroll_load_loop(self, row_selector: str, pull, limit: int | None):
+        """
+        Скроллит, пока список растёт. pull() забирает новые треки и возвращает
+        текущее их количество. Останавливается, когда набран limit, найден
+        маркер конца списка или SCROLL_QUIET_ROUNDS раз подряд ничего не пришло.
+        """
+        total = pull()
+        scrolls = 0
+        quiet_rounds = 0
+        spent_ms = 0
+        while limit is None or total < limit:
+            self._set_search_status(
+                f"Загружаю треки... ({total}/{limit if limit is not None else '∞'})"
+            )
+            step = self._scroll_and_wait(row_selector)
+            if step is None:
+                break
+            scrolls += 1
+            spent_ms += step["elapsed_ms"]
+
+            new_total = pull()
+            added = new_total - total
+            total = new_total
+            self._yield_driver()
+            log_message(
+                "DEBUG: скролл #%d: строк %s→%s, +%d треков за %s мс",
+                scrolls, step['before'], step['after'], added, step['elapsed_ms'],
+            )
+
+            if step["end"]:
+                log_message("INFO: достигнут конец списка")
+                break
+            if added > 0 or step["after"] > step["before"]:
+                quiet_rounds = 0
+            else:
+                quiet_rounds += 1
+                if quiet_rounds >= SCROLL_QUIET_ROUNDS:
+                    log_message(f"INFO: список не растёт {quiet_rounds} раз подряд, прекращаю скролл")
+                    break
+
+        if scrolls:
+            _metrics.observe("vk_scroll_seconds", spent_ms / 1000)
+            _metrics.inc("vk_scrolls_total", scrolls)
+            log_message(
+                f"INFO: подгрузка: {scrolls} скроллов за {spent_ms / 1000:.1f} сек "
+                f"(в среднем {spent_ms / scrolls:.0f} мс), треков: {total}"
+            )
+        return total
+
+    def _scroll_and_extract_playlist(self, count: int, on_delta=None,
+                                     keep: bool = True, start: int = 0) -> list[tuple] | int:
+        """
+        Загружает треки нового интерфейса ВК: сначала из хранилища trackProvider
+        (_load_tracks_via_store), затем скроллом с чтением DOM через JS.
+        При необходимости падает обратно на старый интерфейс (_scroll_and_parse_audio).
+        on_delta(tracks) получает новые треки по мере загрузки; keep=False и
+        start — см. _collect_playlist.
+        """
+        limit = count if count > 0 else None
+
+        store_results = self._load_tracks_via_store(count, on_delta, keep, start)
+        if store_results or (start and store_results is not None):
+            # При продолжении хранилище могло не дать новых треков — DOM с начала не читаем
+            return store_results
+
+        results = []
+        total = 0
+        seen_ids = set()
+        emit = self._limited_emitter(on_delta, limit, positions=not keep)
+
+        def pull():
+            # Список виртуализирован: уже ушедшие из DOM строки не теряем.
+            # Номеров строк здесь нет — позиция по числу треков (не дальше
+            # настоящей: недоступные треки в него не входят)
+            nonlocal total
+            new_tracks = []
+            for track in self._extract_tracks_via_js():
+                if track[5] not in seen_ids:
+                    seen_ids.add(track[5])
+                    new_tracks.append(track)
+            total += len(new_tracks)
+            if keep:
+                results.extend(new_tracks)
+            emit(new_tracks, total)
+            return total
+
+        pull()
+        log_message(f"INFO: JS-извлечение (первичное): {total} треков")
+
+        # Если JS не дал ничего — значит старый интерфейс
+        if not total:
+            log_message("INFO: JS-извлечение пустое, пробую _scroll_and_parse_audio")
+            return self._scroll_and_parse_audio(count, on_delta, keep, start)
+
+        self._last_interface = "new"
+        self._scroll_load_loop('[data-testentitytag="audio"]', pull, limit)
+
+        if not keep:
+            return min(total, limit) if limit else total
+        if limit:
+            return results[:limit]
+        return results
+
+    @_metered_collect("pr")
+    def _collect_profile(self, profile_id: str, count: int, on_delta=None,
+                         keep: bool = True, start: int = 0) -> list[tuple] | int | None:
+        """
+        Открывает аудиозаписи профиля/группы и собирает треки (без обновления таблицы).
+        None — аудиозаписи недоступны или скрыты. keep=False и start — см. _collect_playlist.
+        """
+        numeric_id = self._resolve_owner_id(profile_id)
+
+        # Формируем URL страницы аудио
+        audio_url = f"https://vk.com/audios{numeric_id}"
+        log_message("DEBUG: открываю аудио: %s", audio_url)
+        self._set_search_status(f"Открываю аудиозаписи...")
+
+        self._navigate(audio_url)
+
+        # Ждём загрузки аудио
+        try:
+            WebDriverWait(self.driver, 10).until(
+                EC.presence_of_element_located((By.CLASS_NAME, "audio_row"))
+            )
+        except Exception as e:
+            log_message(f"WARNING: не дождались audio_row: {e}")
+            return None
+
+        # /audios<короткое имя> ВК переадресует на /audios<id> — запоминаем
+        owner_match = re.search(r'/audios(-?\d+)', self.driver.current_url or "")
+        if owner_match and owner_match.group(1) != numeric_id:
+            self._owner_ids.put(profile_id, owner_match.group(1))
+
+        # Скроллим и собираем треки (используем существующий метод)
+        self._set_search_status("Загружаю треки...")
+        return self._scroll_and_parse_audio(count, on_delta, keep, start)
+
+    def _resolve_owner_id(self, profile_id: str) -> str:
+        """
+        Числовой ID владельца (пользователь — 123, группа — -123) по короткому
+        имени профиля. Если определить не удалось — возвращает само имя.
+        """
+        cached = self._owner_ids.get(profile_id)
+        if cached:
+            log_message("DEBUG: ID владельца %s из кэша: %s", profile_id, cached)
+            return cached
+
+        # Переходим на страницу профиля, чтобы получить числовой ID
+        profile_url = f"https://vk.com/{profile_id}"
+        log_message("DEBUG: открываю профиль: %s", profile_url)
+        self._navigate(profile_url)
+        time.sleep(2)
+
+        # Пытаемся получить числовой ID из страницы
+        numeric_id = None
+
+        # Способ 1: из URL (если редирект на id123 или club123)
+        current_url = self.driver.current_url
+        log_message("DEBUG: текущий URL: %s", current_url)
+
+        # Проверяем id пользователя
+        id_match = re.search(r'vk\.com/id(\d+)', current_url)
+        if id_match:
+            numeric_id = id_match.group(1)
+            log_message("DEBUG: найден user ID в URL: %s", numeric_id)
+
+        # Проверяем club/public
+        club_match = re.search(r'vk\.com/(club|public)(\d+)', current_url)
+        if club_match:
+            numeric_id = f"-{club_match.group(2)}"  # Группы с минусом
+            log_message("DEBUG: найден group ID в URL: %s", numeric_id)
+
+        # Способ 2: ищем ID в HTML странице
+        if not numeric_id:
+            try:
+                # Ищем в data-атрибутах или скриптах
+                page_source = self.driver.page_source
+
+                # Ищем паттерн "oid":123456 или "owner_id":123456
+                oid_match = re.search(r'"(?:oid|owner_id)"\s*:\s*(-?\d+)', page_source)
+                if oid_match:
+                    numeric_id = oid_match.group(1)
+                    log_message("DEBUG: найден ID в HTML: %s", numeric_id)
+            except Exception as e:
+                log_message(f"WARNING: ошибка при поиске ID в HTML: {e}")
+
+        # Способ 3: пробуем перейти напрямую на страницу аудио с коротким именем
+        if not numeric_id:
+            log_message("DEBUG: ID не найден, пробуем audios с коротким именем")
+            return profile_id
+
+        self._owner_ids.put(profile_id, numeric_id)
+        return numeric_id
+
+    # Курсорное извлечение для старого интерфейса: отдаёт data-audio только
+    # строк, появившихся после arguments[0]. Коллекция getElementsByClassName
+    # «живая» — доступ по индексу не перебирает всю страницу. arguments[1] —
+    # позиция продолжения: пока до неё не докрутили, строк не отдаём.
+    _JS_EXTRACT_AUDIO_ROWS_DELTA = """
+        var cursor = arguments[0] || 0;
+        var start = arguments[1] || 0;
+        var rows = document.getElementsByClassName('audio_row');
+        var total = rows.length;
+        var reset = false;
+        if (cursor > total) {
+            if (cursor <= start) return JSON.stringify({total: cursor, reset: false, rows: []});
+            cursor = 0; reset = true;  // список перестроен
+        }
+        var out = [];
+        for (var i = cursor; i < total; i++) {
+            var row = rows[i];
+            var data = row.getAttribute('data-audio');
+            if (!data) { out.push(null); continue; }
+            if (row.classList.contains('audio_claimed') || row.querySelector('.audio_claimed')) {
+                out.push(0);
+                continue;
+            }
+            out.push(data);
+        }
+        return JSON.stringify({total: total, reset: reset, rows: out});
+    """
+
+    def _extract_audio_rows_delta(self, cursor: int, seen_ids: set,
+                                  start: int = 0) -> tuple[list, int] | None:
+        """
+        Читает в странице только строки audio_row после cursor (но не раньше
+        позиции продолжения start).
+        Возвращает (новые треки, новый курсор) или None, если JS не сработал.
+        """
+        try:
+            raw_json = self.driver.execute_script(self._JS_EXTRACT_AUDIO_ROWS_DELTA, cursor, start)
+            delta = json.loads(raw_json)
+        except Exception as e:
+            log_message(f"WARNING: курсорное извлечение audio_row не сработало: {e}")
+            return None
+
+        if delta.get("reset"):
+            log_message("DEBUG: список audio_row перестроен, читаю заново")
+
+        tracks = []
+        for data_attr in delta.get("rows") or []:
+            if data_attr == 0:
+                log_message("DEBUG: пропущен недоступный трек по классу/атрибуту")
+                continue
+            if not data_attr:
+                continue
+            try:
+                data = json.loads(data_attr)
+            except Exception as e:
+                log_message("DEBUG: не смог распарсить data-audio: %s", e)
+                continue
+            track = self._track_from_audio_data(data, seen_ids)
+            if track is not None:
+                tracks.append(track)
+        return tracks, int(delta.get("total") or 0)
+
+    def _scroll_and_parse_audio(self, count: int, on_delta=None,
+                                keep: bool = True, start: int = 0) -> list | int:
+        """
+        Скроллит страницу и собирает аудиозаписи.
+        Используется для загрузки музыки с профиля/группы.
+
+        После каждого скролла из страницы забираются только новые строки
+        (_extract_audio_rows_delta), накопленный список и seen-set живут здесь.
+        Если курсорный JS не сработал — разбираем page_source целиком.
+        on_delta(tracks) получает новые треки по мере загрузки.
+
+        keep=False — см. _collect_playlist; позиция — номер строки audio_row.
+        start — строки до этой позиции уже сохранены: страница всё равно
+        прокручивается до них, но они не разбираются.
+        """
+        limit = count if count > 0 else None
+
+        results = []
+        total = 0
+        seen_ids = set()
+        cursor = start
+        incremental = True
+        emit = self._limited_emitter(on_delta, limit, positions=not keep)
+
+        def take(tracks, position):
+            nonlocal total
+            total += len(tracks)
+            if keep:
+                results.extend(tracks)
+            emit(tracks, position)
+
+        def pull():
+            nonlocal cursor, incremental
+            if incremental:
+                delta = self._extract_audio_rows_delta(cursor, seen_ids, start)
+                if delta is not None:
+                    tracks, cursor = delta
+                    take(tracks, cursor)
+                    return total
+                incremental = False
+            page = self._parse_search_results(self.driver.page_source, limit)
+            fresh = [t for t in page if t[5] not in seen_ids]
+            seen_ids.update(t[5] for t in fresh)
+            take(fresh, len(page))
+            return total
+
+        if start:
+            log_message(f"INFO: продолжаю с позиции {start}: первые строки не разбираю")
+        self._last_interface = "legacy"
+        self._scroll_load_loop('.audio_row', pull, limit)
+
+        if not keep:
+            return min(total, limit) if limit else total
+        if limit is not None:
+            results = results[:limit]
+        return results
+
+    @_metered_collect("q")
+    def _collect_search(self, query: str, count: int, on_delta=None,
+                        allow_http: bool = True) -> list[tuple]:
+        """Выполняет поиск и собирает треки (без обновления таблицы)."""
+        base_url = f"https://vk.com/audio?q={quote_plus(query)}&section=search"
+
+        if allow_http and SEARCH_BACKEND == "http" and REQUESTS_AVAILABLE:
+            results = self._search_via_http(query, count)
+            if results is not None:
+                return results
+
+        log_message("DEBUG: открываю базовый поиск: %s", base_url)
+        self._navigate(base_url)
+
+        try:
+            WebDriverWait(self.driver, 10).until(
+                EC.presence_of_element_located((By.CLASS_NAME, "audio_row"))
+            )
+        except Exception as e:
+            log_message(f"WARNING: не дождались audio_row на базовом поиске: {e}")
+
+        show_all_link = None
+        try:
+            links = self.driver.find_elements(By.CSS_SELECTOR, "a[href*='section=recoms_block']")
+            log_message("DEBUG: найдено ссылок section=recoms_block: %d", len(links))
+            for idx, l in enumerate(links):
+                try:
+                    log_message("DEBUG: link[%d] href=%s text=%r", idx, l.get_attribute('href'), l.text)
+                except Exception:
+                    pass
+            if links:
+                link_with_text = None
+                for l in links:
+                    try:
+                        if "Показать все" in (l.text or ""):
+                            link_with_text = l
+                            break
+                    except Exception:
+                        continue
+                show_all_link = link_with_text or links[0]
+                log_message(
+                    "INFO: выбрана ссылка recoms_block: "
+                    f"{show_all_link.get_attribute('href')}"
+                )
+            else:
+                log_message(
+                    "INFO: ссылка section=recoms_block не найдена, "
+                    "останемся на странице поиска"
+                )
+        except Exception as e:
+            log_message(f"WARNING: ошибка при поиске ссылки recoms_block: {e}")
+
+        if show_all_link is not None:
+            self._set_search_status("Открываю страницу «Показать всё»...")
+            try:
+                self.driver.execute_script("arguments[0].click();", show_all_link)
+            except Exception as e:
+                log_message(f"WARNING: не удалось кликнуть по recoms_block: {e}")
+
+            try:
+                WebDriverWait(self.driver, 10).until(
+                    lambda d: "section=recoms_block" in d.current_url
+                )
+                log_message(f"INFO: текущий URL после клика: {self.driver.current_url}")
+            except Exception as e:
+                log_message(f"WARNING: не дождались section=recoms_block в URL: {e}")
+
+            try:
+                WebDriverWait(self.driver, 10).until(
+                    EC.presence_of_element_located((By.CLASS_NAME, "audio_row"))
+                )
+            except Exception as e:
+                log_message(f"WARNING: не дождались audio_row на recoms_block: {e}")
+        else:
+            self._set_search_status(
+                "Работаю с основной страницей поиска (recoms_block не найден)."
+            )
+
+        # Используем тот же метод, что работает для плейлистов/профилей:
+        # сначала пробуем JS (новый интерфейс ВК), потом BeautifulSoup (старый)
+        return self._scroll_and_extract_playlist(count, on_delta)
+
+    def _search_via_http(self, query: str, count: int) -> list[tuple] | None:
+        """Поиск через _VKHttpSearchClient; None — нужно идти через браузер."""
+        if self._http_client is None:
+            try:
+                if self.driver is not None:
+                    self._http_client = _VKHttpSearchClient.from_driver(
+                        self.driver, owner_ids=self._owner_ids
+                    )
+                else:
+                    # Без браузера (vk_cli.py): cookies последней сохранённой сессии
+                    self._http_client = _VKHttpSearchClient.from_session_file(
+                        SESSION_FILE, owner_ids=self._owner_ids
+                    )
+            except Exception as e:
+                log_message(f"WARNING: не удалось подготовить HTTP-поиск: {e}")
+                return None
+
+        self._set_search_status("Ищу музыку в ВК (HTTP)...")
+        results = self._http_client.search(query, count)
+        if results is None:
+            # После проверки в браузере cookies обновятся — клиент пересоберём
+            self._http_client = None
+        else:
+            # Страница тех же результатов в браузере — для клика при скачивании
+            self._last_search_url = f"https://vk.com/audio?q={quote_plus(query)}&section=search"
+            self._last_interface = "http"
+        return results
+
+    # --------------------------------------------------
+    # ПАРСИНГ data-audio
+    # --------------------------------------------------
+
+    # Открывающий тег с атрибутом data-audio: значения в кавычках могут
+    # содержать ">" (браузер не экранирует его в атрибутах)
+    _DATA_AUDIO_TAG_RE = re.compile(
+        r'<(\w+)((?:\s+[^\s=>"\'/]+(?:\s*=\s*(?:"[^"]*"|\'[^\']*\'|[^\s"\'>]+))?)*)\s*/?>'
+    )
+    _CLASS_ATTR_RE = re.compile(r'\sclass\s*=\s*"([^"]*)"')
+    _DATA_AUDIO_ATTR_RE = re.compile(r'\sdata-audio\s*=\s*"([^"]*)"')
+    _CLAIMED_RE = re.compile(r'class\s*=\s*"[^"]*(?<![\w-])audio_claimed(?![\w-])')
+    # Сколько HTML после начала строки считать её содержимым при проверке audio_claimed
+    _ROW_SPAN_LIMIT = 16384
+
+    @staticmethod
+    def _parse_search_results(html: str, max_count: int | None):
+        """
+        Парсит audio_row из HTML страницы. Сначала быстрый разбор без DOM
+        (_parse_search_results_fast), BeautifulSoup — только если он не справился.
+        """
+        if not html or len(html) < 100:
+            return []
+        results = VKEngine._parse_search_results_fast(html, max_count)
+        if results is not None:
+            return results
+        log_message("DEBUG: быстрый разбор data-audio не справился, использую BeautifulSoup")
+        return VKEngine._parse_search_results_bs4(html, max_count)
+
+    @staticmethod
+    def _parse_search_results_fast(html: str, max_count: int | None) -> list[tuple] | None:
+        """
+        Ищет атрибуты data-audio прямо в тексте страницы, не строя дерево.
+        Строкой считается div с "audio_row" в классе; её содержимое — HTML до
+        следующей строки (не дальше _ROW_SPAN_LIMIT), там ищем audio_claimed.
+        Возвращает None, если data-audio в странице есть, а разобрать не вышло.
+        """
+        cls = VKEngine
+        rows = []  # (начало тега, конец тега, class, data-audio)
+        pos = html.find('data-audio=')
+        while pos != -1:
+            tag_start = html.rfind('<', 0, pos)
+            m = cls._DATA_AUDIO_TAG_RE.match(html, tag_start) if tag_start != -1 else None
+            if m and m.end() > pos:
+                if m.group(1).lower() == "div":
+                    attrs_html = m.group(2)
+                    cm = cls._CLASS_ATTR_RE.search(attrs_html)
+                    dm = cls._DATA_AUDIO_ATTR_RE.search(attrs_html)
+                    if cm and dm and "audio_row" in cm.group(1):
+                        rows.append((tag_start, m.end(), cm.group(1), dm.group(1)))
+                pos = html.find('data-audio=', m.end())
+            else:
+                pos = html.find('data-audio=', pos + 11)
+
+        if not rows:
+            return None if 'data-audio' in html and 'audio_row' in html else []
+
+        log_message(f"INFO: найдено блоков audio_row: {len(rows)}")
+
+        results = []
+        seen_ids = set()
+        for i, (start, end, row_class, data_attr) in enumerate(rows):
+            try:
+                span_end = rows[i + 1][0] if i + 1 < len(rows) else len(html)
+                span_end = min(span_end, end + cls._ROW_SPAN_LIMIT)
+                if ('audio_claimed' in row_class.split()
+                        or (html.find('audio_claimed', end, span_end) != -1
+                            and cls._CLAIMED_RE.search(html, end, span_end))):
+                    log_message("DEBUG: пропущен недоступный трек по классу/атрибуту")
+                    continue
+
+                if not data_attr:
+                    continue
+                # Браузер экранирует в атрибутах в основном кавычки — их меняем
+                # напрямую, полный html.unescape только если осталось что-то ещё
+                data_attr = data_attr.replace('&quot;', '"')
+                if '&' in data_attr:
+                    data_attr = html_lib.unescape(data_attr)
+                try:
+                    data = json.loads(data_attr)
+                except Exception as e:
+                    log_message("DEBUG: не смог распарсить data-audio: %s", e)
+                    continue
+
+                if len(results) < 5 and isinstance(data, list) and len(data) > 2:
+                    log_message("DEBUG audio link raw: %.120s", data[2])
+
+                track = cls._track_from_audio_data(data, seen_ids)
+                if track is None:
+                    continue
+                results.append(track)
+
+                if max_count is not None and max_count > 0 and len(results) >= max_count:
+                    break
+
+            except Exception as e:
+                log_message("DEBUG: ошибка парсинга audio_row: %s", e)
+                continue
+
+        return results
+
+    @staticmethod
+    def _parse_search_results_bs4(html: str, max_count: int | None):
+        """Полный разбор страницы через BeautifulSoup — запасной путь."""
+        results = []
+        if not html or len(html) < 100:
+            return results
+
+        soup = BeautifulSoup(html, "html.parser")
+        rows = soup.find_all(
+            "div",
+            class_=lambda c: c and "audio_row" in c
+        )
+
+        log_message(f"INFO: найдено блоков audio_row: {len(rows)}")
+
+        seen_ids = set()
+
+        for row in rows:
+            try:
+
+                               # --- НОВАЯ ПРОВЕРКА НА НЕДОСТУПНОСТЬ ---
+                # Проверяем, есть ли у ряда или его дочерних элементов признак недоступности
+                # Примеры классов, которые могут указывать на недоступность (нужно проверить на практике)
+                unavailable_indicators = [
+                    'audio_claimed',   # Пример: класс на родительском div
+                ]
+
+                is_unavailable = False
+                # Проверяем сам элемент row
+                row_classes = row.get('class', [])
+                if any(indicator in row_classes for indicator in unavailable_indicators):
+                    is_unavailable = True
+
+                # Проверяем дочерние элементы (например, название или обложку)
+                if not is_unavailable:
+                    for child in row.find_all():
+                        child_classes = child.get('class', [])
+                        if any(indicator in child_classes for indicator in unavailable_indicators):
+                            is_unavailable = True
+                            break
+
+                # Если трек недоступен, пропускаем его
+                if is_unavailable:
+                    log_message("DEBUG: пропущен недоступный трек по классу/атрибуту")
+                    continue
+                # --- КОНЕЦ НОВОЙ ПРОВЕРКИ ---
+
+                data_attr = row.get("data-audio")
+                if not data_attr:
+                    continue
+
+                try:
+                    data = json.loads(data_attr)
+                except Exception as e:
+                    log_message("DEBUG: не смог распарсить data-audio: %s", e)
+                    continue
+
+                if len(results) < 5 and len(data) > 2:
+                    log_message("DEBUG audio link raw: %.120s", data[2])
+
+                track = VKEngine._track_from_audio_data(data, seen_ids)
+                if track is None:
+                    continue
+                results.append(track)
+
+                if max_count is not None and max_count > 0 and len(results) >= max_count:
+                    break
+
+            except Exception as e:
+                log_message("DEBUG: ошибка парсинга audio_row: %s", e)
+                continue
+
+        return results
+
+    _HTML_TAG_RE = re.compile(r'<[^>]*>')
+
+    @staticmethod
+    def _html_to_text(value: str) -> str:
+        """
+        Текст из HTML-фрагмента названия/исполнителя, как get_text(strip=True)
+        у BeautifulSoup: без тегов, сущности раскодированы, куски обрезаны.
+        """
+        if '<' not in value:
+            return html_lib.unescape(value).strip() if '&' in value else value.strip()
+        return "".join(
+            html_lib.unescape(part).strip()
+            for part in VKEngine._HTML_TAG_RE.split(value)
+        )
+
+    @staticmethod
+    def _track_from_audio_data(data, seen_ids: set):
+        """
+        Превращает массив data-audio (или элемент list из ответа al_audio.php)
+        в Track. Возвращает None, если трек недоступен, пустой или уже был.
+        """
+        if not isinstance(data, list) or len(data) < 6:
+            return None
+
+        audio_id = str(data[0])
+        owner_id = str(data[1])
+        link = str(data[2]) if len(data) > 2 else ""
+        title_html = data[3] or ""
+        artist_html = data[4] or ""
+        duration_val = data[5] or 0
+
+        # иногда вместо ссылки приходит специальный маркер
+        if "audio_api_unavailable" in link:
+            return None
+
+        title = VKEngine._html_to_text(str(title_html))
+        artist = VKEngine._html_to_text(str(artist_html))
+
+        if not title:
+            return None
+
+        if "аудио доступно на vk.com" in title.lower():
+            return None
+
+        try:
+            total_sec = int(duration_val)
+        except Exception:
+            total_sec = 0
+
+        if total_sec <= 0:
+            return None
+
+        full_id = f"{owner_id}_{audio_id}"
+        if full_id in seen_ids:
+            return None
+        seen_ids.add(full_id)
+
+        return Track(
+            (artist or "Неизвестный")[:80],
+            title[:120],
+            total_sec,
+            Track.owner_label(owner_id)[:32],  # человекочитаемый owner
+            link,
+            full_id,  # owner_id_audio_id для yt-dlp
+        )
+
+
+# ------------------------------------------------------
+# ПОИСК ЧЕРЕЗ HTTP (БЕЗ БРАУЗЕРА)
+# ------------------------------------------------------
+class _VKChallenge(Exception):
+    """ВК ответил капчей/проверкой вместо данных — нужен браузер."""
+
+
+class _VKHttpSearchClient:
+    """
+    Поиск музыки теми же запросами al_audio.php, что делает фронтенд ВК,
+    через requests.Session с cookies, экспортированными из Selenium.
+    При капче/проверке возвращает None — вызывающий код уходит в браузер.
+    """
+
+    _PAGE_LIMIT = 50  # защита от бесконечной подгрузки
+
+    def __init__(self, cookies: list[dict], user_id: str | int | None = None,
+                 base_url: str = "https://vk.com", owner_ids: "_OwnerIdCache | None" = None):
+        self.base_url = base_url.rstrip("/")
+        self.user_id = str(user_id) if user_id else ""
+        # Попутно собираем «короткое имя → ID» из ссылок авторов плейлистов
+        self.owner_ids = owner_ids
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=8)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "User-Agent": _USER_AGENT,
+            "Referer": f"{self.base_url}/audio",
+            "Origin": self.base_url,
+            "X-Requested-With": "XMLHttpRequest",
+            "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
+        })
+        # Домен — как у cookie в браузере (.vk.com): сессия не уходит на чужие хосты
+        for cookie in cookies or []:
+            name = cookie.get("name")
+            if name:
+                self.session.cookies.set(
+                    name, cookie.get("value", ""),
+                    domain=cookie.get("domain", ""), path=cookie.get("path", "/"),
+                )
+
+    @classmethod
+    def from_driver(cls, driver, base_url: str = "https://vk.com",
+                    owner_ids: "_OwnerIdCache | None" = None):
+        """Собирает клиент из cookies и id пользователя текущей сессии браузера."""
+        cookies = driver.get_cookies()
+        try:
+            user_id = driver.execute_script(
+                "try { return (window.vk && window.vk.id) || null } catch(e) { return null }"
+            )
+        except Exception:
+            user_id = None
+        return cls(cookies, user_id=user_id, base_url=base_url, owner_ids=owner_ids)
+
+    @classmethod
+    def from_session_file(cls, path: str, base_url: str = "https://vk.com",
+                          owner_ids: "_OwnerIdCache | None" = None):
+        """Собирает клиент из cookies, сохранённых _save_session (без браузера)."""
+        with open(path, "r", encoding="utf-8") as f:
+            session = json.load(f)
+        cookies = session.get("cookies") or []
+        if not cookies:
+            raise ValueError(f"в {path} нет cookies")
+        return cls(cookies, user_id=session.get("user_id"), base_url=base_url, owner_ids=owner_ids)
+
+    def search(self, query: str, count: int) -> list[tuple] | None:
+        """
+        Ищет треки. count=0 — всё, что отдаст ВК.
+        Возвращает список кортежей как у _parse_search_results или None при проверке/ошибке.
+        """
+        limit = count if count > 0 else None
+        try:
+            payload = self._post("section", {
+                "act": "section",
+                "al": 1,
+                "claim": 0,
+                "is_layer": 0,
+                "owner_id": self.user_id,
+                "q": query,
+                "section": "search",
+            })
+            results, seen = [], set()
+            playlist = self._collect(payload, results, seen, limit)
+
+            pages = 0
+            while (playlist and playlist.get("hasMore")
+                   and (limit is None or len(results) < limit)
+                   and pages < self._PAGE_LIMIT):
+                pages += 1
+                before = len(results)
+                payload = self._post("load_section", {
+                    "act": "load_section",
+                    "al": 1,
+                    "claim": 0,
+                    "offset": playlist.get("nextOffset") or len(results),
+                    "owner_id": playlist.get("ownerId") or self.user_id,
+                    "playlist_id": playlist.get("id") or "",
+                    "access_hash": playlist.get("accessHash") or "",
+                    "type": playlist.get("type") or "search",
+                    "is_loading_all": 1,
+                })
+                playlist = self._collect(payload, results, seen, limit)
+                if len(results) == before:
+                    break
+
+            log_message(f"INFO: HTTP-поиск {query!r}: {len(results)} треков, доп. страниц: {pages}")
+            return results[:limit] if limit else results
+
+        except _VKChallenge as e:
+            log_message(f"WARNING: HTTP-поиск упёрся в проверку ВК ({e}), нужен браузер")
+            return None
+        except Exception as e:
+            log_message(f"WARNING: HTTP-поиск не удался: {e}")
+            return None
+
+    def iter_playlist(self, owner_id: str, playlist_id: str | int, access_hash: str = "",
+                      offset: int = 0):
+        """
+        Постранично отдаёт плейлист (playlist_id=-1 — все аудиозаписи владельца),
+        начиная с offset: (треки страницы, следующий offset, есть ли ещё).
+        Без ограничения числа страниц — для режима «вся коллекция».
+        Капча/проверка — исключение _VKChallenge.
+        """
+        while True:
+            payload = self._post("load_section", {
+                "act": "load_section",
+                "al": 1,
+                "claim": 0,
+                "offset": offset,
+                "owner_id": owner_id,
+                "playlist_id": playlist_id,
+                "access_hash": access_hash,
+                "type": "playlist",
+                "is_loading_all": 1,
+            })
+            tracks = []
+            playlist = self._collect(payload, tracks, set(), None)
+            if playlist is None and not tracks:
+                raise _VKChallenge("в ответе нет плейлиста")
+            next_offset = (playlist or {}).get("nextOffset") or offset + len(tracks)
+            has_more = bool(tracks) and bool((playlist or {}).get("hasMore"))
+            yield tracks, next_offset, has_more
+            if not has_more:
+                return
+            offset = next_offset
+
+    def _post(self, act: str, data: dict):
+        """POST на al_audio.php и разбор ответа фронтенда ({"payload": [code, [...]]})."""
+        t0 = time.perf_counter()
+        result = "error"
+        try:
+            payload = self._post_payload(act, data)
+            result = "ok"
+            return payload
+        except _VKChallenge:
+            result = "challenge"
+            raise
+        finally:
+            _metrics.observe("vk_http_seconds", time.perf_counter() - t0, act=act)
+            _metrics.inc("vk_http_requests_total", act=act, result=result)
+
+    def _post_payload(self, act: str, data: dict):
+        resp = self.session.post(
+            f"{self.base_url}/al_audio.php?act={act}",
+            data=data,
+            timeout=20,
+            allow_redirects=False,
+        )
+        location = resp.headers.get("Location", "")
+        if resp.status_code in (301, 302, 303, 307, 308):
+            raise _VKChallenge(f"редирект на {location or '?'}")
+        resp.raise_for_status()
+
+        text = resp.text.lstrip()
+        if text.startswith("<!--"):
+            text = text[4:]
+        if "challenge.html" in text[:2000] or "captcha_sid" in text[:2000]:
+            raise _VKChallenge("captcha/challenge в ответе")
+        try:
+            doc = json.loads(text)
+        except ValueError:
+            raise _VKChallenge("ответ не JSON (страница проверки?)")
+
+        payload = doc.get("payload") if isinstance(doc, dict) else None
+        if not isinstance(payload, list) or not payload:
+            raise _VKChallenge("пустой payload")
+        code = str(payload[0])
+        if code not in ("0", ""):
+            # 2 — капча, 3 — требуется вход, 8 — ошибка доступа
+            raise _VKChallenge(f"код ответа {code}")
+        return payload[1] if len(payload) > 1 else []
+
+    def _collect(self, node, results: list, seen: set, limit: int | None) -> dict | None:
+        """
+        Обходит payload: массивы аудио из playlist.list разбираем через
+        _track_from_audio_data, HTML с audio_row — через _parse_search_results.
+        Возвращает описание плейлиста (для догрузки) или None.
+        """
+        playlist = None
+        stack = [node]
+        while stack:
+            cur = stack.pop(0)
+            if limit is not None and len(results) >= limit:
+                break
+            if isinstance(cur, dict):
+                if self.owner_ids is not None and cur.get("ownerId") and cur.get("authorHref"):
+                    self.owner_ids.put(str(cur["authorHref"]).split("?")[0], cur["ownerId"])
+                items = cur.get("list")
+                if isinstance(items, list) and items and isinstance(items[0], list):
+                    if playlist is None:
+                        playlist = cur
+                    for data in items:
+                        track = VKEngine._track_from_audio_data(data, seen)
+                        if track is not None:
+                            results.append(track)
+                            if limit is not None and len(results) >= limit:
+                                break
+                    continue
+                stack.extend(cur.values())
+            elif isinstance(cur, list):
+                stack.extend(cur)
+            elif isinstance(cur, str) and "audio_row" in cur:
+                for track in VKEngine._parse_search_results(cur, None):
+                    if track[5] in seen:
+                        continue
+                    seen.add(track[5])
+                    results.append(track)
+        return playlist
+
+
+# ------------------------------------------------------
+# КЭШ РЕЗУЛЬТАТОВ ПОИСКА
+# ------------------------------------------------------
+class _ResultCache:
+    """
+    Кэш результатов поиска/плейлистов/профилей: LRU на max_entries записей,
+    каждая живёт ttl секунд. На диске — gzip JSON, треки хранятся списками.
+    Запись помнит интерфейс ВК, с которого получена (store/new/legacy/http),
+    и страницу, на которой были треки (нужна для клика при скачивании).
+    Сменилась вёрстка ВК (браузер видит legacy вместо new/store или наоборот) —
+    записи, снятые со старой, удаляются; http и unknown о вёрстке не говорят.
+    put() только помечает кэш изменённым: на диск его пишет flush() — в конце
+    поиска или пакета и при выходе.
+    """
+
+    _VERSION = 1
+    # Интерфейс, с которого сняты треки → вёрстка ВК
+    _LAYOUTS = {"legacy": "legacy", "new": "new", "store": "new"}
+
+    def __init__(self, path: str, max_entries: int = 200, ttl: float = 6 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        # Последняя вёрстка, которую видел браузер (см. _LAYOUTS)
+        self._layout: str | None = None
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._load()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def make_key(kind: str, value: str, count: int) -> str:
+        """kind: q — запрос, pl — плейлист, pr — профиль. Запрос нормализуется."""
+        value = " ".join((value or "").split())
+        if kind != "pl":
+            value = value.casefold()
+        return f"{kind}:{value}|{count}"
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry["ts"] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        _metrics.inc("vk_cache_lookups_total", result="hit" if entry is not None else "miss")
+        return entry
+
+    def put(self, key: str, tracks: list, interface: str, page_url: str | None = None):
+        layout = self._LAYOUTS.get(interface)
+        with self._lock:
+            if layout and self._layout and layout != self._layout:
+                # Вёрстка ВК сменилась — записи со старой больше не годятся
+                stale = [k for k, v in self._entries.items()
+                         if self._LAYOUTS.get(v.get("interface")) == self._layout]
+                for k in stale:
+                    del self._entries[k]
+                log_message(
+                    f"INFO: кэш: интерфейс {self._layout} → {layout}, "
+                    f"удалено записей: {len(stale)}"
+                )
+            if layout:
+                self._layout = layout
+            self._entries[key] = {
+                "ts": time.time(),
+                "interface": interface,
+                "url": page_url,
+                "tracks": [list(t) for t in tracks],
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def invalidate_interface(self, interface: str):
+        """Удаляет все записи, полученные с указанного интерфейса."""
+        with self._lock:
+            for k in [k for k, v in self._entries.items() if v.get("interface") == interface]:
+                del self._entries[k]
+            self._dirty = True
+        self.flush()
+
+    def _load(self):
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                doc = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            log_message(f"WARNING: кэш результатов повреждён, начинаю заново: {e}")
+            return
+        if doc.get("version") != self._VERSION:
+            return
+        self._layout = doc.get("layout")
+        now = time.time()
+        for key, entry in doc.get("entries", []):
+            if now - entry.get("ts", 0) <= self.ttl:
+                self._entries[key] = entry
+
+    def flush(self):
+        """Пишет кэш на диск, если он менялся с прошлой записи."""
+        # Снимок и запись под одной блокировкой: старый снимок не затрёт новый
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                self._dirty = False
+                doc = {"version": self._VERSION, "layout": self._layout,
+                       "entries": list(self._entries.items())}
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = self.path + ".tmp"
+                with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                    json.dump(doc, f, ensure_ascii=False, separators=(",", ":"))
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                log_message(f"WARNING: не удалось сохранить кэш результатов: {e}")
+
+
+class _OwnerIdCache:
+    """
+    Короткое имя профиля/группы → числовой ID владельца (группа — с минусом).
+    Заполняется попутно: при разборе профиля, по адресу /audios<id>, по ссылкам
+    авторов в ответах al_audio.php. Хранится в JSON, записи живут ttl секунд
+    (короткое имя могут сменить).
+    """
+
+    _CANONICAL_RE = re.compile(r'^(?:(id)|club|public|event)(\d+)$')
+
+    def __init__(self, path: str, ttl: float = 30 * 24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self._ids: dict[str, list] = {}
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._ids = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log_message(f"WARNING: кэш ID владельцев повреждён, начинаю заново: {e}")
+
+    @classmethod
+    def parse_canonical(cls, name: str) -> str | None:
+        """id123 → 123, club123/public123/event123 → -123, иначе None."""
+        m = cls._CANONICAL_RE.match((name or "").lower())
+        if not m:
+            return None
+        return m.group(2) if m.group(1) else f"-{m.group(2)}"
+
+    def get(self, name: str) -> str | None:
+        canonical = self.parse_canonical(name)
+        if canonical:
+            return canonical
+        with self._lock:
+            entry = self._ids.get((name or "").lower())
+        if entry is None or time.time() - entry[1] > self.ttl:
+            return None
+        return entry[0]
+
+    def put(self, name: str, owner_id) -> bool:
+        """Запоминает соответствие; True — если оно новое."""
+        name = (name or "").strip("/").lower()
+        owner_id = str(owner_id)
+        if (not name or not re.fullmatch(r'-?\d+', owner_id) or owner_id in ("0", "-0")
+                or self.parse_canonical(name) or not re.fullmatch(r'[\w.]+', name)):
+            return False
+        with self._lock:
+            old = self._ids.get(name)
+            if old is not None and old[0] == owner_id and time.time() - old[1] < self.ttl / 2:
+                return False
+            self._ids[name] = [owner_id, time.time()]
+            data = dict(self._ids)
+        log_message("DEBUG: ID владельца: %s → %s", name, owner_id)
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + f".{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            log_message(f"WARNING: не удалось сохранить кэш ID владельцев: {e}")
+        return True
+
+
+class _DriverPathCache:
+    """
+    Путь к ChromeDriver и версия Chrome, для которой он подобран. Версию
+    установленного Chrome узнаём без его запуска — из <профиль>/Last Version
+    (Chrome пишет её при каждом старте). Сменилась версия или файла драйвера
+    больше нет — кэш не действует.
+    """
+
+    def __init__(self, path: str, profile_dir: str):
+        self.path = path
+        self.profile_dir = profile_dir
+        self._lock = threading.Lock()
+
+    def chrome_version(self) -> str | None:
+        try:
+            with open(os.path.join(self.profile_dir, "Last Version"), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def get(self) -> str | None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            driver_path = entry["driver_path"]
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log_message(f"WARNING: кэш пути ChromeDriver повреждён: {e}")
+            return None
+        current = self.chrome_version()
+        if current and current != entry.get("chrome_version"):
+            log_message(
+                f"INFO: Chrome обновился ({entry.get('chrome_version')} → {current}), "
+                f"ChromeDriver подбирается заново"
+            )
+            return None
+        if not driver_path or not os.path.isfile(driver_path):
+            return None
+        return driver_path
+
+    def put(self, driver_path: str | None, chrome_version: str | None):
+        if not driver_path or not chrome_version:
+            return
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = self.path + f".{threading.get_ident()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"driver_path": driver_path, "chrome_version": chrome_version}, f)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                log_message(f"WARNING: не удалось сохранить путь ChromeDriver: {e}")
+
+    def forget(self):
+        with self._lock:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+class _CollectionSpool:
+    """
+    Треки большой коллекции на диске: <ключ>.jsonl — по треку в строке,
+    <ключ>.json — контрольная точка {source, offset, count, size, done}.
+    В памяти — только full_id уже записанных треков и буфер до checkpoint_every.
+    При открытии незаконченной коллекции продолжает с контрольной точки:
+    строки, дописанные после неё, отбрасываются.
+    """
+
+    def __init__(self, directory: str, source: str, checkpoint_every: int = 500):
+        key = hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+        self.tracks_path = os.path.join(directory, f"{key}.jsonl")
+        self.meta_path = os.path.join(directory, f"{key}.json")
+        self.source = source
+        self.checkpoint_every = checkpoint_every
+
+        self.offset: int | None = None  # позиция в списке: offset HTTP или строка браузера
+        self.count = 0
+        self.resumed = 0
+        self._size = 0
+        self._seen: set[str] = set()
+        self._buffer: list[tuple] = []
+
+        os.makedirs(directory, exist_ok=True)
+        self._resume()
+
+    def _resume(self):
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = None
+
+        try:
+            tracks_size = os.path.getsize(self.tracks_path)
+        except OSError:
+            tracks_size = -1
+        if (not meta or meta.get("source") != self.source or meta.get("done")
+                or tracks_size < meta.get("size", 0)):
+            # Новая загрузка: законченная коллекция перечитывается заново, а
+            # если файл треков удалён или короче контрольной точки — с нуля
+            if meta and not meta.get("done") and tracks_size < meta.get("size", 0):
+                log_message(
+                    f"WARNING: коллекция {self.source}: файл треков не совпадает "
+                    f"с контрольной точкой, загружаю заново"
+                )
+            open(self.tracks_path, "w", encoding="utf-8").close()
+            return
+
+        with open(self.tracks_path, "r+b") as f:
+            f.truncate(meta.get("size", 0))
+        for track in self.iter_tracks():
+            self._seen.add(track[5])
+        self.count = self.resumed = len(self._seen)
+        self._size = meta.get("size", 0)
+        self.offset = meta.get("offset")
+        log_message(
+            f"INFO: коллекция {self.source}: продолжаю с {self.count} треков "
+            f"(offset {self.offset})"
+        )
+
+    def add(self, tracks, offset: int | None = None) -> list[tuple]:
+        """
+        Дописывает новые (по full_id) треки; возвращает их. offset — позиция
+        в списке после них; назад не сдвигается (браузер начинает сверху).
+        """
+        new = []
+        for track in tracks:
+            if track[5] in self._seen:
+                continue
+            self._seen.add(track[5])
+            new.append(track)
+        self._buffer.extend(new)
+        self.count += len(new)
+        if offset is not None and offset > (self.offset or 0):
+            self.offset = offset
+        if len(self._buffer) >= self.checkpoint_every:
+            self.checkpoint()
+        return new
+
+    def checkpoint(self, done: bool = False):
+        """Сбрасывает буфер на диск и атомарно записывает контрольную точку."""
+        if self._buffer:
+            with open(self.tracks_path, "a", encoding="utf-8") as f:
+                for track in self._buffer:
+                    f.write(json.dumps(list(track), ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+                self._size = f.tell()
+            self._buffer = []
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "source": self.source,
+                "offset": self.offset,
+                "count": self.count,
+                "size": self._size,
+                "done": done,
+                "updated": time.time(),
+            }, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def iter_tracks(self, limit: int | None = None):
+        """Треки, уже записанные на диск (без буфера)."""
+        with open(self.tracks_path, "r", encoding="utf-8") as f:
+            for n, line in enumerate(f):
+                if limit is not None and n >= limit:
+                    return
+                try:
+                    yield Track.from_row(json.loads(line))
+                except ValueError:
+                    return
@@ -1,84 +1,29 @@
 # VKSearch 0.1.1
 # © DumbVibeCode 14.12.2025
 #
+# Окно поиска (PyQt5). Поиск, ссылки и скачивание — в vk_engine.VKEngine,
+# окно подписано на его события (статус, прогресс).
+#
 
 import sys
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout,
-    QLabel, QLineEdit, QPushButton, QTableWidget, QTableWidgetItem,
+    QLabel, QLineEdit, QPushButton, QTableView,
     QGroupBox, QProgressBar, QMenu, QAction, QMessageBox, QFileDialog,
-    QAbstractItemView, QHeaderView, QSizePolicy
+    QAbstractItemView, QHeaderView, QSizePolicy, QCheckBox
+)
+from PyQt5.QtCore import (
+    Qt, pyqtSignal, QObject, QAbstractTableModel, QAbstractProxyModel, QModelIndex
 )
-from PyQt5.QtCore import Qt, pyqtSignal, QObject
 from PyQt5.QtGui import QFont, QKeySequence
 from PyQt5.QtWidgets import QShortcut
-import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from queue import Queue
+from array import array
 import time
-import json
-import subprocess
-import os
-import tempfile
 import re
-from urllib.parse import quote_plus
-
-# ------------------------------------------------------
-# ЛОГГЕР
-# ------------------------------------------------------
-try:
-    from logger import log_message
-except Exception:
-    def log_message(msg: str):
-        print(msg)
-
-# Флаги наличия зависимостей
-SELENIUM_AVAILABLE = True
-REQUESTS_AVAILABLE = True
-YTDLP_AVAILABLE = True
-
-# ------------------------------------------------------
-# SELENIUM + BS4
-# ------------------------------------------------------
-try:
-    from selenium import webdriver
-    from selenium.webdriver.common.by import By
-    from selenium.webdriver.support.ui import WebDriverWait
-    from selenium.webdriver.support import expected_conditions as EC
-    from webdriver_manager.chrome import ChromeDriverManager
-    from selenium.webdriver.chrome.service import Service
-except Exception as e:
-    SELENIUM_AVAILABLE = False
-    log_message(f"ERROR: Selenium не доступен: {e}")
-
-try:
-    from bs4 import BeautifulSoup
-except Exception as e:
-    SELENIUM_AVAILABLE = False
-    log_message(f"ERROR: BeautifulSoup (bs4) не доступен: {e}")
-
-# ------------------------------------------------------
-# requests для скачивания
-# ------------------------------------------------------
-try:
-    import requests
-except Exception as e:
-    REQUESTS_AVAILABLE = False
-    log_message(f"ERROR: requests не доступен: {e}")
-
-# ------------------------------------------------------
-# yt-dlp для скачивания с ВК
-# ------------------------------------------------------
-try:
-    import yt_dlp
-except Exception as e:
-    YTDLP_AVAILABLE = False
-    log_message(f"WARNING: yt-dlp не доступен (pip install yt-dlp): {e}")
-
-# Глобальный инстанс
-_app_instance = None
-_standalone_mode = False
 
+from vk_engine import (
+    log_message, VKEngine, Track, SELENIUM_AVAILABLE, PREFETCH_ENABLED, PREFETCH_TOP_N,
+)
 
 # ------------------------------------------------------
 # Вспомогательный класс окна поиска
@@ -102,39 +47,367 @@ class _SearchWindow(QWidget):
         event.ignore()
 
 
+class _TrackTableModel(QAbstractTableModel):
+    """
+    Результаты поиска для QTableView: строка → Track, без объекта на ячейку.
+    В таблице видны исполнитель, название, длительность и владелец;
+    url и full_id отдают track()/full_id().
+    Повторы по full_id не добавляются. Для сортировки при добавлении считаются
+    ключи видимых столбцов (sort_keys): длительность в секундах, строки —
+    в свёрнутом регистре.
+
+    Для фильтра (filter_rows) ведётся словарь слов исполнителя, названия и
+    владельца → номера строк. Слова и запрос приводятся к одной форме:
+    свёрнутый регистр + кириллица транслитом ("кино" находит "Kino" и наоборот).
+    """
+
+    HEADERS = ("Исполнитель", "Название", "Длительность", "Владелец")
+
+    _TRANSLIT = str.maketrans({
+        "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e",
+        "ж": "zh", "з": "z", "и": "i", "й": "i", "к": "k", "л": "l", "м": "m",
+        "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u",
+        "ф": "f", "х": "kh", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "sch",
+        "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+        "і": "i", "ї": "i", "є": "e", "ґ": "g",
+    })
+    _WORD_RE = re.compile(r"\w+")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._tracks: list[Track] = []
+        self._keys: list[list] = [[] for _ in self.HEADERS]
+        self._ids: set[str] = set()
+        self._words: dict[str, array] = {}
+
+    @classmethod
+    def normalize_words(cls, text: str) -> list[str]:
+        return cls._WORD_RE.findall(text.casefold().translate(cls._TRANSLIT))
+
+    @staticmethod
+    def _collate(text: str) -> str:
+        return text.casefold().replace("ё", "е")
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._tracks)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            track = self._tracks[index.row()]
+            column = index.column()
+            if column == 0:
+                return track.artist
+            if column == 1:
+                return track.title
+            if column == 2:
+                return track.duration_str
+            return track.owner
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal and section < len(self.HEADERS):
+            return self.HEADERS[section]
+        return None
+
+    def flags(self, index):
+        return Qt.ItemIsSelectable | Qt.ItemIsEnabled
+
+    def append(self, tracks) -> int:
+        """Дописывает треки одним beginInsertRows; возвращает число добавленных."""
+        new_tracks = []
+        for row in tracks:
+            if len(row) < 3:
+                continue
+            track = Track.from_row(row)
+            if track.full_id:
+                if track.full_id in self._ids:
+                    continue
+                self._ids.add(track.full_id)
+            new_tracks.append(track)
+        if not new_tracks:
+            return 0
+
+        first = len(self._tracks)
+        self.beginInsertRows(QModelIndex(), first, first + len(new_tracks) - 1)
+        self._tracks.extend(new_tracks)
+        collate = self._collate
+        self._keys[0].extend(collate(t.artist) for t in new_tracks)
+        self._keys[1].extend(collate(t.title) for t in new_tracks)
+        self._keys[2].extend(t.duration for t in new_tracks)
+        self._keys[3].extend(collate(t.owner) for t in new_tracks)
+        words_index = self._words
+        for row_no, track in enumerate(new_tracks, first):
+            for word in set(self.normalize_words(f"{track.artist} {track.title} {track.owner}")):
+                postings = words_index.get(word)
+                if postings is None:
+                    words_index[word] = postings = array("I")
+                postings.append(row_no)
+        self.endInsertRows()
+        return len(new_tracks)
+
+    def clear(self):
+        self.beginResetModel()
+        self._tracks = []
+        self._keys = [[] for _ in self.HEADERS]
+        self._ids = set()
+        self._words = {}
+        self.endResetModel()
+
+    def sort_keys(self, column: int) -> list:
+        return self._keys[column]
+
+    def filter_rows(self, text: str, first: int = 0) -> set[int]:
+        """
+        Строки (начиная с first), где каждое слово запроса — часть какого-нибудь
+        слова исполнителя/названия/владельца. Перебирается словарь слов,
+        а не строки, поэтому на десятках тысяч строк укладывается в кадр.
+        """
+        tokens = sorted(set(self.normalize_words(text)), key=len, reverse=True)
+        result: set[int] | None = None
+        for token in tokens:
+            rows = set()
+            for word, postings in self._words.items():
+                if token in word:
+                    rows.update(postings)
+            result = rows if result is None else result & rows
+            if not result:
+                return set()
+        if result is None:
+            result = set(range(len(self._tracks)))
+        if first:
+            result = {r for r in result if r >= first}
+        return result
+
+    def track(self, row: int) -> Track:
+        return self._tracks[row]
+
+    def full_id(self, row: int) -> str:
+        return self._tracks[row].full_id
+
+
+class _TrackProxyModel(QAbstractProxyModel):
+    """
+    Порядок строк поверх _TrackTableModel — список номеров строк источника.
+    Сортировка по заранее посчитанным ключам (sort_keys), устойчивая (при
+    равенстве — порядок загрузки) и по нескольким столбцам сразу.
+    Выделение и прочие persistent-индексы при пересортировке сохраняются.
+    Догруженные строки встают на место бинарным поиском (beginInsertRows),
+    полная пересортировка — только при смене сортировки или фильтра.
+    Фильтр (set_filter) оставляет только строки из _TrackTableModel.filter_rows.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows: list[int] = []       # строка прокси → строка источника
+        self._proxy_of: list[int] = []   # строка источника → строка прокси
+        self.sort_spec: list[tuple[int, int]] = []  # [(столбец, Qt.SortOrder)], главный — первый
+        self.filter_text = ""
+        self._matches: set[int] | None = None  # None — фильтра нет
+
+    def setSourceModel(self, model):
+        super().setSourceModel(model)
+        model.rowsInserted.connect(self._on_rows_inserted)
+        model.modelReset.connect(self._on_reset)
+        self._on_reset()
+
+    # ---- отображение ----
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.sourceModel().columnCount()
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or not (0 <= row < len(self._rows)) or not (0 <= column < self.columnCount()):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=QModelIndex()):
+        return QModelIndex()
+
+    def mapToSource(self, proxy_index):
+        if not proxy_index.isValid():
+            return QModelIndex()
+        return self.sourceModel().index(self._rows[proxy_index.row()], proxy_index.column())
+
+    def mapFromSource(self, source_index):
+        if not source_index.isValid():
+            return QModelIndex()
+        return self.index(self._proxy_of[source_index.row()], source_index.column())
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        return self.sourceModel().headerData(section, orientation, role)
+
+    def source_row(self, row: int) -> int:
+        return self._rows[row]
+
+    # ---- сортировка ----
+    def sort(self, column: int, order=Qt.AscendingOrder):
+        self.set_sort([(column, order)])
+
+    def set_sort(self, spec: list[tuple[int, int]]):
+        self.sort_spec = list(spec)
+        self._set_rows(self._ordered_rows())
+
+    def set_filter(self, text: str):
+        self.filter_text = text.strip()
+        self._matches = self.sourceModel().filter_rows(self.filter_text) if self.filter_text else None
+        self._set_rows(self._ordered_rows())
+
+    def _ordered_rows(self) -> list[int]:
+        if self._matches is not None:
+            rows = sorted(self._matches)
+        else:
+            rows = list(range(self.sourceModel().rowCount()))
+        return self._sort_rows(rows)
+
+    def _sort_rows(self, rows: list[int]) -> list[int]:
+        # Устойчивая сортировка от младшего ключа к старшему
+        for column, order in reversed(self.sort_spec):
+            keys = self.sourceModel().sort_keys(column)
+            rows.sort(key=keys.__getitem__, reverse=order == Qt.DescendingOrder)
+        return rows
+
+    def _before(self, a: int, b: int) -> bool:
+        """Строка источника a идёт раньше b по ключам сортировки (равные — нет)."""
+        for column, order in self.sort_spec:
+            keys = self.sourceModel().sort_keys(column)
+            if keys[a] != keys[b]:
+                return keys[a] > keys[b] if order == Qt.DescendingOrder else keys[a] < keys[b]
+        return False
+
+    def _insert_position(self, src: int) -> int:
+        """
+        Куда встаёт новая строка: после всех строк с теми же ключами — они
+        загружены раньше (как при устойчивой сортировке). Без сортировки — в конец.
+        """
+        lo, hi = 0, len(self._rows)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._before(src, self._rows[mid]):
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def _set_rows(self, rows: list[int]):
+        self.layoutAboutToBeChanged.emit()
+        old_indexes = self.persistentIndexList()
+        old_sources = [self._rows[i.row()] for i in old_indexes]
+        self._rows = rows
+        self._rebuild_reverse()
+        self.changePersistentIndexList(
+            old_indexes,
+            [self.index(self._proxy_of[src], i.column()) for src, i in zip(old_sources, old_indexes)],
+        )
+        self.layoutChanged.emit()
+
+    def _rebuild_reverse(self):
+        self._proxy_of = [-1] * self.sourceModel().rowCount()
+        for proxy_row, src in enumerate(self._rows):
+            self._proxy_of[src] = proxy_row
+
+    # ---- изменения источника ----
+    def _on_reset(self):
+        self.beginResetModel()
+        self._matches = set() if self.filter_text else None
+        self._rows = list(range(self.sourceModel().rowCount()))
+        self._rebuild_reverse()
+        self.endResetModel()
+
+    def _on_rows_inserted(self, parent, first, last):
+        new_rows = list(range(first, last + 1))
+        self._proxy_of.extend([-1] * len(new_rows))
+        if self._matches is not None:
+            matched = self.sourceModel().filter_rows(self.filter_text, first)
+            self._matches |= matched
+            new_rows = [r for r in new_rows if r in matched]
+        if not new_rows:
+            return
+        if not self.sort_spec:
+            start = len(self._rows)
+            self.beginInsertRows(QModelIndex(), start, start + len(new_rows) - 1)
+            self._rows.extend(new_rows)
+            for proxy_row, src in enumerate(new_rows, start):
+                self._proxy_of[src] = proxy_row
+            self.endInsertRows()
+            return
+
+        # Новые строки упорядочиваем между собой и бинарным поиском находим
+        # место каждой среди уже показанных; строки, встающие в одно место,
+        # вставляются одним beginInsertRows. Вставляем с конца, чтобы позиции
+        # впереди не сдвигались.
+        new_rows = self._sort_rows(new_rows)
+        positions = [self._insert_position(src) for src in new_rows]
+        end = len(new_rows)
+        while end > 0:
+            start = end - 1
+            while start > 0 and positions[start - 1] == positions[end - 1]:
+                start -= 1
+            at = positions[start]
+            self.beginInsertRows(QModelIndex(), at, at + end - start - 1)
+            self._rows[at:at] = new_rows[start:end]
+            self.endInsertRows()
+            end = start
+        self._rebuild_reverse()
+
+
+# Глобальный инстанс
+_app_instance = None
+_standalone_mode = False
+
+
 class VKMusicSearchApp(QObject):
     """
     - открывает vk.com в Selenium-браузере;
     - ждёт логина;
     - даёт окно поиска, парсит data-audio;
     - по ПКМ по треку можно копировать и скачивать.
+
+    Вся работа с ВК — в self.engine (VKEngine) через его публичные методы;
+    здесь только виджеты и обработка событий движка.
     """
 
     _call_in_main = pyqtSignal(object)
+    # События движка приходят из его потоков — в окно через сигнал
+    _engine_event = pyqtSignal(dict)
 
     def __init__(self, parent=None, auto_open_browser: bool = True):
         super().__init__()
         self._call_in_main.connect(lambda fn: fn())
 
-        self.driver = None
+        self.engine = VKEngine()
+        # Потеря входа посреди пакета: открываем окно браузера для повторного входа
+        self.engine.relogin_interactive = True
+        self._engine_event.connect(self._on_engine_event)
+        self.engine.subscribe(self._engine_event.emit)
 
         self.search_window: _SearchWindow | None = None
         self.query_edit: QLineEdit | None = None
         self.count_edit: QLineEdit | None = None
+        self.full_collection_check: QCheckBox | None = None
+        self.filter_edit: QLineEdit | None = None
         self.search_status_label: QLabel | None = None
         self.progress_bar: QProgressBar | None = None
         self.speed_label: QLabel | None = None
         self.batch_progress_label: QLabel | None = None
-        self.tree: QTableWidget | None = None
+        self.tree: QTableView | None = None
+        self.track_model: _TrackTableModel | None = None
+        self.track_proxy: _TrackProxyModel | None = None
         self.btn_search: QPushButton | None = None
+        self.btn_batch: QPushButton | None = None
         self.btn_download: QPushButton | None = None
 
-        # Для отслеживания скорости скачивания
-        self._download_start_time: float = 0
-        self._download_bytes: int = 0
-        self._batch_download_mode: bool = False  # Флаг пакетного скачивания
-
-        self._tree_sort_reverse: dict[int, bool] = {}
+        # Потоковый вывод результатов: номер текущего поиска — tag событий
+        # движка (треки от прежних поисков отбрасываются)
+        self._search_generation: int = 0
+        # Откуда пришли результаты текущего поиска (событие "results")
+        self._results_source: str | None = None
+        # Запрос введён, пока браузер запускался
+        self._queued_while_starting = False
 
         if not SELENIUM_AVAILABLE:
             QMessageBox.critical(
@@ -154,121 +427,69 @@ class VKMusicSearchApp(QObject):
     # --------------------------------------------------
 
     def _open_browser_and_wait_for_login(self):
-        """Запускает браузер и в фоне ждёт входа в ВК."""
-        def worker():
-            try:
-                log_message("INFO: запуск Selenium-браузера для ВК")
-
-                options = webdriver.ChromeOptions()
-                options.add_argument("--start-maximized")
-                options.add_argument("--disable-blink-features=AutomationControlled")
-                options.add_argument(
-                    "user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                    "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"
-                )
+        """
+        Сразу открывает окно поиска, а браузер запускает и ждёт входа в ВК
+        в фоне (VKEngine.start_session). Запросы, введённые до готовности
+        браузера, движок выполнит, когда он запустится.
+        """
+        future = self.engine.start_session()
+        self._show_search_window()
+        self._set_status("Запускаю браузер ВК...")
+        future.add_done_callback(self._in_main(self._on_session_started))
 
-                # Включаем performance logging для перехвата сетевых запросов
-                options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    def _on_session_started(self, future):
+        try:
+            logged_in = future.result()
+        except Exception as e:
+            log_message(f"ERROR: не удалось запустить браузер ВК: {e}")
+            self._set_status("Браузер ВК не запущен")
+            self._show_error(f"Ошибка запуска браузера ВК: {e}")
+            return
 
-                try:
-                    service = Service(ChromeDriverManager().install())
-                    driver = webdriver.Chrome(service=service, options=options)
-                except Exception as e:
-                    log_message(
-                        f"WARNING: ChromeDriverManager не сработал: {e}, "
-                        f"пробую webdriver.Chrome() по умолчанию"
-                    )
-                    driver = webdriver.Chrome(options=options)
+        if self.search_window is None:
+            # Окно закрыли, пока браузер запускался
+            self.engine.close()
+            return
+        if logged_in:
+            # Если запрос ждал браузер, строку статуса уже ведёт он
+            if not self._queued_while_starting:
+                self._set_status("Браузер ВК готов")
+        else:
+            self._set_status("Войди в ВК в открытом окне браузера")
+            self._show_info(
+                "Не удалось автоматически определить вход в ВК.\n"
+                "Убедись, что ты залогинен в открытом окне браузера."
+            )
 
-                self.driver = driver
-                driver.get("https://vk.com")
-                log_message("INFO: Браузер открыт, жду логина...")
+    def _in_main(self, fn):
+        """Колбэк future движка: fn(future) выполнится в главном потоке."""
+        return lambda future: self._call_in_main.emit(lambda: fn(future))
 
-                self._wait_for_login_background()
+    def _run_job(self, job, generation: int, on_result, error_status: str):
+        """
+        Запускает корутину движка job (поиск, пакет, коллекция) в его фоновом
+        цикле. on_result(результат) — в главном потоке, если за это время не
+        начат новый поиск; ошибка — в строку статуса (error_status.format(ошибка)).
+        """
+        if not self.engine.wait_for_session(0):
+            self._queued_while_starting = True
 
-            except Exception as e:
-                log_message(f"ERROR: не удалось запустить браузер ВК: {e}")
-                self.driver = None
-                self._show_error_async(f"Ошибка запуска браузера ВК: {e}")
-
-        threading.Thread(target=worker, daemon=True).start()
-
-    def _wait_for_login_background(self):
-        """Фоном проверяем, залогинен ли пользователь."""
-        max_wait_sec = 300
-        interval = 2
-        waited = 0
-
-        while waited < max_wait_sec:
-            if self._is_logged_in():
-                log_message("INFO: ВК-вход обнаружен, открываю окно поиска")
-                self._call_in_main.emit(self._show_search_window)
+        def finished(future):
+            if generation != self._search_generation:
                 return
-            time.sleep(interval)
-            waited += interval
-
-        log_message("WARNING: не удалось автоматически определить логин в ВК за отведённое время")
-        self._call_in_main.emit(self._show_search_window)
-        self._show_info_async(
-            "Не удалось автоматически определить вход в ВК.\n"
-            "Убедись, что ты залогинен в открытом окне браузера."
-        )
-
-    def _is_logged_in(self) -> bool:
-        """Проверяем, что пользователь залогинен в ВК."""
-        if self.driver is None:
-            return False
-        try:
-            time.sleep(0.5)
-
-            # Быстрая проверка по URL: на странице логина — точно не залогинены
-            url = self.driver.current_url or ""
-            if "/login" in url or "/join" in url or "id.vk.com" in url:
-                return False
-
-            # Надёжные data-testid атрибуты (актуальные на 2025–2026)
-            testid_selectors = [
-                "[data-testid='header-profile-menu']",
-                "[data-testid='header-profile-menu-button']",
-                "[data-testid='leftmenu']",
-                "[data-testid='header-notification-button']",
-            ]
-            for sel in testid_selectors:
-                if self.driver.find_elements(By.CSS_SELECTOR, sel):
-                    log_message(f"DEBUG: _is_logged_in: найден {sel}")
-                    return True
-
-            # Проверка через JavaScript (user ID в глобальных данных страницы)
+            if self.btn_search:
+                self.btn_search.setEnabled(True)
+            if self.btn_batch:
+                self.btn_batch.setEnabled(True)
             try:
-                user_id = self.driver.execute_script(
-                    "try { return (window.vk && window.vk.id) || null } catch(e) { return null }"
-                )
-                if user_id:
-                    log_message(f"DEBUG: _is_logged_in: user_id={user_id}")
-                    return True
-            except Exception:
-                pass
-
-            # Старые селекторы как запасной вариант
-            legacy_selectors = [
-                "a#top_profile_link",
-                "a.top_profile_link",
-                "a.TopNavBtn__profileLink",
-                "div#side_bar",
-                "nav.left_menu_nav_wrap",
-            ]
-            for sel in legacy_selectors:
-                if self.driver.find_elements(By.CSS_SELECTOR, sel):
-                    log_message(f"DEBUG: _is_logged_in: найден (legacy) {sel}")
-                    return True
-
-        except Exception as e:
-            log_message(f"WARNING: ошибка при проверке логина: {e}")
-        return False
+                result = future.result()
+            except Exception as e:
+                log_message(f"ERROR: {error_status.format(e)}")
+                self._set_status(error_status.format(e))
+                return
+            on_result(result)
 
-    # --------------------------------------------------
-    # ОКНО ПОИСКА
-    # --------------------------------------------------
+        self.engine.run_coroutine(job).add_done_callback(self._in_main(finished))
 
     def _show_search_window(self):
         if self.search_window is not None:
@@ -311,10 +532,24 @@ class VKMusicSearchApp(QObject):
         self.count_edit.setFixedWidth(60)
         search_hlayout.addWidget(self.count_edit)
 
+        self.full_collection_check = QCheckBox("Вся коллекция")
+        self.full_collection_check.setToolTip(
+            "Плейлист/профиль целиком, без ограничения числа треков.\n"
+            "Треки сохраняются на диск, прерванная загрузка продолжается."
+        )
+        search_hlayout.addWidget(self.full_collection_check)
+
         self.btn_search = QPushButton("Искать")
         self.btn_search.clicked.connect(self._start_search)
         search_hlayout.addWidget(self.btn_search)
 
+        self.btn_batch = QPushButton("Пакет…")
+        self.btn_batch.setToolTip(
+            "Файл, по строке на запрос, ссылку на плейлист или профиль ВК"
+        )
+        self.btn_batch.clicked.connect(self._start_batch)
+        search_hlayout.addWidget(self.btn_batch)
+
         self.btn_download = _NoEnterButton("⬇ Скачать выбранные")
         self.btn_download.clicked.connect(self._download_selected_tracks)
         search_hlayout.addWidget(self.btn_download)
@@ -357,30 +592,42 @@ class VKMusicSearchApp(QObject):
         results_group = QGroupBox("Результаты поиска")
         results_vlayout = QVBoxLayout(results_group)
 
-        self.tree = QTableWidget()
-        self.tree.setColumnCount(6)
-        self.tree.setHorizontalHeaderLabels(
-            ["Исполнитель", "Название", "Длительность", "Владелец", "", ""]
-        )
+        filter_hlayout = QHBoxLayout()
+        filter_hlayout.addWidget(QLabel("Фильтр:"))
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("исполнитель, название или владелец (без нового поиска)")
+        self.filter_edit.setClearButtonEnabled(True)
+        self.filter_edit.textChanged.connect(self._apply_filter)
+        self._add_entry_context_menu(self.filter_edit)
+        filter_hlayout.addWidget(self.filter_edit, stretch=1)
+        results_vlayout.addLayout(filter_hlayout)
+
+        # url и audio_full_id живут в модели, столбцов под них нет
+        self.track_model = _TrackTableModel(self.search_window)
+        self.track_proxy = _TrackProxyModel(self.search_window)
+        self.track_proxy.setSourceModel(self.track_model)
+        self.tree = QTableView()
+        self.tree.setModel(self.track_proxy)
 
         header = self.tree.horizontalHeader()
         header.resizeSection(0, 220)
         header.resizeSection(1, 420)
         header.resizeSection(2, 80)
         header.resizeSection(3, 120)
-        header.resizeSection(4, 0)
-        header.resizeSection(5, 0)
         header.setStretchLastSection(False)
 
-        # Скрываем столбцы url и audio_full_id
-        self.tree.setColumnHidden(4, True)
-        self.tree.setColumnHidden(5, True)
+        # Одинаковая высота строк: представлению не нужно измерять каждую
+        vheader = self.tree.verticalHeader()
+        vheader.setSectionResizeMode(QHeaderView.Fixed)
+        vheader.setDefaultSectionSize(self.tree.fontMetrics().height() + 8)
+        self.tree.setWordWrap(False)
 
         self.tree.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.tree.setSelectionMode(QAbstractItemView.ExtendedSelection)
         self.tree.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.tree.verticalHeader().hide()
         self.tree.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.tree.selectionModel().selectionChanged.connect(lambda *_: self._prefetch_selected())
 
         results_vlayout.addWidget(self.tree)
         main_layout.addWidget(results_group, stretch=1)
@@ -395,12 +642,7 @@ class VKMusicSearchApp(QObject):
 
     def _on_search_close(self):
         """Закрыть окно и убить браузер."""
-        try:
-            if self.driver is not None:
-                self.driver.quit()
-        except Exception:
-            pass
-        self.driver = None
+        self.engine.close()
 
         if self.search_window is not None:
             self.search_window.close()
@@ -446,17 +688,20 @@ class VKMusicSearchApp(QObject):
         menu.addAction("Выбрать все", self.tree.selectAll)
         menu.exec_(self.tree.viewport().mapToGlobal(pos))
 
-    def _get_selected_row_values(self):
+    def _selected_rows(self) -> list[int]:
+        """Номера выбранных строк модели (источника) в порядке показа."""
         if not self.tree:
-            return None
-        rows = list(set(item.row() for item in self.tree.selectedItems()))
+            return []
+        return [
+            self.track_proxy.source_row(row)
+            for row in sorted(index.row() for index in self.tree.selectionModel().selectedRows())
+        ]
+
+    def _get_selected_row_values(self):
+        rows = self._selected_rows()
         if not rows:
             return None
-        row = rows[0]
-        return tuple(
-            self.tree.item(row, col).text() if self.tree.item(row, col) else ""
-            for col in range(6)
-        )
+        return self.track_model.track(rows[0])
 
     def _copy_artist_title_from_row(self):
         vals = self._get_selected_row_values()
@@ -468,14 +713,14 @@ class VKMusicSearchApp(QObject):
 
         try:
             QApplication.clipboard().setText(text)
-            self._set_search_status("Исполнитель и название скопированы")
+            self._set_status("Исполнитель и название скопированы")
         except Exception as e:
             log_message(f"WARNING: не удалось скопировать трек в буфер: {e}")
 
     def _copy_owner_link_from_row(self):
         vals = self._get_selected_row_values()
         if not vals or len(vals) < 4:
-            self._set_search_status("Нет данных о владельце")
+            self._set_status("Нет данных о владельце")
             return
 
         owner_val = str(vals[3])
@@ -502,47 +747,37 @@ class VKMusicSearchApp(QObject):
                 url = None
 
         if not url:
-            self._set_search_status("Не удалось построить ссылку на владельца")
+            self._set_status("Не удалось построить ссылку на владельца")
             return
 
         try:
             QApplication.clipboard().setText(url)
-            self._set_search_status("Ссылка на владельца скопирована")
+            self._set_status("Ссылка на владельца скопирована")
         except Exception as e:
             log_message(f"WARNING: не удалось скопировать ссылку владельца: {e}")
 
     # ---- СКАЧИВАНИЕ ----
     def _download_track_from_row(self):
         """
-        Скачивает трек. Получает m3u8 ссылку через клик в браузере,
-        затем скачивает через yt-dlp.
+        Скачивает трек (VKEngine.download): ссылка через клик в браузере
+        и yt-dlp, иначе прямая ссылка.
         """
-        vals = self._get_selected_row_values()
-        if not vals or len(vals) < 6:
-            self._set_search_status("Нет данных для скачивания")
-            log_message("DOWNLOAD: нет vals или длина < 6")
+        track = self._get_selected_row_values()
+        if track is None:
+            self._set_status("Нет данных для скачивания")
             return
 
-        artist = (vals[0] or "").strip()
-        title = (vals[1] or "").strip()
-        direct_url = (vals[4] or "").strip()  # прямая ссылка на mp3
-        audio_full_id = (vals[5] or "").strip()  # owner_id_audio_id
-
-        log_message(f"DOWNLOAD: artist={artist!r}, title={title!r}")
-        log_message(f"DOWNLOAD: direct_url={direct_url[:80] if direct_url else 'None'}...")
-        log_message(f"DOWNLOAD: audio_id={audio_full_id!r}")
+        log_message(f"DOWNLOAD: artist={track.artist!r}, title={track.title!r}")
+        log_message(f"DOWNLOAD: direct_url={track.url[:80] if track.url else 'None'}...")
+        log_message(f"DOWNLOAD: audio_id={track.full_id!r}")
 
-        if not audio_full_id:
-            self._set_search_status("Нет ID трека для скачивания")
+        if not track.full_id:
+            self._set_status("Нет ID трека для скачивания")
             return
 
-        # Безопасное имя файла
-        base_name = f"{artist} - {title}".strip(" -") or "track"
-        safe_name = "".join(c for c in base_name if c not in '<>:"/\\|?*')
-        if not safe_name:
-            safe_name = "track"
-
-        default_filename = safe_name + ".mp3"
+        default_filename = self.engine.safe_filename(
+            track.artist.strip(), track.title.strip(), "track"
+        ) + ".mp3"
 
         path, _ = QFileDialog.getSaveFileName(
             self.search_window,
@@ -551,30 +786,21 @@ class VKMusicSearchApp(QObject):
             "Аудио MP3 (*.mp3);;Все файлы (*)"
         )
         if not path:
-            self._set_search_status("Сохранение отменено")
+            self._set_status("Сохранение отменено")
             return
 
-        def worker():
-            success = False
-
-            # Показываем прогресс-бар
-            self._show_progress_bar()
-            self._update_progress(0, "")
-
-            # Способ 1: получаем m3u8 через клик в браузере и качаем через yt-dlp
-            if self.driver and YTDLP_AVAILABLE:
-                success = self._download_via_browser_intercept(audio_full_id, path)
-
-            # Способ 2: прямая ссылка с cookies
-            if not success and direct_url and direct_url.startswith("http"):
-                success = self._download_via_direct_url(direct_url, path)
-
-            # Скрываем прогресс-бар
-            self._hide_progress_bar()
+        self._show_progress()
 
+        def finished(future):
+            self._hide_progress()
+            try:
+                success = future.result()
+            except Exception as e:
+                log_message(f"ERROR: скачивание трека: {e}")
+                success = False
             if not success:
-                self._set_search_status("Не удалось скачать трек")
-                self._show_error_async(
+                self._set_status("Не удалось скачать трек")
+                self._show_error(
                     "Не удалось скачать трек.\n\n"
                     "Возможные причины:\n"
                     "• Трек недоступен для скачивания\n"
@@ -582,42 +808,25 @@ class VKMusicSearchApp(QObject):
                     "• Нужен yt-dlp и ffmpeg"
                 )
             else:
-                self._set_search_status("✓ Трек скачан!")
+                self._set_status("✓ Трек скачан!")
 
-        threading.Thread(target=worker, daemon=True).start()
+        self.engine.run_coroutine(self.engine.download(track, path)).add_done_callback(
+            self._in_main(finished)
+        )
 
     def _download_selected_tracks(self):
         """
-        Скачивает все выбранные треки в указанную папку.
+        Скачивает все выбранные треки в указанную папку (VKEngine.download_many).
         """
         if not self.tree:
             return
-        rows = list(set(item.row() for item in self.tree.selectedItems()))
+        rows = self._selected_rows()
         if not rows:
-            self._set_search_status("Не выбрано ни одного трека")
+            self._set_status("Не выбрано ни одного трека")
             return
-        # Собираем данные выбранных треков
-        tracks = []
-        for row in rows:
-            vals = tuple(
-                self.tree.item(row, col).text() if self.tree.item(row, col) else ""
-                for col in range(6)
-            )
-            if vals and len(vals) >= 6:
-                artist = (vals[0] or "").strip()
-                title = (vals[1] or "").strip()
-                direct_url = (vals[4] or "").strip()
-                audio_full_id = (vals[5] or "").strip()
-                if audio_full_id:
-                    tracks.append({
-                        'artist': artist,
-                        'title': title,
-                        'direct_url': direct_url,
-                        'audio_full_id': audio_full_id
-                    })
-
+        tracks = [t for t in (self.track_model.track(row) for row in rows) if t.full_id]
         if not tracks:
-            self._set_search_status("Нет треков для скачивания")
+            self._set_status("Нет треков для скачивания")
             return
 
         # Запрашиваем папку для сохранения
@@ -626,1166 +835,107 @@ class VKMusicSearchApp(QObject):
             f"Выберите папку для сохранения ({len(tracks)} треков)"
         )
         if not folder:
-            self._set_search_status("Сохранение отменено")
+            self._set_status("Сохранение отменено")
             return
 
         log_message(f"DOWNLOAD BATCH: {len(tracks)} треков в {folder}")
+        self._show_progress(batch=True)
 
-        def worker():
-            success_count = 0
-            fail_count = 0
-            total = len(tracks)
-            # Устанавливаем флаг пакетного режима
-            self._batch_download_mode = True
-            # Показываем прогресс-бар в пакетном режиме
-            self._show_progress_bar(batch_mode=True)
-
-            # --- НОВОЕ: Список неудачных треков ---
-            failed_tracks_list = []
-            # --- КОНЕЦ НОВОГО ---
-
-            # --- НОВОЕ: Переменные для расчёта ETA ---
-            start_time = time.time()
-            time_per_track = 0
-            # --- КОНЕЦ НОВОГО ---
-
-            for i, track in enumerate(tracks, 1):
-                artist = track['artist']
-                title = track['title']
-                audio_full_id = track['audio_full_id']
-                direct_url = track['direct_url']
-                # Формируем безопасное имя файла
-                base_name = f"{artist} - {title}".strip(" -") or f"track_{i}"
-                safe_name = "".join(c for c in base_name if c not in '<>:"/\\|?*')
-                if not safe_name:
-                    safe_name = f"track_{i}"
-                path = os.path.join(folder, safe_name + ".mp3")
-                # Если файл существует - добавляем номер
-                counter = 1
-                original_path = path
-                while os.path.exists(path):
-                    name_without_ext = original_path.rsplit('.', 1)[0]
-                    path = f"{name_without_ext} ({counter}).mp3"
-                    counter += 1
-
-                # Обновляем общий прогресс (% по количеству треков)
-                overall_percent = (i / total) * 100  # Обновляем до i, а не (i-1)
-
-                # --- НОВОЕ: Расчёт ETA ---
-                current_time = time.time()
-                elapsed_time = current_time - start_time
-                time_per_track = elapsed_time / i  # Среднее время на трек
-                remaining_tracks = total - i
-                eta_seconds = time_per_track * remaining_tracks
-                eta_str = self._format_seconds(eta_seconds)
-                # --- КОНЕЦ НОВОГО ---
-
-                # --- НОВОЕ: Обновление прогресса ---
-                _p = overall_percent
-                _t = f"[{i}/{total}]"
-                _eta = eta_str
-                self._call_in_main.emit(lambda p=_p, t=_t, eta=_eta: (
-                    self.progress_bar.setValue(int(p)),
-                    self.batch_progress_label.setText(f"{t} ~{eta}")
-                ))
-                # --- КОНЕЦ НОВОГО ---
-
-                self._set_search_status(f"{safe_name[:50]}...")
-                log_message(f"DOWNLOAD BATCH [{i}/{total}]: {safe_name}")
-
-                success = False
-                # Способ 1: через браузер
-                if self.driver:
-                    success = self._download_via_browser_intercept(audio_full_id, path)
-                # Способ 2: прямая ссылка
-                if not success and direct_url and direct_url.startswith("http"):
-                    success = self._download_via_direct_url(direct_url, path)
-
-                if success:
-                    success_count += 1
-                    log_message(f"DOWNLOAD BATCH: успешно скачан {safe_name}")
-                else:
-                    fail_count += 1
-                    log_message(f"DOWNLOAD BATCH: не удалось скачать {safe_name}")
-                    # --- НОВОЕ: Добавляем в список неудачных ---
-                    failed_tracks_list.append(track)
-                    # --- КОНЕЦ НОВОГО ---
-
-                # Небольшая пауза между скачиваниями
-                time.sleep(0.5)
-
-            # Скрываем прогресс-бар и сбрасываем флаг
-            self._batch_download_mode = False
-            # Обновляем до 100% и индикатор
-            _tt = f"[{total}/{total}]"
-            self._call_in_main.emit(lambda t=_tt: (
-                self.progress_bar.setValue(100),
-                self.batch_progress_label.setText(t)
-            ))
-            time.sleep(0.3)
-            self._hide_progress_bar()
-
-            # --- НОВОЕ: Сохраняем неудачные треки в файл ---
-            failed_file_path = None
-            if failed_tracks_list:
-                failed_file_path = os.path.join(folder, "failed_tracks.json")
-                try:
-                    with open(failed_file_path, 'w', encoding='utf-8') as f:
-                        json.dump(failed_tracks_list, f, ensure_ascii=False, indent=2)
-                    log_message(f"DOWNLOAD BATCH: список неудачных треков сохранён в {failed_file_path}")
-                except Exception as e:
-                    log_message(f"WARNING: не удалось сохранить список неудачных треков: {e}")
-            # --- КОНЕЦ НОВОГО ---
-
-            # --- НОВОЕ: Повторные попытки для неудачных ---
-            if failed_tracks_list:
-                self._call_in_main.emit(lambda: self._set_search_status(f"Завершено. {success_count} ок, {fail_count} не скачано. Повторные попытки..."))
-                log_message("DOWNLOAD BATCH: начинаю повторные попытки для неудачных треков...")
-                retry_success = 0
-                retry_fail = 0
-                for attempt in range(1, 3): # 2 попытки
-                    log_message(f"DOWNLOAD BATCH: попытка #{attempt} для неудачных треков")
-                    remaining_failed = []
-                    for track in failed_tracks_list:
-                        # Используем те же имена файлов, что и в основной папке
-                        base_name = f"{track['artist']} - {track['title']}".strip(" -") or f"retry_track_{track['audio_full_id']}"
-                        safe_name = "".join(c for c in base_name if c not in '<>:"/\\|?*')
-                        if not safe_name:
-                            safe_name = f"retry_track_{track['audio_full_id']}"
-                        path = os.path.join(folder, safe_name + ".mp3")
-                        # Если файл существует - добавляем номер (на случай, если в основной папке уже есть)
-                        counter = 1
-                        original_path = path
-                        while os.path.exists(path):
-                            name_without_ext = original_path.rsplit('.', 1)[0]
-                            path = f"{name_without_ext} ({counter}).mp3"
-                            counter += 1
-
-                        log_message(f"RETRY [{attempt}/2]: {safe_name}")
-                        success = False
-                        if self.driver:
-                             success = self._download_via_browser_intercept(track['audio_full_id'], path)
-                        if not success and track['direct_url'] and track['direct_url'].startswith("http"):
-                            success = self._download_via_direct_url(track['direct_url'], path)
-
-                        if success:
-                            retry_success += 1
-                            log_message(f"RETRY [{attempt}/2]: успешно скачан {safe_name}")
-                        else:
-                            retry_fail += 1
-                            remaining_failed.append(track) # Добавляем в список оставшихся
-                            log_message(f"RETRY [{attempt}/2]: неудача для {safe_name}")
-                    # Обновляем список неудачных для следующей итерации
-                    failed_tracks_list = remaining_failed
-                    if not failed_tracks_list:
-                        break # Если больше нет неудачных, выходим из цикла попыток
-                    time.sleep(1) # Пауза между попытками
-
-                # Обновляем итоговый счётчик: вычитаем количество, которое удалось на повторных попытках
-                fail_count = retry_fail
-                success_count = total - fail_count
-
-                # --- НОВОЕ: Пересохраняем файл с оставшимися неудачными ---
-                if failed_tracks_list:
-                    try:
-                        with open(failed_file_path, 'w', encoding='utf-8') as f:
-                            json.dump(failed_tracks_list, f, ensure_ascii=False, indent=2)
-                        log_message(f"DOWNLOAD BATCH: обновлён список неудачных треков в {failed_file_path}")
-                    except Exception as e:
-                        log_message(f"WARNING: не удалось обновить список неудачных треков: {e}")
-                else:
-                    # Если все неудачные скачались, удаляем файл
-                    if failed_file_path and os.path.exists(failed_file_path):
-                        try:
-                            os.remove(failed_file_path)
-                            log_message(f"DOWNLOAD BATCH: файл с неудачными треками удалён, все скачаны")
-                        except Exception as e:
-                            log_message(f"WARNING: не удалось удалить файл с неудачными треками: {e}")
-                # --- КОНЕЦ НОВОГО ---
-
-            # Итоговый статус
-            if fail_count == 0:
-                self._call_in_main.emit(lambda: self._set_search_status(f"✓ Скачано {success_count} треков"))
-                log_message(f"DOWNLOAD BATCH complete: {success_count} ok, {fail_count} failed (all retries done)")
-            else:
-                self._call_in_main.emit(lambda: self._set_search_status(f"Скачано {success_count}, не удалось: {fail_count}. См. failed_tracks.json"))
-                log_message(f"DOWNLOAD BATCH complete: {success_count} ok, {fail_count} failed. See {failed_file_path}")
-
-        threading.Thread(target=worker, daemon=True).start()
-
-
-
-    def _download_m3u8_silent(self, url: str, path: str) -> bool:
-        """
-        Скачивает аудио без обновления UI (для параллельного скачивания).
-        """
-        is_m3u8 = 'index.m3u8' in url or '.m3u8' in url
-
-        if is_m3u8:
+        def finished(future):
+            self._hide_progress()
             try:
-                output_path = path
-                if output_path.lower().endswith('.mp3'):
-                    output_path = output_path[:-4]
-
-                cmd = [
-                    'yt-dlp',
-                    '--no-warnings',
-                    '--quiet',  # Тихий режим
-                    '-o', output_path + '.%(ext)s',
-                    '-x',
-                    '--audio-format', 'mp3',
-                    '--audio-quality', '0',
-                    url
-                ]
-
-                result = subprocess.run(
-                    cmd,
-                    capture_output=True,
-                    text=True,
-                    timeout=180,  # 3 минуты таймаут
-                    creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-                )
-
-                return result.returncode == 0
-
-            except subprocess.TimeoutExpired:
-                log_message(f"DOWNLOAD: таймаут для {path}")
-                return False
+                results = future.result()
             except Exception as e:
-                log_message(f"DOWNLOAD: ошибка {e}")
-                return False
-        else:
-            # Прямая ссылка - качаем через requests
-            return self._download_via_direct_url(url, path)
-
-    def _download_via_browser_intercept(self, audio_full_id: str, path: str) -> bool:
-        """
-        Кликает на трек в браузере, перехватывает m3u8 URL через Performance Log,
-        затем скачивает через yt-dlp.
-        """
-        try:
-            self._set_search_status("Получаю ссылку на аудио...")
-            log_message(f"DOWNLOAD intercept: audio_id={audio_full_id}")
-
-            # Ищем элемент трека на странице и кликаем
-            m3u8_url = self._get_audio_url_via_click(audio_full_id)
-
-            if not m3u8_url:
-                log_message("DOWNLOAD intercept: не удалось получить m3u8 URL")
-                return False
-
-            log_message(f"DOWNLOAD intercept: got URL: {m3u8_url[:80]}...")
-
-            # Скачиваем через yt-dlp
-            return self._download_m3u8_via_ytdlp(m3u8_url, path)
-
-        except Exception as e:
-            log_message(f"DOWNLOAD intercept failed: {e}")
-            return False
-
-    def _get_audio_url_via_click(self, audio_full_id: str) -> str | None:
-        """
-        Кликает на трек и получает URL аудио из сетевых запросов.
-        """
-        if not self.driver:
-            return None
-
-        try:
-            # Включаем перехват сетевых запросов через CDP
-            self.driver.execute_cdp_cmd('Network.enable', {})
-
-            # Очищаем историю запросов
-            self.driver.execute_cdp_cmd('Network.clearBrowserCache', {})
-
-            # Ищем элемент трека по audio_full_id
-            audio_element = None
-            use_new_interface = False
-
-            # Старый интерфейс: div.audio_row[data-full-id="..."]
-            try:
-                audio_element = self.driver.find_element(
-                    By.CSS_SELECTOR, f'div.audio_row[data-full-id="{audio_full_id}"]'
-                )
-            except Exception:
-                # Пробуем найти по data-audio атрибуту
-                rows = self.driver.find_elements(By.CSS_SELECTOR, 'div.audio_row')
-                for row in rows:
-                    try:
-                        data_audio = row.get_attribute('data-audio')
-                        if data_audio and audio_full_id in data_audio:
-                            audio_element = row
-                            break
-                    except Exception:
-                        continue
-
-            # Новый интерфейс: [data-testentitytag="audio"] — ищем по индексу из JS Map
-            if not audio_element:
-                try:
-                    idx = self.driver.execute_script("""
-                        var target = arguments[0];
-                        var rows = document.querySelectorAll('[data-testentitytag="audio"]');
-                        if (!rows.length) return -1;
-                        var fk = Object.keys(rows[0]).find(function(k){ return k.startsWith('__reactFiber'); });
-                        if (!fk) return -1;
-                        var tp = rows[0][fk].memoizedProps.track.entity.trackProvider;
-                        var ids = [];
-                        tp.entities.data_.forEach(function(v, k){ ids.push(k); });
-                        return ids.indexOf(target);
-                    """, audio_full_id)
-                    if idx is not None and idx >= 0:
-                        new_rows = self.driver.find_elements(By.CSS_SELECTOR, '[data-testentitytag="audio"]')
-                        if idx < len(new_rows):
-                            audio_element = new_rows[idx]
-                            use_new_interface = True
-                except Exception:
-                    pass
-
-            if not audio_element:
-                log_message(f"DOWNLOAD: не найден элемент трека {audio_full_id}")
-                return None
-
-            # Инъектируем перехватчик XHR/fetch/audio ДО клика
-            try:
-                self.driver.execute_script("""
-                    window.__vk_al_audio_response = null;
-                    window.__vk_audio_stream_url = null;
-
-                    // Сохранить URL аудиопотока (только реальные HTTP-ссылки на аудио)
-                    function _vkCaptureStream(u) {
-                        if (!window.__vk_audio_stream_url && u &&
-                            !u.startsWith('data:') && !u.startsWith('blob:') &&
-                            (u.indexOf('vkuseraudio') !== -1 || u.indexOf('.m3u8') !== -1)) {
-                            window.__vk_audio_stream_url = u;
-                        }
-                    }
-
-                    if (!window.__vk_xhr_patched) {
-                        window.__vk_xhr_patched = true;
-                        var _origOpen = XMLHttpRequest.prototype.open;
-                        var _origSend = XMLHttpRequest.prototype.send;
-                        XMLHttpRequest.prototype.open = function(method, url) {
-                            this._vkUrl = url || '';
-                            return _origOpen.apply(this, arguments);
-                        };
-                        XMLHttpRequest.prototype.send = function() {
-                            var xhr = this;
-                            _vkCaptureStream(xhr._vkUrl);
-                            this.addEventListener('load', function() {
-                                if (xhr._vkUrl.indexOf('al_audio.php') !== -1) {
-                                    window.__vk_al_audio_response = xhr.responseText;
-                                }
-                                _vkCaptureStream(xhr._vkUrl);
-                            });
-                            return _origSend.apply(this, arguments);
-                        };
-                    }
-                    if (!window.__vk_fetch_patched) {
-                        window.__vk_fetch_patched = true;
-                        var _origFetch = window.fetch;
-                        window.fetch = function(input, init) {
-                            var url = typeof input === 'string' ? input : (input ? input.url : '');
-                            _vkCaptureStream(url);
-                            return _origFetch.apply(window, arguments).then(function(resp) {
-                                if (url && url.indexOf('al_audio.php') !== -1) {
-                                    resp.clone().text().then(function(t) {
-                                        window.__vk_al_audio_response = t;
-                                    }).catch(function(){});
-                                }
-                                return resp;
-                            });
-                        };
-                    }
-                """)
-            except Exception:
-                pass
-
-            # Кликаем на кнопку воспроизведения
-            if use_new_interface:
-                try:
-                    play_btn = audio_element.find_element(
-                        By.CSS_SELECTOR, '[data-testid="MusicTrackRow_PlaybackControls"]'
-                    )
-                    self.driver.execute_script("arguments[0].click();", play_btn)
-                except Exception:
-                    self.driver.execute_script("arguments[0].click();", audio_element)
+                log_message(f"ERROR: пакетное скачивание: {e}")
+                self._set_status(f"Ошибка скачивания: {e}")
+                return
+            success_count = sum(1 for r in results if r["ok"])
+            fail_count = len(results) - success_count
+            log_message(f"DOWNLOAD BATCH complete: {success_count} ok, {fail_count} failed")
+            if fail_count == 0:
+                self._set_status(f"✓ Скачано {success_count} треков")
             else:
-                try:
-                    play_btn = audio_element.find_element(
-                        By.CSS_SELECTOR, '.audio_play_wrap, .audio_row__play_btn, .audio_row__cover'
-                    )
-                    self.driver.execute_script("arguments[0].click();", play_btn)
-                except Exception:
-                    self.driver.execute_script("arguments[0].click();", audio_element)
-
-            log_message("DOWNLOAD: кликнули на трек, ждём загрузки URL...")
-
-            # Ждём URL: stream_url (приоритет), JS globals, ответ al_audio.php
-            audio_url = None
-            stream_url = None
-            al_response = None
-            for i in range(20):  # 20 * 0.3 = 6 сек максимум
-                time.sleep(0.3)
-
-                # Приоритет 1: реальный URL аудиопотока (уже расшифрованный VK'ом)
-                if not stream_url:
-                    stream_url = self.driver.execute_script(
-                        "return window.__vk_audio_stream_url;"
-                    )
-
-                # Приоритет 2: ответ al_audio.php (нужно декодировать)
-                if not al_response:
-                    al_response = self.driver.execute_script(
-                        "return window.__vk_al_audio_response;"
-                    )
-
-                # Приоритет 3: JS globals (window.ap, HTML5 audio)
-                if not audio_url:
-                    audio_url = self.driver.execute_script("""
-                        try {
-                            if (window.ap && window.ap._impl) {
-                                var impl = window.ap._impl;
-                                if (impl._currentAudio && impl._currentAudio.url) return impl._currentAudio.url;
-                                if (impl.currentAudio && impl.currentAudio.url) return impl.currentAudio.url;
-                            }
-                        } catch(e) {}
-                        try {
-                            if (typeof getAudioPlayer === 'function') {
-                                var p = getAudioPlayer();
-                                if (p) {
-                                    if (p._impl && p._impl._currentAudio) return p._impl._currentAudio.url;
-                                    if (p.getCurrentAudio) { var a = p.getCurrentAudio(); if (a && a.url) return a.url; }
-                                }
-                            }
-                        } catch(e) {}
-                        try {
-                            var audioEl = document.querySelector('audio');
-                            if (audioEl && audioEl.src && audioEl.src.length > 10) return audioEl.src;
-                        } catch(e) {}
-                        return null;
-                    """)
-
-                # Прерываем только если нашли реальный URL (stream_url / audio_url)
-                # al_response мало — VK ещё не успел расшифровать URL и сделать запрос на поток
-                if stream_url or audio_url:
-                    log_message(f"DOWNLOAD: stream/player URL получен за {(i + 1) * 0.3:.1f} сек")
-                    break
-                if al_response and not stream_url and i == 19:
-                    log_message("DOWNLOAD: stream URL не появился за 6 сек, используем al_response")
-
-            # Останавливаем воспроизведение
-            try:
-                self.driver.execute_script("""
-                    try { if (window.ap && window.ap.pause) window.ap.pause(); } catch(e) {}
-                    try { var audio = document.querySelector('audio'); if (audio) audio.pause(); } catch(e) {}
-                """)
-            except Exception:
-                pass
-
-            # Способ 1: прямой URL аудиопотока (VK уже расшифровал)
-            if stream_url:
-                log_message(f"DOWNLOAD: stream URL перехвачен: {stream_url[:120]}")
-                return stream_url
-
-            # Способ 2: URL из JS globals (window.ap / HTML5 audio)
-            if audio_url:
-                log_message(f"DOWNLOAD: URL из JS globals: {audio_url[:80]}...")
-                return audio_url
-
-            # Способ 2: URL из тела ответа al_audio.php
-            if al_response:
-                log_message(f"DOWNLOAD: ответ al_audio.php ({len(al_response)} байт): {al_response[:300]}")
-                import re as _re
-                # Убираем JSON-экранирование \/ → / перед поиском
-                al_clean = al_response.replace('\\/', '/')
-                for pat in [
-                    r'https?://[^\s"\',\[\]{}]+index\.m3u8',
-                    r'https?://vkuseraudio\.net[^\s"\',\[\]{}]+',
-                    r'https?://[^\s"\',\[\]{}]+\.m3u8',
-                    r'https?://[^\s"\',\[\]{}]+audio_api_unavailable\.mp3\?extra=[^\s"\',\[\]{}]+',
-                    r'https?://[^\s"\',\[\]{}]+\.mp3',
-                ]:
-                    m = _re.search(pat, al_clean)
-                    if m:
-                        url_found = m.group(0)
-                        if 'audio_api_unavailable' in url_found:
-                            url_decoded = self._decode_vk_audio_url(url_found)
-                            if url_decoded != url_found:
-                                log_message(f"DOWNLOAD: декодирован URL: {url_decoded[:120]}")
-                                return url_decoded
-                            log_message(f"DOWNLOAD: decode не удался, пробуем другие паттерны")
-                            continue
-                        log_message(f"DOWNLOAD: URL из al_audio.php: {url_found[:80]}")
-                        return url_found
-                log_message("DOWNLOAD: URL не найден в ответе al_audio.php (неизвестный формат)")
-
-            log_message("DOWNLOAD intercept: не удалось получить URL")
-            return None
-
-        except Exception as e:
-            log_message(f"ERROR _get_audio_url_via_click: {e}")
-            return None
-
-    @staticmethod
-    def _decode_vk_audio_url(url: str) -> str:
-        """Декодирует audio_api_unavailable.mp3?extra=... VK obfuscated audio URL.
-
-        Алгоритм: base64url-декодирует параметр extra, получает строку вида
-        real_url[TAB op1 TAB op2 ...], применяет операции i(pos,code), s(a,b), r.
-        """
-        import base64
-        import re as _re
-
-        if not url or 'audio_api_unavailable' not in url:
-            return url
-
-        try:
-            parts_extra = url.split('?extra=')
-            if len(parts_extra) < 2:
-                return url
-            extra = parts_extra[1].split('#')[0]
-
-            def b64_decode(s):
-                s = s.replace('-', '+').replace('_', '/')
-                s += '=' * (-len(s) % 4)
-                return base64.b64decode(s).decode('utf-8', errors='replace')
-
-            decoded = b64_decode(extra)
-            log_message(f"DECODE: extra→ {repr(decoded[:120])}")
-
-            parts = decoded.split('\t')
-            real_url = parts[0]
-
-            for op in parts[1:]:
-                if not op:
-                    continue
-                m = _re.match(r'^i\((\d+),(\d+)\)$', op)
-                if m:
-                    pos, code = int(m.group(1)), int(m.group(2))
-                    if 0 <= pos <= len(real_url):
-                        real_url = real_url[:pos] + chr(code) + real_url[pos:]
-                    continue
-                m = _re.match(r'^s\((\d+),(\d+)\)$', op)
-                if m:
-                    a, b = int(m.group(1)), int(m.group(2))
-                    if 0 <= a < len(real_url) and 0 <= b < len(real_url):
-                        lst = list(real_url)
-                        lst[a], lst[b] = lst[b], lst[a]
-                        real_url = ''.join(lst)
-                    continue
-                if op == 'r':
-                    real_url = real_url[::-1]
-
-            if real_url.startswith('http'):
-                return real_url
-
-            log_message(f"DECODE: первая часть не URL: {repr(real_url[:80])}")
-        except Exception as e:
-            log_message(f"DECODE error: {e}")
-
-        return url
-
-    def _download_m3u8_via_ytdlp(self, url: str, path: str) -> bool:
-        """Скачивает аудио URL через yt-dlp (subprocess) или requests."""
-
-        is_m3u8 = 'index.m3u8' in url or '.m3u8' in url
-
-        # Для m3u8 используем yt-dlp через subprocess (как в консоли)
-        if is_m3u8:
-            try:
-                # Показываем прогресс-бар только если не пакетный режим
-                if not self._batch_download_mode:
-                    self._show_progress_bar()
-                self._set_search_status("Скачиваю аудио...")
-                self._update_progress(0, "")
-                log_message(f"DOWNLOAD m3u8 subprocess: {url}")
-
-                # Убираем расширение, yt-dlp добавит сам
-                output_path = path
-                if output_path.lower().endswith('.mp3'):
-                    output_path = output_path[:-4]
-
-                # Формируем команду как в консоли
-                cmd = [
-                    'yt-dlp',
-                    '--no-warnings',
-                    '--newline',  # Важно: каждое обновление на новой строке
-                    '-o', output_path + '.%(ext)s',
-                    '-x',  # extract audio
-                    '--audio-format', 'mp3',
-                    '--audio-quality', '0',  # лучшее качество
-                    url
-                ]
-
-                log_message(f"DOWNLOAD cmd: {' '.join(cmd[:6])}...")
-
-                # Запускаем процесс
-                process = subprocess.Popen(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                    creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-                )
-
-                # Читаем вывод и обновляем статус
-                for line in process.stdout:
-                    line = line.strip()
-                    if line:
-                        # Логируем всё кроме строк прогресса скачивания
-                        if not ('[download]' in line and '%' in line):
-                            log_message(f"yt-dlp: {line[:100]}")
-
-                        if '[download]' in line and '%' in line:
-                            # Парсим прогресс и скорость
-                            # Форматы:
-                            #   [download]  45.2% of 3.52MiB at 1.25MiB/s ETA 00:02
-                            #   [download]  79.4% of ~  27.12MiB at 1.73MiB/s ETA 00:03 (frag 28/37)
-                            try:
-                                # Процент текущего фрагмента
-                                percent_match = line.split('%')[0]
-                                percent_str = percent_match.split()[-1]
-                                frag_percent = float(percent_str)
-
-                                # Проверяем есть ли информация о фрагментах
-                                # Формат: (frag X/Y)
-                                overall_percent = frag_percent
-                                frag_info = ""
-                                if '(frag ' in line:
-                                    try:
-                                        frag_part = line.split('(frag ')[1].split(')')[0]
-                                        frag_current, frag_total = frag_part.split('/')
-                                        frag_current = int(frag_current)
-                                        frag_total = int(frag_total)
-                                        # Общий прогресс = (завершённые фрагменты + прогресс текущего) / всего
-                                        overall_percent = ((frag_current - 1) + frag_percent / 100) / frag_total * 100
-                                        frag_info = f" (фраг. {frag_current}/{frag_total})"
-                                    except:
-                                        pass
-
-                                # Размер файла
-                                size = ""
-                                if ' of ' in line:
-                                    size_part = line.split(' of ')[1].split()[0]
-                                    if size_part != '~':
-                                        size = size_part
-                                    elif ' of ~ ' in line:
-                                        size_part = line.split(' of ~ ')[1].split()[0]
-                                        size = "~" + size_part
-
-                                # Скорость
-                                speed = ""
-                                if ' at ' in line:
-                                    at_part = line.split(' at ')[1]
-                                    speed = at_part.split()[0]
-
-                                # ETA
-                                eta = ""
-                                if 'ETA' in line:
-                                    eta = line.split('ETA')[1].strip().split()[0]
-
-                                # Обновляем UI с общим прогрессом
-                                self._update_progress(overall_percent, f"{speed}" if speed else "")
-
-                                status = f"Скачиваю: {overall_percent:.1f}%"
-                                if size:
-                                    status += f" из {size}"
-                                if eta and eta != "00:00":
-                                    status += f" (осталось {eta})"
-                                self._set_search_status(status)
-
-                            except Exception as e:
-                                log_message(f"Parse error: {e}")
-
-                        elif '[download] 100%' in line or 'has already been downloaded' in line:
-                            self._update_progress(100, "")
-                            self._set_search_status("Загрузка завершена, конвертирую...")
-
-                        elif 'Destination' in line:
-                            self._set_search_status("Сохраняю...")
-
-                        elif 'Post-process' in line or 'ffmpeg' in line.lower() or 'Converting' in line:
-                            self._update_progress(100, "конвертация")
-                            self._set_search_status("Конвертирую в MP3...")
-
-                        elif 'Deleting original file' in line:
-                            self._set_search_status("Завершаю...")
-
-                process.wait()
-
-                if process.returncode == 0:
-                    self._update_progress(100, "готово")
-                    self._set_search_status("Скачивание завершено!")
-                    log_message("DOWNLOAD m3u8 subprocess: успешно")
-                    if not self._batch_download_mode:
-                        time.sleep(0.5)  # Показываем 100% прогресс на полсекунды
-                        self._hide_progress_bar()
-                    return True
-                else:
-                    if not self._batch_download_mode:
-                        self._hide_progress_bar()
-                    log_message(f"DOWNLOAD m3u8 subprocess: код возврата {process.returncode}")
-                    return False
-
-            except FileNotFoundError:
-                if not self._batch_download_mode:
-                    self._hide_progress_bar()
-                log_message("DOWNLOAD: yt-dlp не найден, пробуем вручную...")
-                return self._download_m3u8_manually(url, path)
-            except Exception as e:
-                if not self._batch_download_mode:
-                    self._hide_progress_bar()
-                log_message(f"DOWNLOAD m3u8 subprocess failed: {e}")
-                return self._download_m3u8_manually(url, path)
-
-        # Для прямых ссылок качаем через requests
-        else:
-            try:
-                self._set_search_status("Скачиваю аудио...")
-                self._update_progress(0, "")
-                log_message(f"DOWNLOAD direct audio: {url[:80]}...")
-
-                # Получаем cookies из Selenium
-                cookies_dict = {}
-                if self.driver:
-                    try:
-                        for cookie in self.driver.get_cookies():
-                            cookies_dict[cookie['name']] = cookie['value']
-                    except Exception:
-                        pass
-
-                headers = {
-                    "User-Agent": (
-                        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                        "AppleWebKit/537.36 (KHTML, like Gecko) "
-                        "Chrome/131.0.0.0 Safari/537.36"
-                    ),
-                    "Referer": "https://vk.com/",
-                    "Accept": "*/*",
-                    "Origin": "https://vk.com",
-                }
-
-                with requests.get(url, headers=headers, cookies=cookies_dict,
-                                stream=True, timeout=120) as r:
-                    r.raise_for_status()
-
-                    total_size = int(r.headers.get('content-length', 0))
-                    downloaded = 0
-                    start_time = time.time()
-                    last_update_time = start_time
-
-                    with open(path, "wb") as f:
-                        for chunk in r.iter_content(chunk_size=8192):
-                            if chunk:
-                                f.write(chunk)
-                                downloaded += len(chunk)
-
-                                current_time = time.time()
-                                # Обновляем UI не чаще чем раз в 0.2 секунды
-                                if current_time - last_update_time >= 0.2:
-                                    last_update_time = current_time
-
-                                    # Вычисляем прогресс
-                                    if total_size > 0:
-                                        percent = downloaded * 100 / total_size
-                                    else:
-                                        percent = 0
-
-                                    # Вычисляем скорость
-                                    elapsed = current_time - start_time
-                                    if elapsed > 0:
-                                        speed_bps = downloaded / elapsed
-                                        if speed_bps >= 1024 * 1024:
-                                            speed_str = f"{speed_bps / (1024*1024):.1f} MB/s"
-                                        elif speed_bps >= 1024:
-                                            speed_str = f"{speed_bps / 1024:.0f} KB/s"
-                                        else:
-                                            speed_str = f"{speed_bps:.0f} B/s"
-                                    else:
-                                        speed_str = ""
-
-                                    # Вычисляем ETA
-                                    eta_str = ""
-                                    if total_size > 0 and speed_bps > 0:
-                                        remaining = total_size - downloaded
-                                        eta_sec = remaining / speed_bps
-                                        if eta_sec < 60:
-                                            eta_str = f"{int(eta_sec)}с"
-                                        else:
-                                            eta_str = f"{int(eta_sec // 60)}м {int(eta_sec % 60)}с"
-
-                                    # Обновляем UI
-                                    self._update_progress(percent, speed_str)
-
-                                    # Форматируем размер
-                                    if total_size > 0:
-                                        if total_size >= 1024 * 1024:
-                                            size_str = f"{downloaded / (1024*1024):.1f}/{total_size / (1024*1024):.1f} MB"
-                                        else:
-                                            size_str = f"{downloaded / 1024:.0f}/{total_size / 1024:.0f} KB"
-                                        status = f"Скачиваю: {percent:.0f}% ({size_str})"
-                                    else:
-                                        if downloaded >= 1024 * 1024:
-                                            status = f"Скачано: {downloaded / (1024*1024):.1f} MB"
-                                        else:
-                                            status = f"Скачано: {downloaded / 1024:.0f} KB"
-
-                                    if eta_str:
-                                        status += f" ~{eta_str}"
-
-                                    self._set_search_status(status)
-
-                self._update_progress(100, "готово")
-                self._set_search_status("Скачивание завершено!")
-                log_message("DOWNLOAD direct audio: успешно")
-                return True
-
-            except Exception as e:
-                log_message(f"DOWNLOAD direct audio failed: {e}")
-                return False
-
-    def _download_m3u8_manually(self, m3u8_url: str, path: str) -> bool:
-        """
-        Скачивает m3u8 вручную: парсит плейлист, качает сегменты, склеивает.
-        """
-        try:
-            self._set_search_status("Скачиваю сегменты...")
-            log_message(f"DOWNLOAD m3u8 manual: {m3u8_url[:60]}...")
-
-            cookies_dict = {}
-            if self.driver:
-                try:
-                    for cookie in self.driver.get_cookies():
-                        cookies_dict[cookie['name']] = cookie['value']
-                except Exception:
-                    pass
-
-            headers = {
-                "User-Agent": (
-                    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                    "AppleWebKit/537.36 (KHTML, like Gecko) "
-                    "Chrome/131.0.0.0 Safari/537.36"
-                ),
-                "Referer": "https://vk.com/",
-                "Origin": "https://vk.com",
-            }
-
-            # 1. Скачиваем m3u8 плейлист
-            resp = requests.get(m3u8_url, headers=headers, cookies=cookies_dict, timeout=30)
-            resp.raise_for_status()
-            m3u8_content = resp.text
-            log_message(f"DOWNLOAD: m3u8 content length: {len(m3u8_content)}")
-
-            # 2. Парсим сегменты (.ts файлы)
-            base_url = m3u8_url.rsplit('/', 1)[0] + '/'
-            segments = []
-            for line in m3u8_content.split('\n'):
-                line = line.strip()
-                if line and not line.startswith('#'):
-                    if line.startswith('http'):
-                        segments.append(line)
-                    else:
-                        segments.append(base_url + line)
-
-            if not segments:
-                log_message("DOWNLOAD: не найдено сегментов в m3u8")
-                return False
-
-            log_message(f"DOWNLOAD: найдено {len(segments)} сегментов")
-
-            # 3. Скачиваем все сегменты и склеиваем
-            all_data = bytearray()
-            for i, seg_url in enumerate(segments):
-                self._set_search_status(f"Скачиваю сегмент {i+1}/{len(segments)}...")
-                try:
-                    seg_resp = requests.get(seg_url, headers=headers, cookies=cookies_dict, timeout=60)
-                    seg_resp.raise_for_status()
-                    all_data.extend(seg_resp.content)
-                except Exception as e:
-                    log_message(f"WARNING: не удалось скачать сегмент {i+1}: {e}")
-
-            if not all_data:
-                log_message("DOWNLOAD: не удалось скачать сегменты")
-                return False
-
-            # 4. Сохраняем как .ts файл
-            ts_path = path.rsplit('.', 1)[0] + '.ts'
-            with open(ts_path, 'wb') as f:
-                f.write(all_data)
-
-            log_message(f"DOWNLOAD: сохранено {len(all_data)} байт в {ts_path}")
-
-            # 5. Пробуем конвертировать в mp3 через ffmpeg
-            try:
-                import subprocess
-                mp3_path = path if path.lower().endswith('.mp3') else path.rsplit('.', 1)[0] + '.mp3'
-
-                self._set_search_status("Конвертирую в MP3...")
-                result = subprocess.run(
-                    ['ffmpeg', '-y', '-i', ts_path, '-acodec', 'libmp3lame', '-q:a', '0', mp3_path],
-                    capture_output=True,
-                    timeout=120
+                self._set_status(
+                    f"Скачано {success_count}, не удалось: {fail_count}. См. failed_tracks.json"
                 )
 
-                if result.returncode == 0:
-                    # Удаляем .ts файл
-                    try:
-                        os.remove(ts_path)
-                    except Exception:
-                        pass
-                    self._set_search_status("Скачивание завершено!")
-                    log_message(f"DOWNLOAD: конвертировано в {mp3_path}")
-                    return True
-                else:
-                    log_message(f"DOWNLOAD: ffmpeg error: {result.stderr.decode()[:200]}")
-                    self._set_search_status(f"Сохранено как .ts (ffmpeg недоступен)")
-                    return True  # Всё равно успех, файл есть
-
-            except FileNotFoundError:
-                log_message("DOWNLOAD: ffmpeg не найден, оставляем .ts")
-                self._set_search_status(f"Сохранено как .ts (установи ffmpeg для MP3)")
-                return True
-            except Exception as e:
-                log_message(f"DOWNLOAD: ошибка конвертации: {e}")
-                self._set_search_status(f"Сохранено как .ts")
-                return True
-
-        except Exception as e:
-            log_message(f"DOWNLOAD m3u8 manual failed: {e}")
-            return False
-
-    def _download_via_direct_url(self, url: str, path: str) -> bool:
-        """Скачивает по прямой ссылке с cookies из Selenium."""
-        try:
-            self._set_search_status("Скачиваю (прямая ссылка)...")
-            log_message(f"DOWNLOAD direct: {url[:80]}...")
-
-            # Получаем cookies из Selenium
-            cookies_dict = {}
-            if self.driver:
-                try:
-                    for cookie in self.driver.get_cookies():
-                        cookies_dict[cookie['name']] = cookie['value']
-                except Exception as e:
-                    log_message(f"WARNING: не удалось получить cookies: {e}")
-
-            headers = {
-                "User-Agent": (
-                    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                    "AppleWebKit/537.36 (KHTML, like Gecko) "
-                    "Chrome/120.0.0.0 Safari/537.36"
-                ),
-                "Referer": "https://vk.com/",
-                "Accept": "*/*",
-                "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
-            }
-
-            with requests.get(url, headers=headers, cookies=cookies_dict,
-                            stream=True, timeout=60) as r:
-                r.raise_for_status()
-
-                # Проверяем content-type
-                content_type = r.headers.get('content-type', '')
-                if 'audio' not in content_type and 'octet-stream' not in content_type:
-                    log_message(f"DOWNLOAD direct: неожиданный content-type: {content_type}")
-                    if 'text/html' in content_type:
-                        log_message("DOWNLOAD direct: получили HTML вместо аудио")
-                        return False
-
-                total_size = int(r.headers.get('content-length', 0))
-                downloaded = 0
-
-                with open(path, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            downloaded += len(chunk)
-                            if total_size > 0:
-                                percent = int(downloaded * 100 / total_size)
-                                self._set_search_status(f"Скачиваю: {percent}%")
-
-            self._set_search_status("Скачивание завершено!")
-            log_message("DOWNLOAD direct: успешно")
-            return True
-
-        except Exception as e:
-            log_message(f"DOWNLOAD direct failed: {e}")
-            return False
-
-    def _export_cookies_for_ytdlp(self) -> str | None:
-        """
-        Экспортирует cookies из Selenium в формате Netscape для yt-dlp.
-        Возвращает путь к временному файлу или None.
-        """
-        if self.driver is None:
-            log_message("COOKIES: driver не доступен")
-            return None
-
-        try:
-            cookies = self.driver.get_cookies()
-            if not cookies:
-                log_message("COOKIES: нет cookies в браузере")
-                return None
-
-            # Создаём временный файл
-            fd, cookies_path = tempfile.mkstemp(suffix='.txt', prefix='vk_cookies_')
-
-            with os.fdopen(fd, 'w') as f:
-                # Заголовок Netscape cookies
-                f.write("# Netscape HTTP Cookie File\n")
-                f.write("# https://curl.haxx.se/rfc/cookie_spec.html\n")
-                f.write("# This is a generated file! Do not edit.\n\n")
-
-                for cookie in cookies:
-                    domain = cookie.get('domain', '')
-                    # Netscape формат требует точку в начале для поддоменов
-                    if not domain.startswith('.'):
-                        domain = '.' + domain
-
-                    flag = "TRUE" if domain.startswith('.') else "FALSE"
-                    path = cookie.get('path', '/')
-                    secure = "TRUE" if cookie.get('secure', False) else "FALSE"
-                    expiry = str(int(cookie.get('expiry', 0)))
-                    name = cookie.get('name', '')
-                    value = cookie.get('value', '')
-
-                    line = f"{domain}\t{flag}\t{path}\t{secure}\t{expiry}\t{name}\t{value}\n"
-                    f.write(line)
-
-            log_message(f"COOKIES: экспортировано {len(cookies)} cookies в {cookies_path}")
-            return cookies_path
+        self.engine.run_coroutine(self.engine.download_many(tracks, folder)).add_done_callback(
+            self._in_main(finished)
+        )
 
-        except Exception as e:
-            log_message(f"ERROR: не удалось экспортировать cookies: {e}")
-            return None
+    def _prefetch_top_rows(self):
+        """Первые PREFETCH_TOP_N строк таблицы (вызывается в главном потоке)."""
+        if self.tree is None:
+            return
+        rows = range(min(PREFETCH_TOP_N, self.track_proxy.rowCount()))
+        self.engine.prefetch([
+            self.track_model.full_id(self.track_proxy.source_row(r)) for r in rows
+        ])
 
-    def _ytdlp_progress_hook(self, d):
-        """Хук для отображения прогресса скачивания yt-dlp."""
-        if d['status'] == 'downloading':
-            percent = d.get('_percent_str', '?%').strip()
-            speed = d.get('_speed_str', '').strip()
-            self._set_search_status(f"Скачиваю: {percent} {speed}")
-        elif d['status'] == 'finished':
-            self._set_search_status("Конвертирую в MP3...")
+    def _prefetch_selected(self):
+        if self.tree is None or not PREFETCH_ENABLED:
+            return
+        rows = self._selected_rows()
+        self.engine.prefetch(
+            [self.track_model.full_id(r) for r in rows[:PREFETCH_TOP_N]], front=True
+        )
 
-    # --------------------------------------------------
-    # СОРТИРОВКА ТАБЛИЦЫ
-    # --------------------------------------------------
+    def _apply_filter(self, text: str):
+        """Фильтрует загруженные треки (браузер не нужен)."""
+        t0 = time.perf_counter()
+        self.track_proxy.set_filter(text)
+        shown = self.track_proxy.rowCount()
+        total = self.track_model.rowCount()
+        log_message("DEBUG: фильтр %r: %d из %d за %.1f мс",
+                    text, shown, total, (time.perf_counter() - t0) * 1000)
+        if self.track_proxy.filter_text:
+            self.search_status_label.setText(f"Показано {shown} из {total}")
+        elif total:
+            self.search_status_label.setText(f"Найдено треков: {total}")
 
     def _init_tree_sorting(self):
-        self._tree_sort_reverse = {i: False for i in range(6)}
         header = self.tree.horizontalHeader()
         header.sectionClicked.connect(self._sort_tree_by_column)
+        header.setToolTip("Клик — сортировка, Shift+клик — добавить столбец к сортировке")
 
     def _sort_tree_by_column(self, col):
-        if col >= 4:  # hidden columns
+        """
+        Клик по заголовку: сортировка по столбцу, повторный клик — в обратном порядке.
+        Shift+клик: столбец добавляется дополнительным ключом (или меняет направление).
+        """
+        if col >= len(_TrackTableModel.HEADERS):
             return
-        reverse = self._tree_sort_reverse.get(col, False)
-        rows = self.tree.rowCount()
-        data = []
-        for r in range(rows):
-            item = self.tree.item(r, col)
-            val = item.text() if item else ""
-            row_data = [self.tree.item(r, c).text() if self.tree.item(r, c) else "" for c in range(6)]
-            data.append((val, row_data))
-        if col == 2:  # duration
-            def key(x):
-                try:
-                    parts = x[0].split(":")
-                    return int(parts[0]) * 60 + int(parts[1]) if len(parts) == 2 else int(x[0])
-                except:
-                    return 0
+        spec = list(self.track_proxy.sort_spec)
+        current = dict(spec)
+        if col in current:
+            order = Qt.AscendingOrder if current[col] == Qt.DescendingOrder else Qt.DescendingOrder
+        else:
+            order = Qt.AscendingOrder
+
+        if QApplication.keyboardModifiers() & Qt.ShiftModifier and spec:
+            if col in current:
+                spec = [(c, order if c == col else o) for c, o in spec]
+            else:
+                spec.append((col, order))
         else:
-            key = lambda x: x[0].lower()
-        data.sort(key=key, reverse=reverse)
-        self.tree.setRowCount(0)
-        for _, row_data in data:
-            r = self.tree.rowCount()
-            self.tree.insertRow(r)
-            for c, v in enumerate(row_data):
-                item = QTableWidgetItem(v)
-                item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsEnabled)
-                self.tree.setItem(r, c, item)
-        self._tree_sort_reverse[col] = not reverse
+            if spec and spec[0][0] != col:
+                order = Qt.AscendingOrder
+            spec = [(col, order)]
+
+        t0 = time.perf_counter()
+        self.track_proxy.set_sort(spec)
+        log_message("DEBUG: сортировка %s (%d строк) за %.0f мс",
+                    spec, self.track_proxy.rowCount(), (time.perf_counter() - t0) * 1000)
+        header = self.tree.horizontalHeader()
+        header.setSortIndicatorShown(True)
+        header.setSortIndicator(spec[0][0], spec[0][1])
 
     # --------------------------------------------------
     # ПОИСК
     # --------------------------------------------------
 
-    def _set_search_status(self, text: str):
-        if self.search_window is None:
-            return
-
-        def _upd():
-            if self.search_status_label:
-                self.search_status_label.setText(text)
-
-        self._call_in_main.emit(_upd)
-
-    def _show_progress_bar(self, batch_mode: bool = False):
-        """Показывает прогресс-бар и скорость."""
-        if self.search_window is None:
-            return
-
-        def _do():
-            if batch_mode and self.batch_progress_label:
-                self.batch_progress_label.setVisible(True)
-            if self.speed_label:
-                self.speed_label.setVisible(True)
-            if self.progress_bar:
-                self.progress_bar.setVisible(True)
-
-        self._call_in_main.emit(_do)
-
-    def _hide_progress_bar(self):
-        """Скрывает прогресс-бар и скорость."""
-        if self.search_window is None:
-            return
-
-        def _do():
-            if self.progress_bar:
-                self.progress_bar.setVisible(False)
-                self.progress_bar.setValue(0)
-            if self.speed_label:
-                self.speed_label.setVisible(False)
-                self.speed_label.setText("")
-            if self.batch_progress_label:
-                self.batch_progress_label.setVisible(False)
-                self.batch_progress_label.setText("")
-
-        self._call_in_main.emit(_do)
-
-    def _update_progress(self, percent: float, speed_text: str = "", batch_text: str | None = None):
-        """Обновляет прогресс-бар, скорость и batch прогресс."""
-        if self.search_window is None:
-            return
-
-        def _do():
-            if self.progress_bar:
-                self.progress_bar.setValue(int(percent))
-            if self.speed_label:
-                self.speed_label.setText(speed_text)
-            # batch_text обновляем только если явно передан (не None)
-            if self.batch_progress_label and batch_text is not None:
-                self.batch_progress_label.setText(batch_text)
-
-        self._call_in_main.emit(_do)
-
-    @staticmethod
-    def _format_seconds(seconds: float) -> str:
-        """Форматирует секунды в строку MM:SS или HH:MM:SS."""
-        seconds = int(seconds)
-        if seconds < 0:
-            return "00:00"
-        hours = seconds // 3600
-        minutes = (seconds % 3600) // 60
-        secs = seconds % 60
-        if hours > 0:
-            return f"{hours:02d}:{minutes:02d}:{secs:02d}"
-        else:
-            return f"{minutes:02d}:{secs:02d}"
-
     def _start_search(self):
-        if self.driver is None:
+        if self.engine.driver is None and self.engine.wait_for_session(0):
             QMessageBox.warning(
                 self.search_window,
                 "Нет браузера",
@@ -1798,748 +948,218 @@ class VKMusicSearchApp(QObject):
             QMessageBox.warning(self.search_window, "Пустой запрос", "Введите исполнителя или название.")
             return
 
-        try:
-            count = int((self.count_edit.text() or "").strip())
-        except ValueError:
-            count = 30
-
-        # 0 — "загрузить всё, что получится"
-        if count < 0:
-            count = 0
-        if count > 500:
-            count = 500
+        count = self._requested_count()
 
-        self.tree.setRowCount(0)
+        if self.filter_edit:
+            self.filter_edit.clear()
+        self.track_model.clear()
+        self._search_generation += 1
+        generation = self._search_generation
+        self._results_source = None
 
         if self.btn_search:
             self.btn_search.setEnabled(False)
 
-        # Проверяем, является ли запрос ссылкой на плейлист/альбом ВК
-        playlist_url = self._parse_vk_playlist_url(query)
-        if playlist_url:
-            self._set_search_status("Загружаю плейлист...")
-            threading.Thread(
-                target=self._load_playlist_worker,
-                args=(playlist_url, count),
-                daemon=True
-            ).start()
+        # Проверяем, является ли запрос ссылкой на плейлист/альбом или профиль ВК
+        kind, value = self.engine.classify_query(query)
+
+        if kind != "q" and self.full_collection_check and self.full_collection_check.isChecked():
+            self._set_status("Загружаю коллекцию целиком...")
+            self._run_job(
+                self.engine.load_collection(query, tag=generation), generation,
+                lambda result: None,
+                "Ошибка: {} (загрузку можно продолжить повторным запуском)",
+            )
             return
 
-        # Проверяем, является ли запрос URL-ом профиля/группы ВК
-        vk_profile = self._parse_vk_profile_url(query)
-        if vk_profile:
-            self._set_search_status(f"Загружаю музыку с {vk_profile}...")
-            threading.Thread(
-                target=self._load_profile_music_worker,
-                args=(vk_profile, count),
-                daemon=True
-            ).start()
+        if kind == "pl":
+            self._set_status("Загружаю плейлист...")
+        elif kind == "pr":
+            self._set_status(f"Загружаю музыку с {value}...")
         else:
-            self._set_search_status("Ищу музыку в ВК...")
-            threading.Thread(target=self._search_worker, args=(query, count), daemon=True).start()
-
-    def _parse_vk_profile_url(self, text: str) -> str | None:
-        """
-        Проверяет, является ли текст URL-ом профиля/группы ВК.
-        Возвращает короткое имя или ID профиля, либо None.
-
-        Примеры:
-          https://vk.com/durov -> durov
-          vk.com/id1 -> id1
-          https://vk.com/club12345 -> club12345
-          https://vk.com/public12345 -> public12345
-        """
-
-        # Убираем пробелы
-        text = text.strip()
-
-        # Паттерн для VK URL
-        # Поддерживаем: https://vk.com/xxx, http://vk.com/xxx, vk.com/xxx
-        pattern = r'^(?:https?://)?(?:www\.)?vk\.com/([a-zA-Z0-9._]+)(?:\?.*)?$'
-        match = re.match(pattern, text)
-
-        if match:
-            profile_id = match.group(1)
-            # Исключаем служебные страницы
-            excluded = {'audio', 'audios', 'music', 'feed', 'im', 'friends',
-                       'groups', 'photos', 'video', 'docs', 'settings', 'login'}
-            if profile_id.lower() not in excluded:
-                return profile_id
-
-        return None
-
-    def _parse_vk_playlist_url(self, text: str) -> str | None:
-        """
-        Определяет, является ли текст ссылкой на плейлист или альбом ВК.
-        Возвращает нормализованный URL или None.
-
-        Поддерживаемые форматы:
-          https://vk.com/music/playlist/-143097069_1_5956a0443443bf6ae2
-          https://vk.com/music/playlist/-143097069_1
-          https://vk.com/music/album/-143097069_1_5956a0443443bf6ae2
-          vk.com/music/playlist/12345_1
-        """
-        text = text.strip()
-        pattern = r'^(?:https?://)?(?:www\.)?vk\.com/(music/(?:playlist|album)/[-\w]+)(?:\?.*)?$'
-        match = re.match(pattern, text)
-        if match:
-            return f"https://vk.com/{match.group(1)}"
-        return None
-
-    def _load_playlist_worker(self, url: str, count: int):
-        """Загружает все треки из плейлиста или альбома ВК."""
-        try:
-            log_message(f"INFO: открываю плейлист: {url}")
-            self._set_search_status("Открываю плейлист...")
-            self.driver.get(url)
-
-            # Ждём загрузки страницы — пробуем несколько возможных селекторов
-            audio_selectors = [
-                (By.CLASS_NAME, "audio_row"),
-                (By.CSS_SELECTOR, "[data-audio]"),
-                (By.CSS_SELECTOR, ".audio_pl_snippet__row"),
-                (By.CSS_SELECTOR, "[class*='AudioRow']"),
-                (By.CSS_SELECTOR, "[class*='audio_row']"),
-            ]
-            found = False
-            for by, sel in audio_selectors:
-                try:
-                    WebDriverWait(self.driver, 12).until(
-                        EC.presence_of_element_located((by, sel))
-                    )
-                    log_message(f"INFO: найден селектор аудио: {sel}")
-                    found = True
-                    break
-                except Exception:
-                    continue
-
-            if not found:
-                # Последняя попытка: просто ждём 5 сек и смотрим что есть
-                time.sleep(5)
-                src = self.driver.page_source
-                # Логируем уникальные классы элементов с data-audio
-                try:
-                    soup_dbg = BeautifulSoup(src, "html.parser")
-                    has_data_audio = soup_dbg.find_all(attrs={"data-audio": True})
-                    log_message(f"DEBUG playlist: data-audio элементов = {len(has_data_audio)}")
-                    audio_rows = soup_dbg.find_all("div", class_=lambda c: c and "audio" in c.lower())
-                    sample_classes = list({" ".join(el.get("class", [])) for el in audio_rows[:10]})
-                    log_message(f"DEBUG playlist: div с 'audio' в классе: {sample_classes[:5]}")
-                except Exception as dbg_e:
-                    log_message(f"DEBUG playlist parse error: {dbg_e}")
-
-                results = self._parse_search_results(self.driver.page_source, count or None)
-                if not results:
-                    self._set_search_status("Треки не найдены. Возможно, плейлист приватный или страница не загрузилась.")
-                    return
-
-            # Нажимаем "Показать все" / "Показать всё", если кнопка есть
-            self._click_show_all_button()
-
-            self._set_search_status("Загружаю треки...")
-            results = self._scroll_and_extract_playlist(count)
-            self._update_results(results)
-
-        except Exception as e:
-            log_message(f"ERROR _load_playlist_worker: {e}")
-            self._set_search_status(f"Ошибка: {e}")
-        finally:
-            if self.btn_search:
-                self._call_in_main.emit(lambda: self.btn_search.setEnabled(True))
-
-    # Извлекает треки из нового интерфейса ВК:
-    # audio_full_id берём из MobX Map (shared trackProvider, ключи совпадают с порядком строк),
-    # title/artist/duration читаем из DOM через data-testid.
-    _JS_EXTRACT_TRACKS = """
-        var rows = document.querySelectorAll('[data-testentitytag="audio"]');
-        if (rows.length === 0) return JSON.stringify([]);
-
-        // Получаем все audioId из shared trackProvider первой строки
-        var allAudioIds = [];
-        try {
-            var fk = Object.keys(rows[0]).find(function(k) { return k.startsWith('__reactFiber'); });
-            var tp = rows[0][fk].memoizedProps.track.entity.trackProvider;
-            tp.entities.data_.forEach(function(v, k) { allAudioIds.push(k); });
-        } catch(e) {}
-
-        var results = [];
-        var seen = {};
-        for (var i = 0; i < rows.length; i++) {
-            try {
-                var row = rows[i];
-                var audioId = allAudioIds[i] || null;
-                if (!audioId || seen[audioId]) continue;
-                seen[audioId] = true;
-
-                var titleEl    = row.querySelector('[data-testid="MusicTrackRow_Title"]');
-                var artistEl   = row.querySelector('[data-testid="MusicTrackRow_Authors"]');
-                var durationEl = row.querySelector('[data-testid="MusicTrackRow_Duration"]');
-
-                var title    = titleEl    ? titleEl.innerText.trim()    : '';
-                var artist   = artistEl   ? artistEl.innerText.trim()   : '';
-                var duration = durationEl ? durationEl.innerText.trim() : '';
-
-                if (!title) continue;
-                results.push({ full_id: audioId, title: title, artist: artist, duration: duration });
-            } catch(e) {}
-        }
-        return JSON.stringify(results);
-    """
-
-    def _extract_tracks_via_js(self) -> list[tuple]:
-        """
-        Извлекает треки из нового интерфейса ВК через JS (React Fiber + MobX Map).
-        Возвращает список кортежей в том же формате, что и _parse_search_results.
-        """
-        try:
-            raw_json = self.driver.execute_script(self._JS_EXTRACT_TRACKS)
-            if not raw_json:
-                return []
-            raw = json.loads(raw_json)
-        except Exception as e:
-            log_message(f"ERROR _extract_tracks_via_js: {e}")
-            return []
-
-        results = []
-        seen = set()
-        for t in raw:
-            full_id      = t.get("full_id", "").strip()
-            title        = t.get("title", "").strip()
-            artist       = t.get("artist", "").strip()
-            duration_str = t.get("duration", "").strip()
-
-            if not title or not full_id:
-                continue
-            if full_id in seen:
-                continue
-            seen.add(full_id)
-
-            # owner_display из full_id (формат: owner_id_audio_id)
-            try:
-                oid = int(full_id.split("_")[0])
-                owner_display = f"club{abs(oid)}" if oid < 0 else (f"id{oid}" if oid else full_id)
-            except (ValueError, IndexError):
-                owner_display = full_id
-
-            results.append((
-                (artist or "Неизвестный")[:80],
-                title[:120],
-                duration_str[:10],
-                owner_display[:32],
-                "",        # url — получаем при скачивании через клик
-                full_id,
-            ))
-        return results
-
-    def _click_show_all_button(self):
-        """Нажимает кнопку 'Показать все/всё' на странице плейлиста, если она есть."""
-        try:
-            clicked = self.driver.execute_script("""
-                var texts = ['Показать все', 'Показать всё', 'Show all', 'show all'];
-                // Ищем по тексту среди кнопок и ссылок
-                var candidates = Array.from(
-                    document.querySelectorAll('button, a, span, div[role="button"]')
-                );
-                for (var i = 0; i < candidates.length; i++) {
-                    var el = candidates[i];
-                    var t = (el.innerText || el.textContent || '').trim();
-                    for (var j = 0; j < texts.length; j++) {
-                        if (t === texts[j] || t.startsWith(texts[j])) {
-                            el.click();
-                            return t;
-                        }
-                    }
-                }
-                return null;
-            """)
-            if clicked:
-                log_message(f"INFO: нажата кнопка '{clicked}', ждём загрузки всех треков...")
-                time.sleep(2)
-            else:
-                log_message("INFO: кнопка 'Показать все' не найдена")
-        except Exception as e:
-            log_message(f"WARNING: _click_show_all_button: {e}")
-
-    def _scroll_and_extract_playlist(self, count: int) -> list[tuple]:
-        """
-        Скроллит страницу плейлиста и извлекает треки через JS (новый интерфейс ВК).
-        При необходимости падает обратно на BeautifulSoup (_scroll_and_parse_audio).
-        """
-        limit = count if count > 0 else None
-
-
-        results = self._extract_tracks_via_js()
-        log_message(f"INFO: JS-извлечение (первичное): {len(results)} треков")
-
-        # Если JS не дал ничего — значит старый интерфейс, используем BeautifulSoup
-        if not results:
-            log_message("INFO: JS-извлечение пустое, пробую _scroll_and_parse_audio")
-            return self._scroll_and_parse_audio(count)
-
-        if limit and len(results) >= limit:
-            return results[:limit]
+            self._set_status("Ищу музыку в ВК...")
+        self._run_job(
+            self.engine.search(query, count, tag=generation), generation,
+            self._show_results, "Ошибка при поиске: {}",
+        )
 
-        # Скроллим для подгрузки следующих треков
-        scroll_pause = 1.5
-        max_scrolls = 30
+    def _requested_count(self) -> int:
+        """Кол-во треков из поля ввода: 0 — "загрузить всё, что получится", не больше 500."""
         try:
-            last_height = self.driver.execute_script("return document.body.scrollHeight")
-        except Exception:
-            last_height = None
+            count = int((self.count_edit.text() or "").strip())
+        except ValueError:
+            count = 30
+        return min(max(count, 0), 500)
 
-        for i in range(max_scrolls):
-            self._set_search_status(
-                f"Загружаю треки... ({len(results)}/{limit if limit else '∞'})"
+    def _start_batch(self):
+        """Читает файл с запросами/ссылками (по одному в строке) и запускает пакет."""
+        if self.engine.driver is None and self.engine.wait_for_session(0):
+            QMessageBox.warning(
+                self.search_window,
+                "Нет браузера",
+                "Браузер ВК не запущен. Подожди, пока откроется и залогинься."
             )
-            try:
-                self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            except Exception:
-                break
-            time.sleep(scroll_pause)
-
-            results = self._extract_tracks_via_js()
-            log_message(f"INFO: JS-извлечение после скролла #{i + 1}: {len(results)} треков")
-
-            if limit and len(results) >= limit:
-                break
-
-            try:
-                new_height = self.driver.execute_script("return document.body.scrollHeight")
-            except Exception:
-                break
-            if last_height is not None and new_height == last_height:
-                log_message("INFO: страница больше не растёт, прекращаю скролл")
-                break
-            last_height = new_height
-
-        if limit:
-            results = results[:limit]
-        return results
+            return
 
-    def _load_profile_music_worker(self, profile_id: str, count: int):
-        """
-        Загружает музыку с профиля пользователя или группы.
-        """
+        path, _ = QFileDialog.getOpenFileName(
+            self.search_window, "Файл с запросами", "", "Текст (*.txt);;Все файлы (*)"
+        )
+        if not path:
+            return
         try:
-            # Сначала переходим на страницу профиля, чтобы получить числовой ID
-            profile_url = f"https://vk.com/{profile_id}"
-            log_message(f"DEBUG: открываю профиль: {profile_url}")
-            self.driver.get(profile_url)
-            time.sleep(2)
-
-            # Пытаемся получить числовой ID из страницы
-            numeric_id = None
-
-            # Способ 1: из URL (если редирект на id123 или club123)
-            current_url = self.driver.current_url
-            log_message(f"DEBUG: текущий URL: {current_url}")
-
-            # Проверяем id пользователя
-            id_match = re.search(r'vk\.com/id(\d+)', current_url)
-            if id_match:
-                numeric_id = id_match.group(1)
-                log_message(f"DEBUG: найден user ID в URL: {numeric_id}")
-
-            # Проверяем club/public
-            club_match = re.search(r'vk\.com/(club|public)(\d+)', current_url)
-            if club_match:
-                numeric_id = f"-{club_match.group(2)}"  # Группы с минусом
-                log_message(f"DEBUG: найден group ID в URL: {numeric_id}")
-
-            # Способ 2: ищем ID в HTML странице
-            if not numeric_id:
-                try:
-                    # Ищем в data-атрибутах или скриптах
-                    page_source = self.driver.page_source
-
-                    # Ищем паттерн "oid":123456 или "owner_id":123456
-                    oid_match = re.search(r'"(?:oid|owner_id)"\s*:\s*(-?\d+)', page_source)
-                    if oid_match:
-                        numeric_id = oid_match.group(1)
-                        log_message(f"DEBUG: найден ID в HTML: {numeric_id}")
-                except Exception as e:
-                    log_message(f"WARNING: ошибка при поиске ID в HTML: {e}")
-
-            # Способ 3: пробуем перейти напрямую на страницу аудио с коротким именем
-            if not numeric_id:
-                log_message(f"DEBUG: ID не найден, пробуем audios с коротким именем")
-                numeric_id = profile_id
-
-            # Формируем URL страницы аудио
-            audio_url = f"https://vk.com/audios{numeric_id}"
-            log_message(f"DEBUG: открываю аудио: {audio_url}")
-            self._set_search_status(f"Открываю аудиозаписи...")
-
-            self.driver.get(audio_url)
-
-            # Ждём загрузки аудио
-            try:
-                WebDriverWait(self.driver, 10).until(
-                    EC.presence_of_element_located((By.CLASS_NAME, "audio_row"))
-                )
-            except Exception as e:
-                log_message(f"WARNING: не дождались audio_row: {e}")
-                # Возможно, аудио скрыты или их нет
-                self._set_search_status("Аудиозаписи недоступны или скрыты")
-                if self.btn_search:
-                    self._call_in_main.emit(lambda: self.btn_search.setEnabled(True))
-                return
-
-            # Скроллим и собираем треки (используем существующий метод)
-            self._set_search_status("Загружаю треки...")
-            results = self._scroll_and_parse_audio(count)
+            with open(path, "r", encoding="utf-8-sig") as f:
+                lines = [line.strip() for line in f]
+        except OSError as e:
+            QMessageBox.critical(self.search_window, "Ошибка", f"Не удалось прочитать файл:\n{e}")
+            return
+        # Пустые строки и комментарии (#) пропускаем, повторы тоже
+        lines = list(dict.fromkeys(line for line in lines if line and not line.startswith("#")))
+        if not lines:
+            QMessageBox.warning(self.search_window, "Пустой файл", "В файле нет запросов.")
+            return
 
-            # Отображаем результаты
-            self._update_results(results)
+        count = self._requested_count()
 
-        except Exception as e:
-            log_message(f"ERROR _load_profile_music_worker: {e}")
-            self._set_search_status(f"Ошибка: {e}")
-        finally:
-            if self.btn_search:
-                self._call_in_main.emit(lambda: self.btn_search.setEnabled(True))
+        if self.filter_edit:
+            self.filter_edit.clear()
+        self.track_model.clear()
+        self._search_generation += 1
+        generation = self._search_generation
 
-    def _scroll_and_parse_audio(self, count: int) -> list:
+        if self.btn_search:
+            self.btn_search.setEnabled(False)
+        if self.btn_batch:
+            self.btn_batch.setEnabled(False)
+
+        async def batch():
+            """
+            Пакетный поиск: каждая строка — запрос, плейлист или профиль.
+            Треки строк приходят событиями "item" и сливаются в таблицу без повторов.
+            В конце — отчёт <файл>.results.json, пропускная способность и задержки.
+            """
+            result = await self.engine.search_many(lines, count, tag=generation)
+            self.engine.write_batch_report(path, result)
+
+        self._set_status(f"Пакет: {len(lines)} строк...")
+        self._run_job(batch(), generation, lambda result: None, "Ошибка пакета: {}")
+
+    def _show_results(self, results):
         """
-        Скроллит страницу и собирает аудиозаписи.
-        Используется для загрузки музыки с профиля/группы.
+        Завершает поиск: дописывает то, что не пришло событиями "tracks",
+        и показывает итог. Уже показанные строки (и выделение) не трогаются.
         """
-        limit = count if count > 0 else None
-
-        # Первичный парсинг
-        html = self.driver.page_source
-        results = self._parse_search_results(html, limit)
-        log_message(f"INFO: после первой загрузки треков: {len(results)}")
-
-        need_more = True if limit is None else (len(results) < limit)
-
-        if need_more:
-            scroll_pause = 1.5
-            max_scrolls = 20  # Больше скроллов для профилей с большой библиотекой
-
-            try:
-                last_height = self.driver.execute_script("return document.body.scrollHeight")
-            except Exception as e:
-                log_message(f"WARNING: не удалось получить scrollHeight: {e}")
-                last_height = None
-
-            for i in range(max_scrolls):
-                self._set_search_status(
-                    f"Загружаю треки... ({len(results)}/{limit if limit is not None else '∞'})"
-                )
-                log_message(f"DEBUG: скролл #{i + 1}")
-
-                try:
-                    self.driver.execute_script(
-                        "window.scrollTo(0, document.body.scrollHeight);"
-                    )
-                except Exception as e:
-                    log_message(f"WARNING: ошибка при scrollTo: {e}")
-                    break
-
-                time.sleep(scroll_pause)
-
-                html = self.driver.page_source
-                results = self._parse_search_results(html, limit)
-                log_message(f"INFO: после скролла #{i + 1} треков: {len(results)}")
-
-                if limit is not None and len(results) >= limit:
-                    log_message("INFO: набрали запрошенное количество, прекращаю скролл")
-                    break
-
-                try:
-                    new_height = self.driver.execute_script("return document.body.scrollHeight")
-                except Exception as e:
-                    log_message(f"WARNING: не удалось получить новый scrollHeight: {e}")
-                    break
+        if self.search_window is None or self.tree is None:
+            return
+        self.track_model.append(results)
 
-                if last_height is not None and new_height == last_height:
-                    log_message("INFO: высота страницы больше не растёт, прекращаю скролл")
-                    break
+        if self.track_model.rowCount():
+            self._show_found()
+            self._prefetch_top_rows()
+        else:
+            self.search_status_label.setText("Ничего не найдено")
 
-                last_height = new_height
+    def _show_found(self):
+        cached = " (из кэша)" if self._results_source == "cache" else ""
+        self.search_status_label.setText(f"Найдено треков: {self.track_model.rowCount()}{cached}")
 
-        return results
+    # --------------------------------------------------
+    # ВСПОМОГАТЕЛЬНЫЕ МЕТОДЫ
+    # --------------------------------------------------
 
-    def _search_worker(self, query: str, count: int):
+    def _on_engine_event(self, event: dict):
         """
-        1) Открываем /audio?q=...&section=search
-        2) Ищем ссылку 'Показать все' с section=recoms_block
-        3) Кликаем
-        4) Скроллим и парсим data-audio
+        События движка (в главном потоке) → таблица, строка статуса,
+        прогресс-бар и индикатор пакета.
         """
-        try:
-            base_url = f"https://vk.com/audio?q={quote_plus(query)}&section=search"
-            log_message(f"DEBUG: открываю базовый поиск: {base_url}")
-            self.driver.get(base_url)
-
-            try:
-                WebDriverWait(self.driver, 10).until(
-                    EC.presence_of_element_located((By.CLASS_NAME, "audio_row"))
+        if self.search_window is None:
+            return
+        kind = event["type"]
+        if kind == "tracks":
+            # Треки по мере загрузки: порядок — порядок прихода, повторы
+            # по full_id отбрасывает модель, треки прежних поисков — тоже
+            if event["tag"] == self._search_generation:
+                self.track_model.append(event["tracks"])
+        elif kind == "item":
+            if event["tag"] == self._search_generation:
+                self.track_model.append(event["report"]["tracks"])
+        elif kind == "results":
+            if event["tag"] == self._search_generation:
+                self._results_source = event["source"]
+                # События из потоков движка и итог поиска могут прийти в любом порядке
+                if event["source"] == "cache" and self.track_model.rowCount():
+                    self._show_found()
+        elif kind == "session":
+            if event.get("reason"):
+                self._show_info(
+                    "Вход в ВК потерян, пакет на паузе.\n"
+                    "Войди заново в открытом окне браузера — пакет продолжится сам."
                 )
-            except Exception as e:
-                log_message(f"WARNING: не дождались audio_row на базовом поиске: {e}")
-
-            show_all_link = None
-            try:
-                links = self.driver.find_elements(By.CSS_SELECTOR, "a[href*='section=recoms_block']")
-                log_message(f"DEBUG: найдено ссылок section=recoms_block: {len(links)}")
-                for idx, l in enumerate(links):
-                    try:
-                        log_message(
-                            f"DEBUG: link[{idx}] href={l.get_attribute('href')} "
-                            f"text={l.text!r}"
-                        )
-                    except Exception:
-                        pass
-                if links:
-                    link_with_text = None
-                    for l in links:
-                        try:
-                            if "Показать все" in (l.text or ""):
-                                link_with_text = l
-                                break
-                        except Exception:
-                            continue
-                    show_all_link = link_with_text or links[0]
-                    log_message(
-                        "INFO: выбрана ссылка recoms_block: "
-                        f"{show_all_link.get_attribute('href')}"
-                    )
-                else:
-                    log_message(
-                        "INFO: ссылка section=recoms_block не найдена, "
-                        "останемся на странице поиска"
-                    )
-            except Exception as e:
-                log_message(f"WARNING: ошибка при поиске ссылки recoms_block: {e}")
-
-            if show_all_link is not None:
-                self._set_search_status("Открываю страницу «Показать всё»...")
-                try:
-                    self.driver.execute_script("arguments[0].click();", show_all_link)
-                except Exception as e:
-                    log_message(f"WARNING: не удалось кликнуть по recoms_block: {e}")
-
-                try:
-                    WebDriverWait(self.driver, 10).until(
-                        lambda d: "section=recoms_block" in d.current_url
-                    )
-                    log_message(f"INFO: текущий URL после клика: {self.driver.current_url}")
-                except Exception as e:
-                    log_message(f"WARNING: не дождались section=recoms_block в URL: {e}")
-
-                try:
-                    WebDriverWait(self.driver, 10).until(
-                        EC.presence_of_element_located((By.CLASS_NAME, "audio_row"))
-                    )
-                except Exception as e:
-                    log_message(f"WARNING: не дождались audio_row на recoms_block: {e}")
-            else:
-                self._set_search_status(
-                    "Работаю с основной страницей поиска (recoms_block не найден)."
+        elif kind == "status":
+            self._set_status(event["text"])
+        elif kind == "progress_start":
+            self._show_progress(event["batch"])
+        elif kind == "progress_end":
+            self._hide_progress()
+        elif kind == "progress":
+            if self.progress_bar:
+                self.progress_bar.setValue(int(event["percent"]))
+            if self.speed_label:
+                self.speed_label.setText(event["speed"])
+            # batch обновляем только если явно передан (не None)
+            if self.batch_progress_label and event["batch"] is not None:
+                self.batch_progress_label.setText(event["batch"])
+        elif kind == "download":
+            # Пакетное скачивание: общий процент по числу треков и ETA
+            if self.progress_bar:
+                self.progress_bar.setValue(int(event["done"] * 100 / event["total"]))
+            if self.batch_progress_label:
+                self.batch_progress_label.setText(
+                    f"[{event['done']}/{event['total']}] ~{self._format_seconds(event['eta'])}"
                 )
 
-            # Используем тот же метод, что работает для плейлистов/профилей:
-            # сначала пробуем JS (новый интерфейс ВК), потом BeautifulSoup (старый)
-            results = self._scroll_and_extract_playlist(count)
-            log_message(f"INFO: итого треков после поиска: {len(results)}")
-            self._update_results(results)
-
-        except Exception as e:
-            log_message(f"ERROR: ошибка при поиске ВК: {e}")
-            self._set_search_status(f"Ошибка при поиске: {e}")
-
-        finally:
-            if self.btn_search and self.search_window is not None:
-                self._call_in_main.emit(lambda: self.btn_search.setEnabled(True))
-
-    # --------------------------------------------------
-    # ПАРСИНГ data-audio
-    # --------------------------------------------------
+    def _set_status(self, text: str):
+        if self.search_status_label:
+            self.search_status_label.setText(text)
+
+    def _show_progress(self, batch: bool = False):
+        """Начало скачивания: показать прогресс (batch — с индикатором пакета)."""
+        if batch and self.batch_progress_label:
+            self.batch_progress_label.setVisible(True)
+        if self.speed_label:
+            self.speed_label.setVisible(True)
+        if self.progress_bar:
+            self.progress_bar.setVisible(True)
+
+    def _hide_progress(self):
+        if self.progress_bar:
+            self.progress_bar.setVisible(False)
+            self.progress_bar.setValue(0)
+        if self.speed_label:
+            self.speed_label.setVisible(False)
+            self.speed_label.setText("")
+        if self.batch_progress_label:
+            self.batch_progress_label.setVisible(False)
+            self.batch_progress_label.setText("")
 
     @staticmethod
-    def _parse_search_results(html: str, max_count: int | None):
-        results = []
-        if not html or len(html) < 100:
-            return results
-
-        soup = BeautifulSoup(html, "html.parser")
-        rows = soup.find_all(
-            "div",
-            class_=lambda c: c and "audio_row" in c
-        )
-
-        log_message(f"INFO: найдено блоков audio_row: {len(rows)}")
-
-        seen_ids = set()
-
-        for row in rows:
-            try:
-
-                               # --- НОВАЯ ПРОВЕРКА НА НЕДОСТУПНОСТЬ ---
-                # Проверяем, есть ли у ряда или его дочерних элементов признак недоступности
-                # Примеры классов, которые могут указывать на недоступность (нужно проверить на практике)
-                unavailable_indicators = [
-                    'audio_claimed',   # Пример: класс на родительском div
-                ]
-
-                is_unavailable = False
-                # Проверяем сам элемент row
-                row_classes = row.get('class', [])
-                if any(indicator in row_classes for indicator in unavailable_indicators):
-                    is_unavailable = True
-
-                # Проверяем дочерние элементы (например, название или обложку)
-                if not is_unavailable:
-                    for child in row.find_all():
-                        child_classes = child.get('class', [])
-                        if any(indicator in child_classes for indicator in unavailable_indicators):
-                            is_unavailable = True
-                            break
-
-                # Если трек недоступен, пропускаем его
-                if is_unavailable:
-                    log_message(f"DEBUG: пропущен недоступный трек по классу/атрибуту")
-                    continue
-                # --- КОНЕЦ НОВОЙ ПРОВЕРКИ ---
-
-                data_attr = row.get("data-audio")
-                if not data_attr:
-                    continue
-
-                try:
-                    data = json.loads(data_attr)
-                except Exception as e:
-                    log_message(f"DEBUG: не смог распарсить data-audio: {e}")
-                    continue
-
-                if len(data) < 6:
-                    continue
-
-                audio_id = str(data[0])
-                owner_id = str(data[1])
-                link = str(data[2]) if len(data) > 2 else ""
-                if len(results) < 5:
-                    log_message(f"DEBUG audio link raw: {link[:120]}")
-                title_html = data[3] or ""
-                artist_html = data[4] or ""
-                duration_val = data[5] or 0
-
-                # иногда вместо ссылки приходит специальный маркер
-                if "audio_api_unavailable" in link:
-                    continue
-
-                title = BeautifulSoup(
-                    str(title_html), "html.parser"
-                ).get_text(strip=True)
-                artist = BeautifulSoup(
-                    str(artist_html), "html.parser"
-                ).get_text(strip=True)
-
-                if not title:
-                    continue
-
-                if "аудио доступно на vk.com" in title.lower():
-                    continue
-
-                try:
-                    total_sec = int(duration_val)
-                except Exception:
-                    total_sec = 0
-
-                if total_sec <= 0:
-                    continue
-
-                minutes = total_sec // 60
-                seconds = total_sec % 60
-                duration_str = f"{minutes}:{seconds:02d}"
-
-                full_id = f"{owner_id}_{audio_id}"
-                if full_id in seen_ids:
-                    continue
-                seen_ids.add(full_id)
-
-                # человекочитаемый owner
-                try:
-                    owner_int = int(owner_id)
-                except ValueError:
-                    owner_int = 0
-
-                if owner_int < 0:
-                    owner_display = f"club{abs(owner_int)}"
-                else:
-                    owner_display = f"id{owner_int}" if owner_int != 0 else owner_id
-
-                results.append((
-                    (artist or "Неизвестный")[:80],
-                    title[:120],
-                    duration_str[:10],
-                    owner_display[:32],
-                    link,
-                    full_id,  # owner_id_audio_id для yt-dlp
-                ))
-
-                if max_count is not None and max_count > 0 and len(results) >= max_count:
-                    break
-
-            except Exception as e:
-                log_message(f"DEBUG: ошибка парсинга audio_row: {e}")
-                continue
-
-        return results
-
-    def _update_results(self, results):
-        if self.search_window is None or self.tree is None:
-            return
-
-        def _do():
-            self.tree.setRowCount(0)
-            for row in results:
-                if len(row) >= 6:
-                    artist, title, duration, owner, url, audio_full_id = row[:6]
-                elif len(row) >= 5:
-                    artist, title, duration, owner, url = row[:5]
-                    audio_full_id = ""
-                elif len(row) == 4:
-                    artist, title, duration, owner = row
-                    url = ""
-                    audio_full_id = ""
-                elif len(row) == 3:
-                    artist, title, duration = row
-                    owner = ""
-                    url = ""
-                    audio_full_id = ""
-                else:
-                    continue
-                r = self.tree.rowCount()
-                self.tree.insertRow(r)
-                for col, val in enumerate([artist, title, duration, owner, url, audio_full_id]):
-                    item = QTableWidgetItem(str(val or ""))
-                    item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsEnabled)
-                    self.tree.setItem(r, col, item)
-
-            count = self.tree.rowCount()
-            if count:
-                self.search_status_label.setText(f"Найдено треков: {count}")
-            else:
-                self.search_status_label.setText("Ничего не найдено")
-
-        self._call_in_main.emit(_do)
-
-    # --------------------------------------------------
-    # ВСПОМОГАТЕЛЬНЫЕ МЕТОДЫ
-    # --------------------------------------------------
+    def _format_seconds(seconds: float) -> str:
+        """Форматирует секунды в строку MM:SS или HH:MM:SS."""
+        seconds = int(seconds)
+        if seconds < 0:
+            return "00:00"
+        hours = seconds // 3600
+        minutes = (seconds % 3600) // 60
+        secs = seconds % 60
+        if hours > 0:
+            return f"{hours:02d}:{minutes:02d}:{secs:02d}"
+        else:
+            return f"{minutes:02d}:{secs:02d}"
 
-    def _show_error_async(self, text: str):
-        def _do():
-            QMessageBox.critical(self.search_window, "Ошибка", text)
-        self._call_in_main.emit(_do)
+    def _show_error(self, text: str):
+        QMessageBox.critical(self.search_window, "Ошибка", text)
 
-    def _show_info_async(self, text: str):
-        def _do():
-            QMessageBox.information(self.search_window, "Информация", text)
-        self._call_in_main.emit(_do)
+    def _show_info(self, text: str):
+        QMessageBox.information(self.search_window, "Информация", text)
 
 
 # ------------------------------------------------------